@@ -43,7 +43,8 @@ setup(name='yard',
           ]
       },
       extras_require={
-          "plotting": ["matplotlib >= 0.99"]
+          "plotting": ["matplotlib >= 0.99"],
+          "numpy": ["numpy >= 1.17"]
       },
       classifiers=['Development Status :: 3 - Alpha',
                    'Environment :: Console',
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import unittest
+
+from yard.curve import CROCCurve, PrecisionRecallCurve, ROCCurve
+from yard.data import ColumnarBinaryClassifierData
+from yard.mathematics import numpy
+
+if numpy is not None:
+    import yard.bootstrap
+    from yard.bootstrap import bootstrap_aucs, confidence_intervals, \
+            percentile_interval
+
+
+@unittest.skipIf(numpy is None, "test requires NumPy")
+class BootstrapTest(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(42)
+        labels = rng.rand(500) < 0.3
+        scores = numpy.round(rng.rand(500) + labels * 0.3, 2)
+        self.data = ColumnarBinaryClassifierData.from_arrays(scores, labels)
+        self.curve_classes = [ROCCurve, CROCCurve, PrecisionRecallCurve]
+
+    def test_bootstrap_aucs(self):
+        for method in ("multinomial", "poisson"):
+            aucs = bootstrap_aucs(self.data, self.curve_classes,
+                                  num_replicates=400, method=method, seed=42)
+            self.assertEqual(len(aucs), 3)
+            for curve_class, values in zip(self.curve_classes, aucs):
+                self.assertEqual(len(values), 400)
+                expected = curve_class(self.data).auc()
+                self.assertAlmostEqual(values.mean(), expected, delta=0.01)
+                self.assertTrue(0.005 < values.std() < 0.05)
+
+        self.assertRaises(ValueError, bootstrap_aucs, self.data,
+                          [ROCCurve], method="jackknife")
+        data = ColumnarBinaryClassifierData.from_arrays([0.1, 0.2], [1, 1])
+        self.assertRaises(ValueError, bootstrap_aucs, data, [ROCCurve])
+
+    def test_parallel(self):
+        batch_elements = yard.bootstrap.BATCH_ELEMENTS
+        yard.bootstrap.BATCH_ELEMENTS = 2000
+        try:
+            results = [bootstrap_aucs(self.data, self.curve_classes,
+                                      num_replicates=250, seed=3, jobs=jobs)
+                       for jobs in (1, 2)]
+        finally:
+            yard.bootstrap.BATCH_ELEMENTS = batch_elements
+        for expected, observed in zip(*results):
+            self.assertEqual(list(expected), list(observed))
+
+    def test_confidence_intervals(self):
+        intervals = confidence_intervals(self.data, self.curve_classes,
+                                         level=0.9, num_replicates=300,
+                                         seed=1)
+        for curve_class, (auc, lower, upper) in zip(self.curve_classes,
+                                                    intervals):
+            self.assertAlmostEqual(auc, curve_class(self.data).auc(), 10)
+            self.assertTrue(lower < auc < upper)
+            self.assertTrue(upper - lower < 0.2)
+
+        data = ColumnarBinaryClassifierData.from_arrays([0.1, 0.2, 0.3, 0.4],
+                                                        [0, 0, 1, 1])
+        self.assertEqual(confidence_intervals(data, [ROCCurve], seed=1),
+                         [(1., 1., 1.)])
+        self.assertEqual(percentile_interval([0., 1., float("nan")], 0.5),
+                         (0.25, 0.75))
+        self.assertRaises(ValueError, percentile_interval, [0.], 1.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
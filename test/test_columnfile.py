@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from yard.columnfile import detect_format, read_columns, write_columns
+from yard.mathematics import numpy
+from yard.scripts import CommandLineAppForClassifierData
+
+
+@unittest.skipIf(numpy is None, "test requires NumPy")
+class ColumnFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.columns = [numpy.array([1., -1., 1., -1.]),
+                        numpy.array([0.9, 0.1, 0.5, 0.7]),
+                        numpy.array([0.2, 0.4, 0.6, 0.8])]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def path(self, name):
+        return os.path.join(self.tmpdir, name)
+
+    def check_columns(self, columns):
+        self.assertEqual([list(column) for column in columns],
+                         [list(column) for column in self.columns])
+
+    def test_yard_format(self):
+        write_columns(self.path("test.bin"), ["class", "A", "B"],
+                      self.columns, metadata={"answer": 42})
+        self.assertEqual(detect_format(self.path("test.bin")), "yard")
+        names, columns, metadata = read_columns(self.path("test.bin"))
+        self.assertEqual(names, ["class", "A", "B"])
+        self.assertEqual(metadata, {"answer": 42})
+        self.assertTrue(isinstance(columns[0], numpy.memmap))
+        self.check_columns(columns)
+
+        names, columns, _ = read_columns(self.path("test.bin"), [2, 0])
+        self.assertEqual(names, ["B", "class"])
+        self.assertEqual(list(columns[0]), list(self.columns[2]))
+        self.assertRaises(IndexError, read_columns, self.path("test.bin"), [3])
+
+    def test_numpy_formats(self):
+        numpy.save(self.path("test.npy"), numpy.column_stack(self.columns))
+        self.assertEqual(detect_format(self.path("test.npy")), "npy")
+        names, columns, _ = read_columns(self.path("test.npy"))
+        self.assertEqual(names, None)
+        self.check_columns(columns)
+
+        numpy.savez(self.path("test.npz"), c=self.columns[0],
+                    A=self.columns[1], B=self.columns[2])
+        self.assertEqual(detect_format(self.path("test.npz")), "npz")
+        names, columns, _ = read_columns(self.path("test.npz"))
+        self.assertEqual(names, ["c", "A", "B"])
+        self.check_columns(columns)
+        names, columns, _ = read_columns(self.path("test.npz"), [1])
+        self.assertEqual(names, ["A"])
+        self.assertEqual(list(columns[0]), list(self.columns[1]))
+        self.assertRaises(IndexError, read_columns, self.path("test.npz"), [3])
+
+    def test_text_file(self):
+        with open(self.path("test.txt"), "w") as handle:
+            handle.write("1 0.5\n")
+        self.assertEqual(detect_format(self.path("test.txt")), None)
+        self.assertRaises(ValueError, read_columns, self.path("test.txt"))
+
+    def run_app(self, *args):
+        app = CommandLineAppForClassifierData()
+        app.parser = app.create_parser()
+        app.add_parser_options()
+        app.options, app.args = app.parser.parse_args(list(args))
+        app.process_input_files()
+        return app
+
+    def test_sidecar_cache(self):
+        path = self.path("test.txt")
+        with open(path, "w") as handle:
+            handle.write("class A B\n")
+            for row in zip(*self.columns):
+                handle.write("%g %g %g\n" % row)
+
+        for _ in range(2):
+            app = self.run_app("-q", "--cache", path)
+            self.assertTrue(os.path.exists(path + ".yardcache"))
+            self.assertEqual(sorted(app.data.keys()), ["A", "B", "__class__"])
+            self.check_columns([app.data["__class__"], app.data["A"],
+                                app.data["B"]])
+        self.assertTrue(isinstance(app.data["A"], numpy.memmap))
+
+        # Different column selection invalidates the cache
+        app = self.run_app("-q", "--cache", "-c", "1,3", path)
+        self.assertEqual(sorted(app.data.keys()), ["B", "__class__"])
+        self.assertEqual(list(app.data["B"]), list(self.columns[2]))
+        self.assertEqual(app.create_dataset("B").total_positives, 2)
+
+    def test_sidecar_cache_unnamed_columns(self):
+        paths = [self.path("test.txt"), self.path("test2.txt")]
+        for path in paths:
+            with open(path, "w") as handle:
+                handle.write("class\t\tB\n")
+                for row in zip(*self.columns):
+                    handle.write("%g\t%g\t%g\n" % row)
+
+        # The unnamed column of the second file is named after the one of
+        # the first file here, but not when the second file is read alone
+        app = self.run_app("-q", "-f", "\t", "--cache", *paths)
+        self.assertEqual(sorted(app.data.keys()),
+                         ["B", "Dataset 1", "Dataset 2", "__class__"])
+        for args in (["--cache"], []):
+            app = self.run_app("-q", "-f", "\t", *(args + paths[1:]))
+            self.assertEqual(sorted(app.data.keys()),
+                             ["B", "Dataset 1", "__class__"])
+            self.assertEqual(list(app.data["Dataset 1"]),
+                             list(self.columns[1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,8 +4,12 @@ import unittest
 
 from textwrap import dedent
 
-from yard.data import BinaryClassifierData
-from yard.curve import Curve, ROCCurve
+from yard.data import AggregatedBinaryClassifierData, BinaryClassifierData, \
+        BinaryClassifierSketch, ColumnarBinaryClassifierData, \
+        MultiBinaryClassifierData
+from yard.curve import Curve, CurveBundle, CurveFactory, CROCCurve, \
+        PrecisionRecallCurve, ROCCurve
+from yard.mathematics import numpy
 
 
 class CurveTest(unittest.TestCase):
@@ -48,6 +52,28 @@ class ROCCurveTest(unittest.TestCase):
     def test_auc(self):
         self.assertAlmostEqual(0.95, self.curve.auc(), 8)
 
+    def test_auc_with_ties(self):
+        data = BinaryClassifierData([(0.1, 0), (0.2, 1), (0.2, 0), (0.2, 1),
+            (0.3, 1), (0.3, 1), (0.3, 0), (0.4, 0), (0.5, 1), (0.5, 1)])
+        for curve_class in (ROCCurve, CROCCurve):
+            curve = curve_class(data)
+            expected = curve.auc_from_pos_ranks(data.get_positive_ranks(),
+                                                len(data))
+            self.assertAlmostEqual(curve.auc(), expected, 8)
+        self.assertAlmostEqual(ROCCurve(data).auc(),
+                               Curve.auc(ROCCurve(data)), 8)
+
+    def test_lazy_points(self):
+        curve = ROCCurve(self.data)
+        self.assertTrue(curve._points is None)
+        self.assertAlmostEqual(0.95, curve.auc(), 8)
+        self.assertTrue(curve._points is None)
+        self.assertEqual(len(curve.points), 10)
+        curve.resample([0, 0.5, 1])
+        self.assertEqual([x for x, _ in curve.points], [0, 0.5, 1])
+        curve.data = self.data
+        self.assertEqual(len(curve.points), 10)
+
     def test_get_points(self):
         expected = reversed([(1.0, 1.0), (0.75, 1.0), (0.5, 1.0), (0.25, 1.0), \
                 (0.25, 0.8), (0.0, 0.8), (0.0, 0.6), (0.0, 0.4), \
@@ -56,6 +82,144 @@ class ROCCurveTest(unittest.TestCase):
             for x, y in zip(obs, exp):
                 self.assertAlmostEqual(x, y, 5)
 
+    def test_auc_terms_from_pos_ranks(self):
+        ranks = self.data.get_positive_ranks()
+        n = len(self.data)
+        candidates = [ranks]
+        if numpy is not None:
+            candidates.append(numpy.array(ranks))
+        for curve in (ROCCurve([]), CROCCurve([])):
+            for pos_ranks in candidates:
+                intercept, slope, terms = \
+                        curve.auc_terms_from_pos_ranks(pos_ranks, n)
+                self.assertEqual(len(terms), len(ranks))
+                self.assertAlmostEqual(intercept + slope * sum(terms),
+                                       curve.auc_from_pos_ranks(ranks, n), 10)
+
+
+@unittest.skipIf(numpy is None, "test requires NumPy")
+class AlternativeDataCurveTest(unittest.TestCase):
+    def setUp(self):
+        self.pairs = [(0.5, 0), (0.1, 0), (0.4, 1), (0.9, 1), (0.2, 0),
+                      (0.7, 1), (0.3, 0), (0.4, 1), (0.6, 1), (0.4, 0)]
+        self.reference = BinaryClassifierData(self.pairs)
+
+    def check_curves(self, data):
+        for name in CurveFactory.get_curve_names():
+            curve_class = CurveFactory.find_class_by_name(name)
+            expected = curve_class(self.reference)
+            curve = curve_class(data)
+            self.assertEqual(curve.points, expected.points)
+            self.assertAlmostEqual(curve.auc(), expected.auc(), 8)
+
+    def test_columnar_data(self):
+        self.check_curves(ColumnarBinaryClassifierData(self.pairs))
+
+    def test_aggregated_data(self):
+        self.check_curves(AggregatedBinaryClassifierData(self.pairs))
+
+    def test_weighted_aggregated_data(self):
+        scores, labels = zip(*self.pairs)
+        data = AggregatedBinaryClassifierData.from_arrays(scores, labels,
+                                                          weights=[3.0] * 10)
+        self.assertAlmostEqual(ROCCurve(data).auc(),
+                               ROCCurve(self.reference).auc(), 8)
+        self.assertAlmostEqual(CROCCurve(data).auc(),
+                               CROCCurve(self.reference).auc(), delta=0.05)
+        self.assertEqual(PrecisionRecallCurve(data).points,
+                         PrecisionRecallCurve(self.reference).points)
+
+    def test_sketch(self):
+        rng = numpy.random.RandomState(42)
+        labels = rng.rand(5000) < 0.3
+        scores = rng.rand(5000) * 0.7 + labels * 0.3
+        exact = ColumnarBinaryClassifierData.from_arrays(scores, labels)
+        sketch = BinaryClassifierSketch(bins=200)
+        sketch.update(scores, labels)
+        bound = sketch.auc_error_bound()
+        self.assertTrue(0 < bound < 0.01)
+        self.assertAlmostEqual(ROCCurve(sketch).auc(), ROCCurve(exact).auc(),
+                               delta=bound)
+        self.assertAlmostEqual(Curve.auc(ROCCurve(sketch)),
+                               ROCCurve(exact).auc(), delta=bound)
+        self.assertAlmostEqual(PrecisionRecallCurve(sketch).auc(),
+                               PrecisionRecallCurve(exact).auc(), delta=0.01)
+
+    def test_multi_data(self):
+        rng = numpy.random.RandomState(42)
+        labels = rng.rand(400) < 0.3
+        scores = numpy.round(rng.rand(6, 400) + labels * 0.3, 1)
+        data = MultiBinaryClassifierData(scores, labels)
+        for name in CurveFactory.get_curve_names():
+            curve_class = CurveFactory.find_class_by_name(name)
+            aucs = data.get_aucs(curve_class)
+            for idx, curve in enumerate(data.get_curves(curve_class)):
+                expected = curve_class(
+                    BinaryClassifierData(zip(scores[idx], labels)))
+                self.assertEqual(curve.points, expected.points)
+                self.assertAlmostEqual(aucs[idx], expected.auc(), 10)
+        self.assertRaises(ZeroDivisionError, ROCCurve.aucs_from_multi_data,
+                          MultiBinaryClassifierData(scores, labels & False))
+
+    def test_aucs_from_score_counts(self):
+        rng = numpy.random.RandomState(42)
+        scores = numpy.arange(20.)
+        pos_counts, neg_counts = rng.rand(2, 4, 20)
+        pos_counts[0] = numpy.round(pos_counts[0] * 3)
+        for name in CurveFactory.get_curve_names():
+            curve_class = CurveFactory.find_class_by_name(name)
+            aucs = curve_class.aucs_from_score_counts(pos_counts, neg_counts)
+            self.assertEqual(aucs.shape, (4, ))
+            for idx in range(4):
+                data = AggregatedBinaryClassifierData.from_counts(scores,
+                        pos_counts[idx], neg_counts[idx], presorted=True)
+                self.assertAlmostEqual(aucs[idx], curve_class(data).auc(), 10)
+        self.assertEqual(list(CROCCurve.aucs_from_score_counts(
+            pos_counts[:1], neg_counts[:1] * 0)), [1.])
+
+    def test_aucs_from_score_counts_with_ties(self):
+        rng = numpy.random.RandomState(42)
+        labels = rng.rand(500) < 0.4
+        data = BinaryClassifierData(zip(rng.randint(0, 20, 500), labels))
+        _, pos_counts, neg_counts = data.get_score_counts()
+        for curve_class in (ROCCurve, CROCCurve):
+            self.assertAlmostEqual(curve_class.aucs_from_score_counts(
+                pos_counts, neg_counts)[0], curve_class(data).auc(), 12)
+
+        # Integer counts as drawn by the bootstrap
+        scores = numpy.arange(20.)
+        pos_counts, neg_counts = rng.randint(0, 6, (2, 4, 20))
+        aucs = CROCCurve.aucs_from_score_counts(pos_counts, neg_counts,
+                                                alpha=3)
+        for idx in range(4):
+            data = AggregatedBinaryClassifierData.from_counts(scores,
+                    pos_counts[idx], neg_counts[idx], presorted=True)
+            self.assertAlmostEqual(aucs[idx], CROCCurve(data, alpha=3).auc(),
+                                   12)
+
+    def test_curve_bundle(self):
+        for aggregate in (True, False):
+            bundle = CurveBundle(self.pairs, aggregate=aggregate)
+            self.assertEqual(isinstance(bundle.data,
+                                        AggregatedBinaryClassifierData),
+                             aggregate)
+            self.check_curves_of_bundle(bundle)
+        self.assertNotEqual(bundle.get_curve(CROCCurve, alpha=3).auc(),
+                            bundle.get_curve(CROCCurve).auc())
+
+        curve = CurveBundle([]).get_curve(PrecisionRecallCurve)
+        self.assertEqual(curve.points, [])
+
+    def check_curves_of_bundle(self, bundle):
+        curve_classes = [CurveFactory.find_class_by_name(name)
+                         for name in CurveFactory.get_curve_names()]
+        for curve, curve_class in zip(bundle.get_curves(curve_classes),
+                                      curve_classes):
+            expected = curve_class(self.reference)
+            self.assertEqual(curve.points, expected.points)
+            self.assertAlmostEqual(curve.auc(), expected.auc(), 8)
+
+
 
 if __name__ == "__main__":
     runner = unittest.TextTestRunner(verbosity = 2)
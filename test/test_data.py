@@ -10,7 +10,11 @@ except:
 
 from textwrap import dedent
 
-from yard.data import BinaryConfusionMatrix, BinaryClassifierData
+from yard.data import AggregatedBinaryClassifierData, BinaryConfusionMatrix, \
+        BinaryConfusionMatrixArray, BinaryClassifierData, \
+        BinaryClassifierSketch, ColumnarBinaryClassifierData, \
+        MultiBinaryClassifierData
+from yard.mathematics import numpy
 
 class BinaryConfusionMatrixTest(unittest.TestCase):
     def setUp(self):
@@ -59,6 +63,51 @@ class BinaryConfusionMatrixTest(unittest.TestCase):
         self.assertEqual(str(self.matrices[4].odds_ratio()), "inf")
 
 
+class BinaryConfusionMatrixArrayTest(unittest.TestCase):
+    def setUp(self):
+        self.matrices = [\
+            BinaryConfusionMatrix(tp=63, fp=28, fn=37, tn=72),
+            BinaryConfusionMatrix(tp=77, fp=77, fn=23, tn=23),
+            BinaryConfusionMatrix(tp=24, fp=88, fn=76, tn=12),
+            BinaryConfusionMatrix(tp=100, fp=0, fn=0, tn=100),
+            BinaryConfusionMatrix(tp=0, fp=0, fn=5, tn=4),
+            BinaryConfusionMatrix(tp=0, fp=0, fn=0, tn=0)
+        ]
+        self.array = BinaryConfusionMatrixArray(
+            *[[getattr(matrix, attr) for matrix in self.matrices]
+              for attr in ("tp", "fp", "fn", "tn")])
+
+    def test_indexing(self):
+        self.assertEqual(len(self.array), len(self.matrices))
+        self.assertEqual(self.array[2], self.matrices[2])
+        self.assertEqual(list(self.array), self.matrices)
+
+    def test_metrics(self):
+        for name in ["accuracy", "error_rate", "fdn", "fdp", "fdr", "fnr",
+                     "fpr", "f_score", "mcc", "npv", "odds_ratio",
+                     "precision", "recall", "rnp", "rpp", "tnr", "tpr"]:
+            method = getattr(BinaryConfusionMatrix, name)
+            self.assertEqual(getattr(BinaryConfusionMatrixArray, name).__axis_label__,
+                             method.__axis_label__)
+            for matrix, value in zip(self.matrices,
+                                     getattr(self.array, name)()):
+                try:
+                    expected = method(matrix)
+                except ZeroDivisionError:
+                    expected = float("nan")
+                if expected != expected:
+                    self.assertTrue(value != value, name)
+                else:
+                    self.assertAlmostEqual(value, expected, 8, name)
+
+    def test_evaluate(self):
+        self.assertEqual(list(self.array.evaluate(BinaryConfusionMatrix.precision)),
+                         [m.precision() for m in self.matrices])
+        custom = lambda matrix: matrix.tp + matrix.fn
+        self.assertEqual(list(self.array.evaluate(custom)),
+                         [custom(m) for m in self.matrices])
+
+
 class BinaryClassifierDataTest(unittest.TestCase):
     def setUp(self):
         self.data = BinaryClassifierData([\
@@ -115,6 +164,267 @@ class BinaryClassifierDataTest(unittest.TestCase):
             self.assertEqual(repr(matrix), expected)
             self.assertEqual(matrix, self.data.get_confusion_matrix(threshold))
 
+    def test_get_score_counts(self):
+        data = BinaryClassifierData([(10, 0), (20, 1), (20, 0), (30, 0), (40, 1)])
+        scores, pos_counts, neg_counts = data.get_score_counts()
+        self.assertEqual(list(scores), [10, 20, 30, 40])
+        self.assertEqual(list(pos_counts), [0, 1, 0, 1])
+        self.assertEqual(list(neg_counts), [1, 1, 1, 0])
+
+    def test_get_confusion_table(self):
+        for thresholds in [None, 4, [0.45, 0.2, 0.2, 1.5]]:
+            expected = list(self.data.iter_confusion_matrices(thresholds))
+            table = self.data.get_confusion_table(thresholds)
+            self.assertEqual([t for t, _ in expected], list(table[0]))
+            self.assertEqual([mat.tp for _, mat in expected], list(table[1]))
+            self.assertEqual([mat.fp for _, mat in expected], list(table[2]))
+            self.assertEqual([mat.fn for _, mat in expected], list(table[3]))
+            self.assertEqual([mat.tn for _, mat in expected], list(table[4]))
+
+
+@unittest.skipIf(numpy is None, "test requires NumPy")
+class ColumnarBinaryClassifierDataTest(unittest.TestCase):
+    def setUp(self):
+        self.pairs = [(0.5, 0), (0.1, 0), (0.4, 1), (0.9, 1), (0.2, 0),
+                      (0.7, 1), (0.3, 0), (0.8, 1), (0.6, 1), (0.4, 0)]
+        self.reference = BinaryClassifierData(self.pairs)
+        self.data = ColumnarBinaryClassifierData(self.pairs)
+
+    def test_construction(self):
+        self.assertEqual(len(self.data), 10)
+        self.assertEqual(self.data.total_positives, 5)
+        self.assertEqual(self.data.total_negatives, 5)
+        self.assertEqual(sorted(self.data.data), self.reference.data)
+        self.assertEqual(self.data[3], (0.4, True))
+
+    def test_from_arrays(self):
+        scores = numpy.array([0.1, 0.2, 0.3, 0.4, 0.5])
+        labels = numpy.array([False, True, False, True, True])
+        data = ColumnarBinaryClassifierData.from_arrays(scores, labels,
+                                                        title="x")
+        self.assertTrue(numpy.shares_memory(data.scores, scores))
+        self.assertTrue(numpy.shares_memory(data.labels, labels))
+        self.assertEqual(data.title, "x")
+
+        from array import array
+        data = ColumnarBinaryClassifierData.from_arrays(
+            array("d", [0.3, 0.1, 0.2]), array("i", [1, -1, 0]))
+        self.assertEqual(data.data, [(0.1, False), (0.2, False), (0.3, True)])
+
+    def test_get_confusion_matrix(self):
+        for threshold in [0.0, 0.2, 0.4, 0.45, 0.75, 1.0]:
+            self.assertEqual(self.data.get_confusion_matrix(threshold),
+                             self.reference.get_confusion_matrix(threshold))
+
+    def test_iter_confusion_matrices(self):
+        for thresholds in [None, 4, [0.4, 0.2, 0.95]]:
+            for (t1, mat1), (t2, mat2) in izip_longest(
+                    self.data.iter_confusion_matrices(thresholds),
+                    self.reference.iter_confusion_matrices(thresholds)):
+                self.assertEqual(t1, t2)
+                self.assertEqual(mat1, mat2)
+
+    def test_get_score_counts(self):
+        expected = self.reference.get_score_counts()
+        for seq1, seq2 in zip(self.data.get_score_counts(), expected):
+            self.assertEqual(list(seq1), list(seq2))
+
+    def test_get_confusion_table(self):
+        for thresholds in [None, 4, [0.4, 0.2, 0.95]]:
+            expected = self.reference.get_confusion_table(thresholds)
+            for seq1, seq2 in zip(self.data.get_confusion_table(thresholds),
+                                  expected):
+                self.assertEqual(list(seq1), list(seq2))
+
+    def test_ranks(self):
+        self.assertEqual(list(self.data.get_positive_ranks()),
+                         list(self.reference.get_positive_ranks()))
+        self.assertEqual(list(self.data.get_negative_ranks()),
+                         list(self.reference.get_negative_ranks()))
+
+
+@unittest.skipIf(numpy is None, "test requires NumPy")
+class AggregatedBinaryClassifierDataTest(unittest.TestCase):
+    def setUp(self):
+        self.pairs = [(0.5, 0), (0.1, 0), (0.4, 1), (0.9, 1), (0.2, 0),
+                      (0.5, 1), (0.3, 0), (0.8, 1), (0.5, 1), (0.4, 0)]
+        self.reference = BinaryClassifierData(self.pairs)
+        self.data = AggregatedBinaryClassifierData(self.pairs)
+
+    def assertScoreCountsEqual(self, data, expected):
+        for seq1, seq2 in zip(data.get_score_counts(),
+                              expected.get_score_counts()):
+            self.assertEqual(list(seq1), list(seq2))
+
+    def test_construction(self):
+        self.assertEqual(len(self.data), 10)
+        self.assertEqual(len(self.data.scores), 7)
+        self.assertEqual(self.data.total_positives, 5)
+        self.assertEqual(self.data.total_negatives, 5)
+        self.assertEqual(self.data.data, self.reference.data)
+        self.assertEqual([self.data[i] for i in range(10)], self.reference.data)
+        self.assertScoreCountsEqual(self.data, self.reference)
+
+        scores, labels = zip(*self.pairs)
+        self.assertScoreCountsEqual(
+            AggregatedBinaryClassifierData.from_arrays(scores, labels),
+            self.reference)
+        self.assertScoreCountsEqual(
+            AggregatedBinaryClassifierData(self.reference), self.reference)
+
+    def test_from_counts(self):
+        data = AggregatedBinaryClassifierData.from_counts(
+            [0.5, 0.1, 0.5], [1, 0, 2], [0, 3, 1])
+        self.assertEqual(list(data.scores), [0.1, 0.5])
+        self.assertEqual(list(data.pos_counts), [0, 3])
+        self.assertEqual(list(data.neg_counts), [3, 1])
+
+    def test_merge(self):
+        shards = [AggregatedBinaryClassifierData(self.pairs[i::3])
+                  for i in range(3)]
+        merged = AggregatedBinaryClassifierData.merge(shards, title="all")
+        self.assertEqual(merged.title, "all")
+        self.assertScoreCountsEqual(merged, self.reference)
+
+    def test_get_confusion_matrix(self):
+        for threshold in [0.0, 0.2, 0.4, 0.45, 0.5, 0.75, 1.0]:
+            self.assertEqual(self.data.get_confusion_matrix(threshold),
+                             self.reference.get_confusion_matrix(threshold))
+        for thresholds in [None, 4, [0.4, 0.2, 0.95]]:
+            self.assertEqual(list(self.data.iter_confusion_matrices(thresholds)),
+                list(self.reference.iter_confusion_matrices(thresholds)))
+
+    def test_ranks(self):
+        self.assertEqual(list(self.data.get_positive_ranks()),
+                         list(self.reference.get_positive_ranks()))
+        self.assertEqual(list(self.data.get_negative_ranks()),
+                         list(self.reference.get_negative_ranks()))
+
+    def test_weights(self):
+        scores, labels = zip(*self.pairs)
+        data = AggregatedBinaryClassifierData.from_arrays(scores, labels,
+                                                          weights=[0.5] * 10)
+        self.assertAlmostEqual(data.total_positives, 2.5)
+        self.assertEqual(list(data.scores), list(self.data.scores))
+        self.assertEqual(list(data.pos_counts * 2), list(self.data.pos_counts))
+
+
+@unittest.skipIf(numpy is None, "test requires NumPy")
+class BinaryClassifierSketchTest(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(42)
+        self.labels = rng.rand(1000) < 0.3
+        self.scores = rng.rand(1000) * 0.8 + self.labels * 0.2
+
+    def test_add_and_update(self):
+        sketch1 = BinaryClassifierSketch(bins=100)
+        sketch1.update(self.scores, self.labels)
+        sketch2 = BinaryClassifierSketch(bins=100)
+        for score, label in zip(self.scores, self.labels):
+            sketch2.add(score, label)
+        self.assertEqual(len(sketch1), 1000)
+        self.assertEqual(sketch1.total_positives, self.labels.sum())
+
+        # Indexing must see the examples added after the previous lookup
+        sketch = BinaryClassifierSketch(bins=8, range=(0, 8))
+        sketch.update([2.5, 6.5], [1, 0])
+        self.assertEqual([sketch[0], sketch[1]], [(2., True), (6., False)])
+        sketch.add(0.5, 0)
+        self.assertEqual(sketch[0], (0., False))
+        self.assertEqual(sketch[-1], (6., False))
+        for seq1, seq2 in zip(sketch1.get_score_counts(),
+                              sketch2.get_score_counts()):
+            self.assertEqual(list(seq1), list(seq2))
+
+    def test_matches_binned_data(self):
+        sketch = BinaryClassifierSketch(bins=10, range=(0, 1))
+        sketch.update(self.scores, self.labels)
+        binned = numpy.floor(self.scores * 10) / 10.
+        expected = AggregatedBinaryClassifierData.from_arrays(binned,
+                                                              self.labels)
+        for seq1, seq2 in zip(sketch.get_score_counts(),
+                              expected.get_score_counts()):
+            self.assertTrue(numpy.allclose(seq1, seq2))
+        for threshold in [0.0, 0.3, 0.5, 0.9]:
+            self.assertEqual(sketch.get_confusion_matrix(threshold),
+                ColumnarBinaryClassifierData.from_arrays(self.scores,
+                    self.labels).get_confusion_matrix(threshold))
+
+    def test_merge(self):
+        parts = []
+        for i in range(3):
+            part = BinaryClassifierSketch(bins=50)
+            part.update(self.scores[i::3], self.labels[i::3])
+            parts.append(part)
+        whole = BinaryClassifierSketch(bins=50)
+        whole.update(self.scores, self.labels)
+        merged = BinaryClassifierSketch(bins=50).update_from(*parts)
+        self.assertEqual(list(merged.pos_counts), list(whole.pos_counts))
+        self.assertEqual(list(merged.neg_counts), list(whole.neg_counts))
+        self.assertRaises(ValueError, merged.update_from,
+                          BinaryClassifierSketch(bins=20))
+
+        merged = BinaryClassifierSketch.merge(parts, title="all")
+        self.assertTrue(isinstance(merged, BinaryClassifierSketch))
+        self.assertEqual(merged.title, "all")
+        self.assertEqual(list(merged.pos_counts), list(whole.pos_counts))
+        self.assertEqual(list(merged.neg_counts), list(whole.neg_counts))
+        self.assertRaises(ValueError, BinaryClassifierSketch.merge,
+                          [merged, BinaryClassifierSketch(bins=20)])
+
+
+
+@unittest.skipIf(numpy is None, "test requires NumPy")
+class MultiBinaryClassifierDataTest(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(42)
+        self.labels = (rng.rand(300) < 0.4).astype(int) * 2 - 1
+        self.scores = numpy.round(rng.rand(5, 300), 1)
+        self.data = MultiBinaryClassifierData(self.scores, self.labels,
+                                              titles=list("abcde"))
+        self.data.batch_size = 700
+
+    def test_datasets(self):
+        self.assertEqual(len(self.data), 5)
+        self.assertEqual(self.data.total_positives,
+                         int((self.labels > 0).sum()))
+        for idx, dataset in enumerate(self.data):
+            expected = ColumnarBinaryClassifierData.from_arrays(
+                    self.scores[idx], self.labels)
+            self.assertEqual(dataset.title, "abcde"[idx])
+            self.assertEqual(dataset.data, expected.data)
+
+    def test_from_columns(self):
+        data = MultiBinaryClassifierData.from_columns(list(self.scores),
+                                                      self.labels)
+        self.assertEqual(data.titles, [None] * 5)
+        self.assertTrue((data.scores == self.data.scores).all())
+        self.assertTrue((data.sorted_labels == self.data.sorted_labels).all())
+        self.assertRaises(ValueError, MultiBinaryClassifierData,
+                          self.scores, self.labels[:-1])
+        self.assertRaises(ValueError, MultiBinaryClassifierData.from_columns,
+                          [self.scores[0], self.scores[1][:-1]], self.labels)
+
+    def test_group_statistics(self):
+        num_rows = 0
+        for rows, labels, neg_below, group_pos, group_neg, offsets in \
+                self.data.iter_group_statistics():
+            for row in range(rows.start, rows.stop):
+                dataset = self.data[row]
+                _, pos_counts, neg_counts = dataset.get_score_counts()
+                idx = row - rows.start
+                starts = numpy.flatnonzero(numpy.r_[True,
+                    numpy.diff(dataset.scores) != 0])
+                self.assertEqual(list(group_pos[idx][starts]),
+                                 list(pos_counts))
+                self.assertEqual(list(group_neg[idx][starts]),
+                                 list(neg_counts))
+                self.assertEqual(list(neg_below[idx][starts]),
+                                 list(numpy.cumsum(neg_counts) - neg_counts))
+                self.assertTrue((offsets[idx][starts] == 0).all())
+                num_rows += 1
+        self.assertEqual(num_rows, 5)
+
 
 if __name__ == "__main__":
     runner = unittest.TextTestRunner(verbosity = 2)
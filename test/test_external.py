@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+import unittest
+
+from yard.curve import CROCCurve, PrecisionRecallCurve, ROCCurve
+from yard.data import ColumnarBinaryClassifierData
+from yard.mathematics import numpy
+
+if numpy is not None:
+    from yard.external import ExternalBinaryClassifierData
+
+
+@unittest.skipIf(numpy is None, "test requires NumPy")
+class ExternalBinaryClassifierDataTest(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(42)
+        self.labels = rng.rand(2000) < 0.3
+        self.scores = numpy.round(rng.rand(2000) * 0.8 + self.labels * 0.2, 2)
+        self.reference = ColumnarBinaryClassifierData.from_arrays(
+            self.scores, self.labels)
+
+    def check_data(self, data):
+        self.assertEqual(len(data), 2000)
+        self.assertEqual(data.total_positives, self.reference.total_positives)
+        for seq1, seq2 in zip(data.get_score_counts(),
+                              self.reference.get_score_counts()):
+            self.assertEqual(list(seq1), list(seq2))
+        for curve_class in (ROCCurve, CROCCurve):
+            self.assertAlmostEqual(curve_class(data).auc(),
+                                   curve_class(self.reference).auc(), 8)
+        self.assertEqual(PrecisionRecallCurve(data).points,
+                         PrecisionRecallCurve(self.reference).points)
+        for thresholds in (10, [0.25, 0.5, 0.505]):
+            for seq1, seq2 in zip(data.get_confusion_table(thresholds),
+                    self.reference.get_confusion_table(thresholds)):
+                self.assertEqual(list(seq1), list(seq2))
+        self.assertEqual(data.get_confusion_matrix(0.3),
+                         self.reference.get_confusion_matrix(0.3))
+        self.assertEqual(list(data.get_positive_ranks()),
+                         list(self.reference.get_positive_ranks()))
+
+    def test_add(self):
+        with ExternalBinaryClassifierData(chunk_size=300, block_size=17) as data:
+            for start in range(0, 2000, 150):
+                data.add(self.scores[start:start+150],
+                         self.labels[start:start+150])
+            self.check_data(data)
+            self.assertEqual(len(data._runs), 7)
+
+    def test_extend_in_parallel(self):
+        data = ExternalBinaryClassifierData(zip(self.scores, self.labels),
+                                            chunk_size=500, block_size=64,
+                                            processes=2)
+        self.check_data(data)
+        data.close()
+
+
+if __name__ == "__main__":
+    runner = unittest.TextTestRunner(verbosity = 2)
+    unittest.main(testRunner = runner)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+import unittest
+
+from yard.curve import CurveFactory, ROCCurve
+from yard.data import BinaryClassifierData
+from yard.mathematics import numpy
+from yard.parallel import calculate_aucs
+
+
+@unittest.skipIf(numpy is None, "test requires NumPy")
+class ParallelAUCTest(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(42)
+        self.labels = (rng.rand(300) < 0.4) * 2 - 1
+        self.scores = numpy.round(rng.rand(10, 300) + (self.labels > 0) * 0.2,
+                                  2)
+        self.curve_classes = [CurveFactory.find_class_by_name(name)
+                              for name in CurveFactory.get_curve_names()]
+
+    def test_serial(self):
+        aucs = calculate_aucs(self.scores, self.labels, self.curve_classes,
+                              jobs=1)
+        self.assertEqual(len(aucs), len(self.curve_classes))
+        for curve_class, curve_aucs in zip(self.curve_classes, aucs):
+            for row, auc in zip(self.scores, curve_aucs):
+                expected = curve_class(BinaryClassifierData(zip(row,
+                    self.labels > 0))).auc()
+                self.assertAlmostEqual(auc, expected, 10)
+
+    def test_parallel(self):
+        expected = calculate_aucs(self.scores, self.labels,
+                                  self.curve_classes, jobs=1)
+        for jobs in (2, 3):
+            aucs = calculate_aucs(list(self.scores), self.labels,
+                                  self.curve_classes, jobs=jobs)
+            for observed, curve_aucs in zip(aucs, expected):
+                self.assertEqual(list(observed), list(curve_aucs))
+
+        aucs = calculate_aucs(self.scores[:1], self.labels, [ROCCurve],
+                              jobs=4)
+        expected = expected[self.curve_classes.index(ROCCurve)]
+        self.assertEqual(list(aucs[0]), list(expected[:1]))
+
+    def test_unequal_lengths(self):
+        scores = [self.scores[0], self.scores[1][:150]]
+        for jobs in (1, 2):
+            self.assertRaises(ValueError, calculate_aucs, scores,
+                              self.labels, [ROCCurve], jobs=jobs)
+
+
+if __name__ == "__main__":
+    unittest.main()
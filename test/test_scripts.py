@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import sys
+import unittest
+
+from io import StringIO
+
+from yard.curve import ROCCurve
+from yard.mathematics import numpy
+from yard.scripts import CommandLineAppForClassifierData
+from yard.scripts.auc import AUCCalculatorApplication
+from yard.scripts.significance import SignificanceTestApplication
+
+
+class MismatchedColumnsTest(unittest.TestCase):
+    """Tests the handling of input files with different sets of columns."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.paths = [os.path.join(self.tmpdir, name)
+                      for name in ("f1.txt", "f2.txt")]
+        with open(self.paths[0], "w") as handle:
+            handle.write("class a b\n")
+            for idx in range(300):
+                handle.write("%d %d 0.5\n" % (idx % 2, idx % 2))
+        with open(self.paths[1], "w") as handle:
+            handle.write("class a\n")
+            for idx in range(200):
+                handle.write("%d %d\n" % (idx % 3 == 0, idx % 3 == 0))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_app(self, app, *args):
+        app.parser = app.create_parser()
+        app.add_parser_options()
+        app.options, app.args = app.parser.parse_args(list(args) +
+                                                      self.paths)
+        app.process_input_files()
+        return app
+
+    def test_create_dataset(self):
+        app = self.run_app(CommandLineAppForClassifierData(), "-q")
+        self.assertEqual(len(app.data["__class__"]), 500)
+        self.assertEqual(len(app.data["b"]), 300)
+
+        data = app.create_dataset("a")
+        self.assertEqual(len(data), 500)
+        self.assertAlmostEqual(ROCCurve(data).auc(), 1.0)
+        data = app.create_dataset("b")
+        self.assertEqual(len(data), 300)
+        self.assertEqual(data.total_positives, 150)
+        self.assertAlmostEqual(ROCCurve(data).auc(), 0.5)
+
+    @unittest.skipIf(numpy is None, "test requires NumPy")
+    def test_create_dataset_out_of_core(self):
+        for jobs in ("1", "2"):
+            app = self.run_app(CommandLineAppForClassifierData(), "-q",
+                               "--out-of-core", "--chunk-size", "100",
+                               "-j", jobs)
+            self.assertEqual(len(app.create_dataset("a")), 500)
+            data = app.create_dataset("b")
+            self.assertEqual(data.processes, int(jobs))
+            self.assertEqual(len(data), 300)
+            self.assertAlmostEqual(ROCCurve(data).auc(), 0.5)
+
+    def test_multi_dataset(self):
+        app = self.run_app(CommandLineAppForClassifierData(), "-q")
+        self.assertFalse(app.has_aligned_columns(["a", "b"]))
+        self.assertTrue(app.has_aligned_columns(["a"]))
+        self.assertEqual(app.create_multi_dataset(["a", "b"]), None)
+        bundles = app.create_curve_bundles(["a", "b"])
+        self.assertEqual([bundle.get_curve(ROCCurve).auc()
+                          for bundle in bundles], [1.0, 0.5])
+
+    @unittest.skipIf(sys.version_info[0] < 3, "test requires Python 3")
+    def test_auc_script(self):
+        for args in ([], ["-j", "2"]):
+            app = AUCCalculatorApplication()
+            stdout, sys.stdout = sys.stdout, StringIO()
+            try:
+                app.run(["-q"] + args + self.paths)
+                output = sys.stdout.getvalue()
+            finally:
+                sys.stdout = stdout
+            self.assertTrue("AUC[a] = 1.0000" in output)
+            self.assertTrue("AUC[b] = 0.5000" in output)
+
+    @unittest.skipIf(numpy is None or sys.version_info[0] < 3,
+                     "test requires NumPy and Python 3")
+    def test_delong_rejects_unpaired_predictions(self):
+        stderr, sys.stderr = sys.stderr, StringIO()
+        try:
+            for args in (["--out-of-core"], []):
+                app = SignificanceTestApplication()
+                self.assertRaises(SystemExit, app.run,
+                                  ["-q", "-m", "delong"] + args + self.paths)
+            message = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertTrue("--out-of-core" in message)
+        self.assertTrue("column b" in message)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+import pickle
+import unittest
+
+from multiprocessing import Pool
+
+from yard.curve import ROCCurve
+from yard.data import AggregatedBinaryClassifierData, BinaryClassifierData, \
+        ColumnarBinaryClassifierData
+from yard.mathematics import numpy
+
+try:
+    from yard.external import ExternalBinaryClassifierData
+    from yard.sharedmem import SharedArrays, SharedDataset, shared_memory
+except ImportError:
+    shared_memory = None
+
+
+def _get_auc(shared):
+    try:
+        data = shared.dataset
+        return ROCCurve(data).auc(), data.scores.flags.owndata
+    finally:
+        del data
+        shared.close()
+
+
+@unittest.skipIf(numpy is None or shared_memory is None,
+                 "test requires NumPy and multiprocessing.shared_memory")
+class SharedMemoryTest(unittest.TestCase):
+    def setUp(self):
+        self.pairs = [(0.5, 0), (0.1, 0), (0.4, 1), (0.9, 1), (0.2, 0),
+                      (0.7, 1), (0.3, 0), (0.4, 1), (0.6, 1), (0.4, 0)]
+
+    def test_shared_arrays(self):
+        with SharedArrays.create([("a", numpy.arange(5.)),
+                                  ("b", numpy.eye(3, dtype=bool))],
+                                 metadata="test") as shared:
+            self.assertTrue(shared.owner)
+            self.assertEqual(shared.keys, ["a", "b"])
+            copy = pickle.loads(pickle.dumps(shared))
+            self.assertFalse(copy.owner)
+            self.assertEqual(copy.metadata, "test")
+            self.assertEqual(copy["a"].tolist(), [0., 1., 2., 3., 4.])
+            copy["b"][0, 1] = True
+            self.assertTrue(shared["b"][0, 1])
+            copy.close()
+        self.assertRaises(OSError, SharedArrays(shared.descriptor).__getitem__,
+                          "a")
+
+    def test_datasets(self):
+        reference = ROCCurve(BinaryClassifierData(self.pairs)).auc()
+        datasets = [BinaryClassifierData(self.pairs, title="plain"),
+                    ColumnarBinaryClassifierData(self.pairs),
+                    AggregatedBinaryClassifierData(self.pairs),
+                    ExternalBinaryClassifierData(self.pairs, chunk_size=3)]
+        for data in datasets:
+            shared = data.to_shared_memory()
+            try:
+                attached = pickle.loads(pickle.dumps(shared))
+                copy = attached.dataset
+                self.assertEqual(copy.title, data.title)
+                self.assertEqual(list(copy.get_score_counts()[0]),
+                                 list(data.get_score_counts()[0]))
+                self.assertAlmostEqual(ROCCurve(copy).auc(), reference, 10)
+                del copy
+                attached.close()
+            finally:
+                shared.close()
+
+    def test_unknown_type(self):
+        class Dataset(object):
+            title = None
+
+            @property
+            def data(self):
+                return []
+
+        self.assertRaises(TypeError, SharedDataset.from_dataset, Dataset())
+        self.assertRaises(TypeError, SharedDataset.from_dataset, self.pairs)
+
+    def test_pool(self):
+        data = ColumnarBinaryClassifierData(self.pairs)
+        pool = Pool(2)
+        try:
+            with data.to_shared_memory() as shared:
+                results = pool.map(_get_auc, [shared] * 3)
+        finally:
+            pool.terminate()
+            pool.join()
+        self.assertEqual(results, [(ROCCurve(data).auc(), False)] * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
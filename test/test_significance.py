@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+
+import math
+import unittest
+import warnings
+
+from itertools import product
+
+from yard.curve import CROCCurve, ROCCurve
+from yard.data import BinaryClassifierData
+from yard.mathematics import numpy
+from yard import significance
+from yard.significance import DeLongTest, PairedPermutationTest
+
+
+class PairedPermutationTestTest(unittest.TestCase):
+    def setUp(self):
+        labels = [1, 0, 1, 1, 0, 0, 1, 0, 1, 1, 0, 1, 0, 0, 1, 0, 1, 0, 1, 0]
+        scores1 = [0.9, 0.1, 0.8, 0.35, 0.4, 0.2, 0.7, 0.5, 0.45, 0.6,
+                   0.3, 0.65, 0.25, 0.15, 0.55, 0.05, 0.85, 0.75, 0.95, 0.0]
+        scores2 = [0.5, 0.3, 0.4, 0.6, 0.2, 0.7, 0.3, 0.1, 0.8, 0.35,
+                   0.45, 0.25, 0.65, 0.55, 0.15, 0.05, 0.75, 0.85, 0.9, 0.5]
+        self.data1 = BinaryClassifierData(zip(scores1, labels))
+        self.data2 = BinaryClassifierData(zip(scores2, labels))
+
+    def get_exact_p_value(self, curve):
+        """Enumerates all the flip configurations of the pairs of positive
+        ranks."""
+        n = len(self.data1)
+        ranks1 = self.data1.get_positive_ranks()
+        ranks2 = self.data2.get_positive_ranks()
+        observed = abs(curve.auc_from_pos_ranks(ranks1, n) -
+                       curve.auc_from_pos_ranks(ranks2, n))
+        num_success, num_configs = 0, 0
+        for flips in product((False, True), repeat=len(ranks1)):
+            r1 = [b if flip else a for a, b, flip in zip(ranks1, ranks2, flips)]
+            r2 = [a if flip else b for a, b, flip in zip(ranks1, ranks2, flips)]
+            diff = abs(curve.auc_from_pos_ranks(r1, n) -
+                       curve.auc_from_pos_ranks(r2, n))
+            num_success += diff >= observed - 1e-12
+            num_configs += 1
+        return num_success / float(num_configs)
+
+    @unittest.skipIf(numpy is None, "test requires NumPy")
+    def test_batched(self):
+        for curve_class in (ROCCurve, CROCCurve):
+            curve = curve_class([])
+            test = PairedPermutationTest(curve_class, num_repetitions=20000,
+                                         seed=42)
+            diff, p_value = test.test(self.data1, self.data2)
+            self.assertAlmostEqual(diff, curve_class(self.data1).auc() -
+                                   curve_class(self.data2).auc(), 10)
+            self.assertAlmostEqual(p_value, self.get_exact_p_value(curve),
+                                   delta=0.02)
+            self.assertEqual(test.test(self.data1, self.data2)[1], p_value)
+            self.assertEqual([type(diff), type(p_value)], [float, float])
+
+        test.chunk_size = 5
+        self.assertEqual(test.test(self.data1, self.data1), (0., 1.))
+
+    @unittest.skipIf(numpy is None, "test requires NumPy")
+    def test_pairs(self):
+        datasets = [self.data1, self.data2, self.data1]
+        results = []
+        for jobs in (1, 2):
+            test = PairedPermutationTest(num_repetitions=2500, seed=3,
+                                         jobs=jobs)
+            results.append(test.test_pairs(datasets))
+        self.assertEqual(len(test._get_rounds()[0]), 10)
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(len(results[0]), 3)
+        self.assertEqual(results[0][1], (0., 1.))
+        self.assertAlmostEqual(results[0][0][0], -results[0][2][0], 10)
+        self.assertEqual(results[0][0], test.test(self.data1, self.data2))
+        self.assertRaises(ValueError, test.test_pairs,
+                          [self.data1, BinaryClassifierData([(0.5, 1)])])
+
+    def test_all_pairs(self):
+        datasets = [self.data1, self.data2, self.data1]
+        results = []
+        for jobs in (1, 2):
+            test = PairedPermutationTest(CROCCurve, num_repetitions=2500,
+                                         seed=3, jobs=jobs)
+            results.append(test.test_all_pairs(datasets))
+        self.assertEqual(results[0], results[1])
+
+        self.assertEqual([test.repetitions_used[i][i] for i in range(3)],
+                         [0] * 3)
+
+        diffs, p_values = results[0]
+        expected = test.test_pairs(datasets)
+        for idx, (i, j) in enumerate([(0, 1), (0, 2), (1, 2)]):
+            self.assertAlmostEqual(diffs[i][j], expected[idx][0], 10)
+            self.assertAlmostEqual(diffs[j][i], -expected[idx][0], 10)
+            self.assertEqual(p_values[i][j], p_values[j][i])
+            self.assertAlmostEqual(p_values[i][j], expected[idx][1],
+                                   delta=0.05)
+        self.assertEqual([diffs[i][i] for i in range(3)], [0.] * 3)
+        self.assertEqual([p_values[i][i] for i in range(3)], [1.] * 3)
+        self.assertEqual(p_values[0][1], p_values[1][2])
+        self.assertEqual(p_values[0][2], 1.)
+
+    @unittest.skipIf(numpy is None, "test requires NumPy")
+    def test_all_pairs_chunks(self):
+        num_tasks = []
+
+        def run_tasks(func, tasks, jobs, pool=None):
+            num_tasks.append(len(tasks))
+            return original(func, tasks, jobs, pool)
+
+        datasets = [self.data1, self.data2, self.data1]
+        original, significance.run_tasks = significance.run_tasks, run_tasks
+        try:
+            results = [PairedPermutationTest(num_repetitions=1000, seed=3,
+                                             jobs=jobs).test_all_pairs(datasets)
+                       for jobs in (1, 3)]
+        finally:
+            significance.run_tasks = original
+        self.assertEqual(num_tasks, [1, 3])
+        self.assertEqual(results[0], results[1])
+
+    @unittest.skipIf(numpy is None, "test requires NumPy")
+    def test_adaptive_chunks(self):
+        calls = []
+
+        def run_tasks(func, tasks, jobs, pool=None):
+            calls.append((len(tasks), pool))
+            return original(func, tasks, jobs, pool)
+
+        datasets = [self.data1, self.data2, self.data1]
+        original, significance.run_tasks = significance.run_tasks, run_tasks
+        try:
+            results = []
+            for jobs in (1, 3):
+                test = PairedPermutationTest(num_repetitions=2000, seed=3,
+                                             jobs=jobs, adaptive=True)
+                # Never stop early, so that all the rounds are run
+                test.z_score = 1e6
+                results.append(test.test_all_pairs(datasets))
+        finally:
+            significance.run_tasks = original
+        self.assertEqual(results[0], results[1])
+        self.assertEqual([num for num, _ in calls],
+                         [1] * 6 + [1, 1, 1, 2, 3, 1])
+        self.assertEqual(set(pool for _, pool in calls[:6]), set([None]))
+        self.assertEqual(len(set(pool for _, pool in calls[6:])), 1)
+        self.assertTrue(calls[6][1] is not None)
+
+    def test_adaptive(self):
+        test = PairedPermutationTest(num_repetitions=5000, seed=5,
+                                     adaptive=True)
+        self.assertEqual(test._get_round_sizes()[:4], [64, 128, 256, 512])
+        self.assertEqual(sum(test._get_round_sizes()), 5000)
+        self.assertEqual([len(chunks) for chunks in test._get_rounds()],
+                         [1, 1, 1, 2, 4, 8, 4])
+        self.assertTrue(test._is_decided(0, 1000))
+        self.assertTrue(test._is_decided(64, 64))
+        self.assertFalse(test._is_decided(50, 1000))
+        self.assertFalse(test._is_decided(0, 64))
+
+        datasets = [self.data1, self.data2, self.data1]
+        results = test.test_pairs(datasets)
+        self.assertEqual(results[1], (0., 1.))
+        self.assertEqual(test.repetitions_used[1], 64)
+        for used in test.repetitions_used:
+            self.assertTrue(64 <= used <= 5000)
+
+        diffs, p_values = test.test_all_pairs(datasets)
+        self.assertEqual(p_values[0][2], 1.)
+        self.assertEqual(test.repetitions_used[0][2], 64)
+        self.assertEqual(test.repetitions_used[0][1],
+                         test.repetitions_used[1][0])
+
+        test.adaptive = False
+        test.test_pairs(datasets)
+        self.assertEqual(test.repetitions_used, [5000] * 3)
+
+    @unittest.skipIf(numpy is None, "test requires NumPy")
+    def test_exact(self):
+        datasets = [self.data1, self.data2, self.data1]
+        test = PairedPermutationTest(num_repetitions=2000, seed=1, exact=True)
+        expected = self.get_exact_p_value(ROCCurve([]))
+        diff, p_value = test.test(self.data1, self.data2)
+        self.assertAlmostEqual(p_value, expected, 12)
+        self.assertEqual(test.repetitions_used, [0])
+
+        diffs, p_values = test.test_all_pairs(datasets)
+        self.assertAlmostEqual(p_values[0][1], expected, 12)
+        self.assertEqual(p_values[0][2], 1.)
+        self.assertEqual(test.repetitions_used, [[0] * 3] * 3)
+
+        test.max_exact_states = 10
+        p_value = test.test(self.data1, self.data2)[1]
+        self.assertEqual(test.repetitions_used, [2000])
+        self.assertAlmostEqual(p_value, expected, delta=0.05)
+
+        test.max_exact_states = PairedPermutationTest.max_exact_states
+        test.max_exact_values = 10
+        p_value = test.test(self.data1, self.data2)[1]
+        self.assertEqual(test.repetitions_used, [2000])
+        self.assertAlmostEqual(p_value, expected, delta=0.05)
+        del test.max_exact_values
+        self.assertAlmostEqual(test.test(self.data1, self.data2)[1],
+                               expected, 12)
+
+        test = PairedPermutationTest(CROCCurve, num_repetitions=2000,
+                                     exact=True)
+        p_values = test.test_all_pairs(datasets)[1]
+        self.assertEqual(test.repetitions_used[0][1], 2000)
+        self.assertEqual(test.repetitions_used[0][2], 0)
+        self.assertEqual(p_values[0][2], 1.)
+
+        test.adaptive = True
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            p_values = test.test_all_pairs(datasets)[1]
+        self.assertEqual(test.repetitions_used[0][2], 0)
+        self.assertEqual(p_values[0][2], 1.)
+
+        test.num_repetitions = 0
+        self.assertRaises(ValueError, test.test_all_pairs, datasets)
+        self.assertRaises(ValueError, test.test_pairs, datasets)
+
+    def test_sequential(self):
+        test = PairedPermutationTest(num_repetitions=500, seed=42)
+        for curve in (ROCCurve([]), CROCCurve([])):
+            results = [method(curve, list(self.data1.get_positive_ranks()),
+                              list(self.data2.get_positive_ranks()), 20)
+                       for method in (test._test_sequential,
+                                      test._test_sequential_ranks)]
+            self.assertAlmostEqual(results[0][0], results[1][0], 10)
+            self.assertEqual(results[0][1:], results[1][1:])
+            self.assertTrue(0 < results[0][1] < 1)
+            self.assertEqual(results[0][2], 500)
+
+        test.adaptive = True
+        data = [self.data1.get_positive_ranks()] * 2
+        for method in (test._test_sequential, test._test_sequential_ranks):
+            self.assertEqual(method(ROCCurve([]), list(data[0]),
+                                    list(data[1]), 20), (0., 1., 64))
+
+    def test_without_random_generators(self):
+        # NumPy versions before 1.17 fall back to the sequential engines
+        original = significance.has_random_generators
+        significance.has_random_generators = False
+        try:
+            test = PairedPermutationTest(num_repetitions=500, seed=42)
+            diff, p_value = test.test(self.data1, self.data2)
+            p_values = test.test_all_pairs([self.data1, self.data2])[1]
+        finally:
+            significance.has_random_generators = original
+        self.assertTrue(0 < p_value < 1)
+        self.assertEqual(test.repetitions_used, [[0, 500], [500, 0]])
+        self.assertEqual(p_values[0][1], p_value)
+
+
+@unittest.skipIf(numpy is None, "test requires NumPy")
+class DeLongTestTest(unittest.TestCase):
+    def setUp(self):
+        self.labels = [1, 0, 1, 1, 0, 0, 1, 0, 1, 1, 0, 1, 0, 0]
+        self.scores = [[0.9, 0.1, 0.8, 0.3, 0.4, 0.2, 0.7, 0.5, 0.4, 0.6,
+                        0.3, 0.6, 0.2, 0.1],
+                       [0.5, 0.3, 0.4, 0.6, 0.2, 0.7, 0.3, 0.1, 0.8, 0.3,
+                        0.4, 0.2, 0.6, 0.5],
+                       [0.2, 0.8, 0.3, 0.9, 0.1, 0.4, 0.5, 0.6, 0.7, 0.3,
+                        0.2, 0.1, 0.9, 0.4]]
+
+    def get_placements(self, row):
+        """Calculates the placement values by comparing all the pairs of
+        positive and negative examples."""
+        pos = [score for score, label in zip(row, self.labels) if label]
+        neg = [score for score, label in zip(row, self.labels) if not label]
+        compare = lambda a, b: (a > b) + 0.5 * (a == b)
+        return ([sum(compare(x, y) for y in neg) / float(len(neg))
+                 for x in pos],
+                [sum(compare(x, y) for x in pos) / float(len(pos))
+                 for y in neg])
+
+    def test_covariance(self):
+        aucs, covariance = DeLongTest().covariance(self.scores, self.labels)
+        placements = [self.get_placements(row) for row in self.scores]
+        expected = numpy.cov([pos for pos, _ in placements]) / 7. + \
+                   numpy.cov([neg for _, neg in placements]) / 7.
+        for idx, row in enumerate(self.scores):
+            data = BinaryClassifierData(zip(row, self.labels))
+            self.assertAlmostEqual(aucs[idx], ROCCurve(data).auc(), 10)
+        self.assertTrue(numpy.allclose(covariance, expected))
+
+    def test_scores(self):
+        test = DeLongTest()
+        diffs, variances, p_values = test.test_scores(self.scores,
+                                                      self.labels)
+        _, covariance = test.covariance(self.scores, self.labels)
+        self.assertAlmostEqual(variances[0][1], covariance[0, 0] +
+                               covariance[1, 1] - 2 * covariance[0, 1], 10)
+        self.assertAlmostEqual(diffs[0][1], -diffs[1][0], 10)
+        self.assertEqual(p_values[0][1], p_values[1][0])
+        self.assertEqual(p_values[2][2], 1.)
+        self.assertTrue(p_values[0][2] < 0.05 < p_values[0][1] < 1)
+
+    def test_unpaired(self):
+        test = DeLongTest()
+        datasets = [BinaryClassifierData(zip(row, self.labels))
+                    for row in self.scores]
+        diff, p_value = test.test(datasets[0], datasets[2])
+        _, covariance = test.covariance(self.scores, self.labels)
+        z = diff / (covariance[0, 0] + covariance[2, 2]) ** 0.5
+        self.assertAlmostEqual(diff, ROCCurve(datasets[0]).auc() -
+                               ROCCurve(datasets[2]).auc(), 10)
+        self.assertAlmostEqual(p_value, math.erfc(abs(z) / 2 ** 0.5), 10)
+        self.assertRaises(ValueError, test.test, datasets[0],
+                          BinaryClassifierData([(0.5, 1), (0.5, 0)]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from io import BytesIO, StringIO
+
+from yard.scripts import CommandLineAppForClassifierData
+from yard.tabular import BackgroundReader, TabularReader, detect_compression, \
+        iter_blocks, open_input, read_range, split_file
+
+
+class TabularReaderTest(unittest.TestCase):
+    def read(self, text, block_size=7, **kwds):
+        reader = TabularReader(block_size=block_size, **kwds)
+        blocks = list(reader.read(BytesIO(text.encode("utf-8"))))
+        columns = [[] for _ in reader.cols or []]
+        for block in blocks:
+            for column, part in zip(columns, block):
+                column.extend(float(value) for value in part)
+        return reader, columns
+
+    def test_iter_blocks(self):
+        text = b"1 2\n3 4\n\n5 6"
+        for block_size in (1, 3, 5, 100):
+            blocks = list(iter_blocks(BytesIO(text), block_size))
+            self.assertEqual(b"".join(blocks), text)
+            for block in blocks[:-1]:
+                self.assertTrue(block.endswith(b"\n"))
+        self.assertEqual(list(iter_blocks(StringIO(u"1 2\n"), 100)),
+                         [b"1 2\n"])
+
+    def test_without_header(self):
+        reader, columns = self.read("\n1 0.5 0.2\n-1 0.25 0.4\n\n1 0.75 0.6\n")
+        self.assertFalse(reader.has_header)
+        self.assertEqual(reader.headers, ["__class__", "Dataset 1",
+                                          "Dataset 2"])
+        self.assertEqual(columns, [[1, -1, 1], [0.5, 0.25, 0.75],
+                                   [0.2, 0.4, 0.6]])
+
+    def test_with_header(self):
+        reader, columns = self.read("class,A,,B\n1,0.5,3,0.2\n-1,0.25,4,0.4\n",
+                                    sep=",")
+        self.assertTrue(reader.has_header)
+        self.assertEqual(reader.headers, ["__class__", "A", "", "B"])
+        self.assertEqual(columns[3], [0.2, 0.4])
+
+    def test_columns(self):
+        text = "A\tclass\tB\n0.5\t1\t0.2\n0.25\t-1\t0.4\n"
+        reader, columns = self.read(text, sep="\t", cols=[1, 2, 0])
+        self.assertEqual(reader.headers, ["__class__", "B", "A"])
+        self.assertEqual(columns, [[1, -1], [0.2, 0.4], [0.5, 0.25]])
+
+        reader, columns = self.read(text.split("\n", 1)[1], cols=[1, 0])
+        self.assertEqual(reader.headers, ["__class__", "Dataset 1"])
+        self.assertEqual(columns, [[1, -1], [0.5, 0.25]])
+
+    def test_projection(self):
+        rows = ["%d %s" % (idx % 2, " ".join(["0.%d" % idx] * 20))
+                for idx in range(10)]
+        reader, columns = self.read("\n".join(rows), block_size=100,
+                                    cols=[0, 2])
+        self.assertTrue(reader.project)
+        self.assertEqual(columns[1], [float("0.%d" % idx) for idx in range(10)])
+
+        reader, columns = self.read("\n".join(rows).replace(" ", ","),
+                                    block_size=100, cols=[0, 1], sep=",")
+        self.assertTrue(reader.project)
+        self.assertEqual(columns[0], [idx % 2 for idx in range(10)])
+
+        reader, columns = self.read("\n".join(rows), cols=[0, 20])
+        self.assertFalse(reader.project)
+        self.assertEqual(len(columns[1]), 10)
+
+    def test_ragged_rows(self):
+        reader, columns = self.read("1 0.5\n-1 0.25 7 8\n 1   0.125 \n",
+                                    block_size=100)
+        self.assertEqual(columns, [[1, -1, 1], [0.5, 0.25, 0.125]])
+        self.assertRaises(IndexError, self.read, "1 0.5\n-1\n")
+        self.assertRaises(ValueError, self.read, "1 0.5\n-1 x\n")
+
+
+
+class ParallelReadTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "test.txt")
+        with open(self.path, "w") as handle:
+            handle.write("\n\nclass\t\tA\n")
+            for idx in range(100):
+                handle.write("%d\t%d\t0.%d\n" % (idx % 2, idx, idx))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_split_file(self):
+        reader = TabularReader(sep="\t")
+        ranges = split_file(self.path, reader, 7, min_size=10)
+        self.assertEqual(len(ranges), 7)
+        self.assertEqual(reader.headers, ["__class__", "", "A"])
+
+        values = []
+        with open(self.path, "rb") as handle:
+            for start, end in ranges:
+                handle.seek(start - 1)
+                self.assertEqual(handle.read(1), b"\n")
+                columns = read_range(self.path, start, end, reader.sep,
+                                     reader.cols, reader.headers)
+                values.extend(float(value) for value in columns[1])
+        self.assertEqual(values, list(range(100)))
+
+        ranges = split_file(self.path, TabularReader(), 7)
+        self.assertEqual(len(ranges), 1)
+
+    def compress(self, module_name):
+        module = __import__(module_name)
+        path = self.path + "." + module_name
+        with open(self.path, "rb") as source:
+            with module.open(path, "wb") as target:
+                target.write(source.read())
+        return path
+
+    def test_compressed_input(self):
+        with open(self.path, "rb") as handle:
+            expected = handle.read()
+        for module_name in ("gzip", "bz2"):
+            path = self.compress(module_name)
+            with open(path, "rb") as handle:
+                self.assertEqual(detect_compression(handle.read(6)),
+                                 module_name)
+            with open_input(path, 100) as handle:
+                self.assertTrue(isinstance(handle, BackgroundReader))
+                self.assertEqual(handle.read(3), expected[:3])
+                self.assertEqual(handle.read(), expected[3:])
+                self.assertEqual(handle.read(), b"")
+
+            reader = TabularReader(sep="\t")
+            ranges = split_file(path, reader, 4, min_size=10)
+            self.assertEqual(ranges, [(expected.index(b"0\t0"), None)])
+            columns = read_range(path, ranges[0][0], None, reader.sep,
+                                 reader.cols, reader.headers)
+            self.assertEqual([float(value) for value in columns[1]],
+                             list(range(100)))
+
+        with open_input(self.path) as handle:
+            self.assertFalse(isinstance(handle, BackgroundReader))
+
+    def run_app(self, *args):
+        app = CommandLineAppForClassifierData()
+        app.min_range_size = 100
+        app.parser = app.create_parser()
+        app.add_parser_options()
+        app.options, app.args = app.parser.parse_args(list(args))
+        app.process_input_files()
+        return app
+
+    def test_parallel_ingestion(self):
+        expected = self.run_app("-q", "-f", "\\t", self.path, self.path)
+        observed = self.run_app("-q", "-f", "\\t", "-j", "3",
+                                self.path, self.path)
+        self.assertEqual(sorted(expected.data.keys()),
+                         ["A", "Dataset 1", "Dataset 2", "__class__"])
+        self.assertEqual(sorted(observed.data.keys()),
+                         sorted(expected.data.keys()))
+        for key in expected.data:
+            self.assertEqual(list(observed.data[key]),
+                             list(expected.data[key]))
+        self.assertEqual(len(observed.data["A"]), 200)
+
+        for jobs in ("1", "3"):
+            observed = self.run_app("-q", "-f", "\\t", "-j", jobs,
+                                    self.compress("gzip"), self.path)
+            for key in expected.data:
+                self.assertEqual(list(observed.data[key]),
+                                 list(expected.data[key]))
+
+
+if __name__ == "__main__":
+    unittest.main()
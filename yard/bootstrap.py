@@ -0,0 +1,165 @@
+"""
+Bootstrap confidence intervals for the AUCs of binary classifier curves.
+
+The replicates of the dataset are drawn by resampling the positive and the
+negative examples separately (stratified bootstrap), so each replicate has
+the same class sizes as the original dataset (in expectation only if the
+Poisson bootstrap is used). A replicate is represented by the weight of each
+example, i.e., the number of times the example was drawn; since the order
+of the examples does not depend on the weights, the dataset is sorted only
+once, and the replicates are evaluated from the total weights of the
+positive and negative examples having each distinct predicted value.
+These weights can be drawn for a whole batch of replicates at once, and
+the AUCs of the batch are then calculated with array operations (see
+`BinaryClassifierPerformanceCurve.aucs_from_score_counts()`).
+
+The batches of replicates can be evaluated by a pool of worker processes;
+each batch draws its weights from an independent random stream derived from
+the seed and the index of the batch, so the results do not depend on the
+number of worker processes.
+
+This module requires NumPy.
+"""
+
+import multiprocessing
+
+from yard.curve import CurveBundle
+from yard.mathematics import numpy, require_random_generators
+from yard.parallel import run_tasks
+from yard.sharedmem import SharedArrays, shared_memory
+
+try:
+    xrange
+except NameError:
+    xrange = range
+
+__author__  = "Tamas Nepusz"
+__email__   = "tamas@cs.rhul.ac.uk"
+__copyright__ = "Copyright (c) 2010, Tamas Nepusz"
+__license__ = "MIT"
+
+__all__ = ["bootstrap_aucs", "confidence_intervals", "percentile_interval"]
+
+#: Maximum number of elements in the arrays of weights of a batch of
+#: replicates (the number of replicates times the number of distinct
+#: predicted values)
+BATCH_ELEMENTS = 2 ** 22
+
+
+def bootstrap_aucs(data, curve_classes, num_replicates=1000,
+                   method="multinomial", seed=None, jobs=1):
+    """Calculates the AUCs of the curves of the given classes for bootstrap
+    replicates of a dataset.
+
+    `data` must be an instance of `yard.data.BinaryClassifierData` (or any
+    of its variants) with integer example counts. `curve_classes` is a list
+    of subclasses of `BinaryClassifierPerformanceCurve`. `method` is
+    ``multinomial`` to draw exactly as many positive and negative examples
+    as there are in `data` (the classical bootstrap), or ``poisson`` to give
+    each example an independent weight from the Poisson distribution with
+    mean 1, which is cheaper for datasets with many distinct predicted
+    values. `seed` is used to seed the random number generators, and `jobs`
+    is the number of worker processes to use; ``None`` means one for each
+    CPU.
+
+    Returns a list containing a NumPy array for each curve class, with the
+    AUCs of the replicates. The AUC of a Poisson replicate without positive
+    or negative examples may be ``nan``.
+    """
+    require_random_generators("Bootstrapping")
+    if method not in ("multinomial", "poisson"):
+        raise ValueError("unknown bootstrap method: %r" % method)
+
+    _, pos_counts, neg_counts = data.get_score_counts()
+    counts = numpy.vstack([numpy.asarray(pos_counts, dtype=numpy.float64),
+                           numpy.asarray(neg_counts, dtype=numpy.float64)])
+    if not counts[0].sum() or not counts[1].sum():
+        raise ValueError("bootstrapping requires both positive and "
+                         "negative examples")
+
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    step = max(1, BATCH_ELEMENTS // max(1, counts.shape[1]))
+    entropy = numpy.random.SeedSequence(seed).entropy
+    tasks = [(min(step, num_replicates - start), method, curve_classes,
+              numpy.random.SeedSequence(entropy, spawn_key=(batch, )))
+             for batch, start in enumerate(xrange(0, num_replicates, step))]
+
+    # The worker processes get the counts through shared memory
+    source = counts
+    if jobs > 1 and len(tasks) > 1 and shared_memory is not None:
+        source = SharedArrays.create([("counts", counts)])
+    try:
+        parts = run_tasks(_bootstrap_batch,
+                          [(source, ) + task for task in tasks], jobs)
+    finally:
+        if source is not counts:
+            source.close()
+
+    return [numpy.concatenate([part[idx] for part in parts] or [[]])
+            for idx in xrange(len(curve_classes))]
+
+
+def confidence_intervals(data, curve_classes, level=0.95, **kwds):
+    """Calculates the AUCs of the curves of the given classes for a dataset,
+    along with their bootstrap percentile confidence intervals at the given
+    confidence `level`. Keyword arguments are passed on to
+    `bootstrap_aucs()`.
+
+    Returns a list containing a tuple for each curve class: the AUC and the
+    lower and upper bounds of its confidence interval. Replicates whose
+    AUC is undefined are ignored.
+    """
+    if not 0 < level < 1:
+        raise ValueError("level must be between 0 and 1")
+
+    bundle = CurveBundle(data)
+    aucs = [bundle.get_curve(curve_class).auc()
+            for curve_class in curve_classes]
+    replicates = bootstrap_aucs(data, curve_classes, **kwds)
+    return [(auc, ) + percentile_interval(values, level)
+            for auc, values in zip(aucs, replicates)]
+
+
+def percentile_interval(values, level=0.95):
+    """Returns the lower and upper bounds of the percentile confidence
+    interval at the given confidence `level` from the AUCs of bootstrap
+    replicates, ignoring the undefined (``nan``) AUCs."""
+    if not 0 < level < 1:
+        raise ValueError("level must be between 0 and 1")
+    percentiles = [50. * (1. - level), 50. * (1. + level)]
+    return tuple(numpy.nanpercentile(values, percentiles).tolist())
+
+
+def _bootstrap_batch(source, size, method, curve_classes, seed):
+    """Worker function that draws the weights of a batch of `size`
+    replicates with the given method and returns the AUCs of the curves of
+    the given classes for the replicates.
+
+    `source` is a 2D array with two rows containing the number of positive
+    and negative examples having each distinct predicted value, or a
+    `SharedArrays` instance containing this array with the key ``counts``.
+    `seed` is used to seed the random number generator."""
+    if isinstance(source, SharedArrays):
+        try:
+            counts = numpy.array(source["counts"])
+        finally:
+            source.close()
+    else:
+        counts = source
+
+    rng = numpy.random.default_rng(seed)
+    weights = []
+    for class_counts in counts:
+        if method == "poisson":
+            weights.append(rng.poisson(class_counts, size=(size,
+                                                           len(class_counts))))
+        else:
+            # Drawing the examples of a class uniformly is the same as
+            # drawing the predicted values with probabilities proportional
+            # to their counts
+            total = class_counts.sum()
+            weights.append(rng.multinomial(int(total), class_counts / total,
+                                           size=size))
+    return [curve_class.aucs_from_score_counts(*weights)
+            for curve_class in curve_classes]
@@ -0,0 +1,185 @@
+"""
+Reading and writing columnar binary files for ``yard``.
+
+The command line scripts of ``yard`` can read their input from binary files
+instead of text files; binary files can be memory-mapped, so no parsing is
+needed and the columns are not copied into memory until they are actually
+used. Three formats are supported:
+
+  - ``yard``'s own columnar format (see below), which supports column names
+    and arbitrary metadata and can be memory-mapped.
+
+  - NumPy ``.npy`` files containing a 2D array with one row per example and
+    one column per input column, just like the text format without a
+    header. These can be memory-mapped as well.
+
+  - NumPy ``.npz`` files containing 1D arrays of equal length, one for each
+    column; the names of the arrays are used as column names. These are
+    loaded into memory.
+
+The columnar format starts with the magic bytes ``YARDCOL1``, followed by
+the length of a JSON header as a 32-bit little-endian unsigned integer and
+the JSON header itself. The header is a JSON object with the following keys:
+
+  - ``columns``: the names of the columns
+  - ``rows``: the number of rows
+  - ``metadata``: an arbitrary JSON object
+
+The header is padded with spaces so that the data starts at a multiple of
+64 bytes. The data consists of the columns one after another, each of them
+stored as ``rows`` little-endian 64-bit floating point numbers.
+
+This module requires NumPy.
+"""
+
+import json
+import os
+import struct
+
+from yard.mathematics import numpy, require_numpy
+
+__author__  = "Tamas Nepusz"
+__email__   = "tamas@cs.rhul.ac.uk"
+__copyright__ = "Copyright (c) 2010, Tamas Nepusz"
+__license__ = "MIT"
+
+__all__ = ["detect_format", "read_columns", "write_columns"]
+
+MAGIC = b"YARDCOL1"
+NPY_MAGIC = b"\x93NUMPY"
+NPZ_MAGIC = b"PK\x03\x04"
+ALIGNMENT = 64
+
+
+def detect_format(path):
+    """Detects the format of the file at the given path from its first few
+    bytes. Returns ``"yard"``, ``"npy"`` or ``"npz"`` for the binary formats
+    supported by `read_columns()` and ``None`` for anything else."""
+    with open(path, "rb") as handle:
+        head = handle.read(8)
+    if head.startswith(MAGIC):
+        return "yard"
+    if head.startswith(NPY_MAGIC):
+        return "npy"
+    if head.startswith(NPZ_MAGIC):
+        return "npz"
+    return None
+
+
+def read_columns(path, columns=None):
+    """Reads the columns of a binary file in any of the supported formats.
+
+    `columns` is an optional list of zero-based column indices; if it is
+    given, only these columns are returned (in the given order), and the
+    other columns are not read at all.
+
+    Returns a tuple containing the names of the columns (``None`` for
+    ``.npy`` files, which have no column names), the columns themselves as
+    1D NumPy arrays and the metadata stored in the file (an empty dict for
+    NumPy files). ``yard`` and ``.npy`` files are memory-mapped, so the
+    columns are not read until they are used. Raises ``IndexError`` if a
+    column index is out of range.
+    """
+    require_numpy("Reading binary input files")
+
+    file_format = detect_format(path)
+    if file_format == "yard":
+        names, data, metadata = _read_yard_columns(path)
+        get_column = data.__getitem__
+    elif file_format == "npy":
+        data = numpy.load(path, mmap_mode="r")
+        if data.ndim == 1:
+            data = data.reshape(-1, 1)
+        if data.ndim != 2:
+            raise ValueError("%s must contain a 2D array" % path)
+        names, metadata = None, {}
+        get_column = lambda idx: data[:, idx]
+    elif file_format == "npz":
+        # The selected arrays are copied out so that the archive can be
+        # closed before returning
+        with numpy.load(path) as archive:
+            names, metadata = list(archive.files), {}
+            if columns is None:
+                selected = range(len(names))
+            else:
+                selected = [idx for idx in columns if idx < len(names)]
+            data = dict((idx, archive[names[idx]].reshape(-1))
+                        for idx in set(selected))
+        get_column = data.__getitem__
+    else:
+        raise ValueError("%s is not a binary column file" % path)
+
+    num_columns = len(names) if names is not None else data.shape[1]
+    if columns is None:
+        columns = range(num_columns)
+    elif columns and max(columns) >= num_columns:
+        raise IndexError("%s has only %d columns" % (path, num_columns))
+    result = [get_column(idx) for idx in columns]
+    if names is not None:
+        names = [names[idx] for idx in columns]
+    return names, result, metadata
+
+
+def read_header(path):
+    """Reads the JSON header of a file in ``yard``'s columnar format without
+    touching the data. Returns the parsed header and the offset where the
+    data starts."""
+    with open(path, "rb") as handle:
+        head = handle.read(len(MAGIC) + 4)
+        if len(head) < len(MAGIC) + 4 or not head.startswith(MAGIC):
+            raise ValueError("%s is not a yard column file" % path)
+        header_length, = struct.unpack("<I", head[len(MAGIC):])
+        header = json.loads(handle.read(header_length).decode("utf-8"))
+    offset = len(MAGIC) + 4 + header_length
+    return header, offset
+
+
+def _read_yard_columns(path):
+    """Memory-maps a file in ``yard``'s columnar format. Returns the names
+    of the columns, a 2D array with one row per column and the metadata."""
+    header, offset = read_header(path)
+    names, rows = header["columns"], header["rows"]
+    if not names or not rows:
+        matrix = numpy.zeros((len(names), 0))
+    else:
+        matrix = numpy.memmap(path, dtype="<f8", mode="r", offset=offset,
+                              shape=(len(names), rows))
+    return names, matrix, header.get("metadata", {})
+
+
+def write_columns(path, names, columns, metadata=None):
+    """Writes the given columns to a file in ``yard``'s columnar format.
+
+    `names` must be a list of column names, `columns` must be a list of
+    1D arrays (or sequences) of equal length. `metadata` is an optional
+    JSON-serializable object that will be stored in the header. The file
+    is written to a temporary name first and renamed at the end, so readers
+    never see a partially written file.
+    """
+    require_numpy("Writing binary column files")
+
+    columns = [numpy.asarray(column, dtype="<f8") for column in columns]
+    if len(names) != len(columns):
+        raise ValueError("the number of names and columns must be equal")
+    rows = len(columns[0]) if columns else 0
+    if any(len(column) != rows for column in columns):
+        raise ValueError("all the columns must have the same length")
+
+    header = json.dumps({"columns": list(names), "rows": rows,
+                         "metadata": metadata or {}}).encode("utf-8")
+    padding = -(len(MAGIC) + 4 + len(header)) % ALIGNMENT
+    header += b" " * padding
+
+    tmp_path = "%s.tmp%d" % (path, os.getpid())
+    try:
+        with open(tmp_path, "wb") as handle:
+            handle.write(MAGIC)
+            handle.write(struct.pack("<I", len(header)))
+            handle.write(header)
+            for column in columns:
+                column.tofile(handle)
+        os.rename(tmp_path, path)
+    except:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
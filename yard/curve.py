@@ -18,9 +18,11 @@ __copyright__ = "Copyright (c) 2010, Tamas Nepusz"
 __license__ = "MIT"
 
 from bisect import bisect
-from yard.data import BinaryConfusionMatrix, BinaryClassifierData
+from yard.data import AggregatedBinaryClassifierData, BinaryConfusionMatrix, \
+        BinaryConfusionMatrixArray, BinaryClassifierData
+from yard.mathematics import numpy
 from yard.transform import ExponentialTransformation
-from yard.utils import axis_label, itersubclasses
+from yard.utils import array_metric, axis_label, itersubclasses
 try:
     from itertools import izip
 except ImportError:
@@ -247,19 +249,75 @@ class Curve(object):
         """Transforms the curve in-place by sending all the points to a given
         callable one by one. The given callable must expect two real numbers
         and return the transformed point as a tuple."""
-        self.points = [transformation(*point) for point in self._points]
+        self.points = [transformation(*point) for point in self.points]
 
     def transform_x(self, transformation):
         """Transforms the X axis of the curve in-place by sending all the
         points to a given callable one by one. The given callable must expect
         a single real number and return the transformed value."""
-        self.points = [(transformation(x), y) for x, y in self._points]
+        self.points = [(transformation(x), y) for x, y in self.points]
 
     def transform_y(self, transformation):
         """Transforms the Y axis of the curve in-place by sending all the
         points to a given callable one by one. The given callable must expect
         a single real number and return the transformed value."""
-        self._points = [(x, transformation(y)) for x, y in self._points]
+        self._points = [(x, transformation(y)) for x, y in self.points]
+
+
+class CurveBundle(object):
+    """Curves of several types calculated from the same dataset.
+
+    Each `BinaryClassifierPerformanceCurve` sweeps its dataset on its own
+    when its points are calculated. A bundle sweeps the dataset only once:
+    it collapses the dataset into distinct predicted values with positive
+    and negative counts (see `BinaryClassifierData.get_score_counts()`),
+    evaluates the confusion matrices at every threshold once, and derives
+    the points of every curve requested with `get_curve()` from the same
+    matrices when the points are first needed. The AUCs of ROC and CROC
+    curves are also calculated from the collapsed counts.
+
+    Collapsing the dataset requires NumPy and keeps the distinct predicted
+    values in memory; pass ``aggregate=False`` for datasets that should be
+    swept from their original source every time (e.g., out-of-core
+    datasets whose AUCs are calculated in a streaming fashion).
+    """
+
+    def __init__(self, data, aggregate=True):
+        if not isinstance(data, BinaryClassifierData):
+            data = BinaryClassifierData(data)
+        self.aggregated = aggregate and numpy is not None
+        if self.aggregated and \
+                not isinstance(data, AggregatedBinaryClassifierData):
+            scores, pos_counts, neg_counts = data.get_score_counts()
+            data = AggregatedBinaryClassifierData.from_counts(scores,
+                    pos_counts, neg_counts, title=data.title, presorted=True)
+        self.data = data
+        self._matrices = None
+
+    @property
+    def matrices(self):
+        """The confusion matrices of the dataset at every threshold, as a
+        `BinaryConfusionMatrixArray`. They are calculated when first
+        needed."""
+        if self._matrices is None:
+            _, tps, fps, fns, tns = self.data.get_confusion_table()
+            self._matrices = BinaryConfusionMatrixArray(tps, fps, fns, tns)
+        return self._matrices
+
+    def get_curve(self, curve_class, **kwds):
+        """Returns a new curve of the given class for the dataset of the
+        bundle. Keyword arguments are passed on to the constructor of the
+        curve. The bundle does not keep a reference to the curve, so its
+        points are freed when the caller no longer needs them."""
+        curve = curve_class(self.data, **kwds)
+        if self.aggregated:
+            curve.set_confusion_matrices(lambda: self.matrices)
+        return curve
+
+    def get_curves(self, curve_classes):
+        """Returns the curves of the given classes for the dataset of the
+        bundle, as a list."""
+        return [self.get_curve(curve_class) for curve_class in curve_classes]
 
 
 class CurveFactory(object):
@@ -333,9 +391,13 @@ class BinaryClassifierPerformanceCurve(Curve):
         `x_func` and `y_func` must either be unbound method instances of
         the `BinaryConfusionMatrix` class, or functions that accept
         `BinaryConfusionMatrix` instances as their only arguments and
-        return a number.
+        return a number. Methods of `BinaryConfusionMatrix` and functions
+        decorated with `yard.utils.array_metric` are evaluated for all the
+        thresholds at once on a `BinaryConfusionMatrixArray`; any other
+        function is called once per threshold.
         """
         self._data = None
+        self._matrices = None
         self._points = None
         self.x_func = x_func
         self.y_func = y_func
@@ -348,10 +410,41 @@ class BinaryClassifierPerformanceCurve(Curve):
         self.data = data
 
     def _calculate_points(self):
-        """Returns the actual points of the curve as a list of tuples."""
-        x_func, y_func = self.x_func, self.y_func
-        self.points = [(x_func(mat), y_func(mat)) for _, mat in \
-                self._data.iter_confusion_matrices()]
+        """Calculates the actual points of the curve and stores them in
+        ``self._points``. This is called on the first access to `points`."""
+        if not len(self._data):
+            self.points = []
+            return
+
+        matrices = self._matrices
+        if matrices is None:
+            _, tps, fps, fns, tns = self._data.get_confusion_table()
+            matrices = BinaryConfusionMatrixArray(tps, fps, fns, tns)
+        elif not isinstance(matrices, BinaryConfusionMatrixArray):
+            matrices = matrices()
+        self._matrices = None
+
+        xs = matrices.evaluate(self.x_func)
+        ys = matrices.evaluate(self.y_func)
+        if numpy is None:
+            self.points = izip(xs, ys)
+        else:
+            # Sort the points by X and then by Y like the points setter
+            # would, but without creating a tuple for each point first
+            order = numpy.lexsort((ys, xs))
+            self._points = list(izip(xs[order].tolist(), ys[order].tolist()))
+
+    def set_confusion_matrices(self, matrices):
+        """Tells the curve to calculate its points from the given
+        `BinaryConfusionMatrixArray` instead of sweeping its dataset. The
+        array must contain the confusion matrices of the dataset at all the
+        thresholds returned by `BinaryClassifierData.get_confusion_table()`.
+        `matrices` may also be a function that returns the array when the
+        points are first needed. This allows several curves of the same
+        dataset to share a single sweep over the data; see `CurveBundle`.
+        """
+        self._matrices = matrices
+        self._points = None
 
     @property
     def data(self):
@@ -365,7 +458,28 @@ class BinaryClassifierPerformanceCurve(Curve):
             self._data = data
         else:
             self._data = BinaryClassifierData(data)
-        self._calculate_points()
+        self._matrices = None
+        self._points = None
+
+    @property
+    def points(self):
+        """Returns the points of this curve as a list of 2-tuples.
+
+        The points are calculated from the data when they are first
+        needed, so constructing a curve only to calculate its AUC does not
+        involve an evaluation of the confusion matrices at every threshold.
+        The returned list is the same as the list used internally in
+        the instance. Don't modify it unless you know what you're doing.
+        """
+        if self._points is None and self._data is not None:
+            self._calculate_points()
+        return self._points
+
+    @points.setter
+    def points(self, points):
+        """Sets the points of this curve. The method makes a copy of the
+        given iterable."""
+        Curve.points.fset(self, points)
 
     def get_empty_figure(self, *args, **kwds):
         """Returns an empty `matplotlib.Figure` that can be used
@@ -409,6 +523,52 @@ class BinaryClassifierPerformanceCurve(Curve):
         used in messages."""
         return cls.__name__
 
+    @classmethod
+    def aucs_from_multi_data(cls, data, **kwds):
+        """Returns the AUCs of the curves of this class for all the
+        classifiers in a `MultiBinaryClassifierData` instance, as a NumPy
+        array. Keyword arguments are passed on to the constructor.
+
+        The default implementation constructs the curves one by one from the
+        already sorted datasets; subclasses may calculate the AUCs of all the
+        classifiers at once instead."""
+        return numpy.array([cls(dataset, **kwds).auc() for dataset in data],
+                           dtype=numpy.float64)
+
+    @classmethod
+    def aucs_from_score_counts(cls, pos_counts, neg_counts, **kwds):
+        """Returns the AUCs of the curves of this class for several weighted
+        variants of the same dataset, as a NumPy array.
+
+        `pos_counts` and `neg_counts` are 2D arrays with one row for each
+        variant and one column for each distinct predicted value, in
+        ascending order of the predicted values (see
+        `BinaryClassifierData.get_score_counts()`); they contain the total
+        weight of the positive and negative examples having each value.
+        Keyword arguments are passed on to the constructor.
+
+        The default implementation evaluates the confusion matrices of all
+        the variants at all the thresholds at once and integrates them with
+        the trapezoidal rule like `auc()` does, so the metrics on the axes
+        must have vectorized implementations (see
+        `BinaryConfusionMatrixArray.evaluate()`)."""
+        curve = cls([], **kwds)
+        pos_counts = numpy.atleast_2d(numpy.asarray(pos_counts, dtype=float))
+        neg_counts = numpy.atleast_2d(numpy.asarray(neg_counts, dtype=float))
+        zeros = numpy.zeros((len(pos_counts), 1))
+        fns = numpy.hstack([zeros, numpy.cumsum(pos_counts, axis=1)])
+        tns = numpy.hstack([zeros, numpy.cumsum(neg_counts, axis=1)])
+        matrices = BinaryConfusionMatrixArray(fns[:, -1:] - fns,
+                                              tns[:, -1:] - tns, fns, tns)
+
+        xs = matrices.evaluate(curve.x_func)
+        ys = matrices.evaluate(curve.y_func)
+        order = numpy.lexsort((ys, xs), axis=1)
+        xs = numpy.take_along_axis(xs, order, axis=1)
+        ys = numpy.take_along_axis(ys, order, axis=1)
+        return ((ys[:, 1:] + ys[:, :-1]) / 2. *
+                (xs[:, 1:] - xs[:, :-1])).sum(axis=1)
+
 
 class ROCCurve(BinaryClassifierPerformanceCurve):
     """Class representing a ROC curve.
@@ -433,10 +593,81 @@ class ROCCurve(BinaryClassifierPerformanceCurve):
             BinaryConfusionMatrix.tpr)
 
     def auc(self):
-        """Constructs the area under the ROC curve by a linear transformation
-        of the rank sum of positive instances."""
-        pos_ranks = self.data.get_positive_ranks()
-        return self.auc_from_pos_ranks(pos_ranks, len(self.data))
+        """Constructs the area under the ROC curve by counting the
+        positive-negative pairs that are ranked correctly (i.e. the
+        Mann-Whitney U statistic), in a single sweep over the
+        already sorted data."""
+        return self._auc_from_score_count_blocks(
+            (pos_counts, neg_counts)
+            for _, pos_counts, neg_counts in self.data.iter_score_counts())
+
+    @classmethod
+    def auc_from_score_counts(cls, pos_counts, neg_counts):
+        """Returns the AUC under a ROC curve, given the number of positive
+        and negative examples for each distinct predicted value, in
+        ascending order of the predicted values (see
+        `BinaryClassifierData.get_score_counts()`).
+
+        Tied positive-negative pairs count as half a correctly ranked pair,
+        so the result is the same as the one of `auc_from_pos_ranks()`.
+        """
+        return cls._auc_from_score_count_blocks([(pos_counts, neg_counts)])
+
+    @classmethod
+    def aucs_from_score_counts(cls, pos_counts, neg_counts):
+        """Returns the AUCs under the ROC curves of several weighted variants
+        of the same dataset, as a NumPy array, calculating the Mann-Whitney
+        U statistic for all of them at once. See
+        `BinaryClassifierPerformanceCurve.aucs_from_score_counts()` for the
+        arguments. Ties are treated the same way as in `auc()`."""
+        pos_counts = numpy.atleast_2d(numpy.asarray(pos_counts, dtype=float))
+        neg_counts = numpy.atleast_2d(numpy.asarray(neg_counts, dtype=float))
+        neg_below_twice = 2 * numpy.cumsum(neg_counts, axis=1) - neg_counts
+        u_twice = (pos_counts * neg_below_twice).sum(axis=1)
+        return u_twice / (2. * pos_counts.sum(axis=1) *
+                          neg_counts.sum(axis=1))
+
+    @staticmethod
+    def _auc_from_score_count_blocks(blocks):
+        """Calculates the AUC from consecutive blocks of the output of
+        `BinaryClassifierData.get_score_counts()`, given as an iterable of
+        ``(pos_counts, neg_counts)`` pairs. Only one block is kept in
+        memory at a time."""
+        num_pos, num_neg, u_twice = 0, 0, 0
+        for pos_counts, neg_counts in blocks:
+            if numpy is not None:
+                pos_counts = numpy.asarray(pos_counts)
+                neg_counts = numpy.asarray(neg_counts)
+                neg_below_twice = 2 * (numpy.cumsum(neg_counts) + num_neg) - \
+                        neg_counts
+                u_twice += numpy.dot(pos_counts, neg_below_twice).item()
+                num_pos += pos_counts.sum().item()
+                num_neg += neg_counts.sum().item()
+                continue
+
+            for pos_count, neg_count in izip(pos_counts, neg_counts):
+                u_twice += pos_count * (2 * num_neg + neg_count)
+                num_pos += pos_count
+                num_neg += neg_count
+        return u_twice / (2. * num_pos * num_neg)
+
+    @classmethod
+    def aucs_from_multi_data(cls, data):
+        """Returns the AUCs under the ROC curves of all the classifiers in a
+        `MultiBinaryClassifierData` instance, as a NumPy array, calculating
+        the Mann-Whitney U statistic for all of them at once. Ties are
+        treated the same way as in `auc()`."""
+        num_pos, num_neg = data.total_positives, data.total_negatives
+        if num_pos == 0 or num_neg == 0:
+            raise ZeroDivisionError("AUC is undefined without both positive "
+                                    "and negative examples")
+
+        result = numpy.empty(len(data))
+        for rows, labels, neg_below, _, group_neg, _ in \
+                data.iter_group_statistics():
+            u_twice = numpy.where(labels, 2 * neg_below + group_neg, 0)
+            result[rows] = u_twice.sum(axis=1) / (2. * num_pos * num_neg)
+        return result
 
     @staticmethod
     def auc_from_pos_ranks(ranks, total):
@@ -451,6 +682,24 @@ class ROCCurve(BinaryClassifierPerformanceCurve):
         sum_pos_ranks = (total+1)*num_pos - sum(ranks)
         return 1. - sum_pos_ranks / (num_pos*num_neg) + (num_pos+1) / (2*num_neg)
 
+    @staticmethod
+    def auc_terms_from_pos_ranks(ranks, total):
+        """Decomposes the AUC under a ROC curve, given the ranks of the
+        positive examples and the total number of examples, into a sum of
+        terms, one for each positive example. Returns a tuple of the form
+        ``(intercept, slope, terms)`` such that the AUC is equal to
+        ``intercept + slope * sum(terms)``. For ROC curves, the terms are
+        the ranks themselves.
+
+        Since the term of a positive example depends only on its rank and
+        its index in `ranks`, the permutation tests in `yard.significance`
+        can use this to update the AUC without summing all the terms again.
+        """
+        num_pos = len(ranks)
+        num_neg = float(total-num_pos)
+        intercept = 1. - (total+1) / num_neg + (num_pos+1) / (2*num_neg)
+        return intercept, 1. / (num_pos*num_neg), ranks
+
     def get_empty_figure(self, *args, **kwds):
         """Returns an empty `matplotlib.Figure` that can be used
         to show the ROC curve. The arguments of this function are
@@ -676,9 +925,126 @@ class CROCCurve(BinaryClassifierPerformanceCurve):
 
     def auc(self):
         """Constructs the area under the ROC curve by the average of the
-        FPRs at thresholds equal to each positive instance."""
-        pos_ranks = self.data.get_positive_ranks()
-        return self.auc_from_pos_ranks(pos_ranks, len(self.data))
+        FPRs at thresholds equal to each positive instance, in a single
+        sweep over the already sorted data."""
+        return self._auc_from_score_count_blocks(
+            ((pos_counts, neg_counts)
+             for _, pos_counts, neg_counts in self.data.iter_score_counts()),
+            self.data.total_negatives)
+
+    def auc_from_score_counts(self, pos_counts, neg_counts):
+        """Returns the AUC under a CROC curve, given the number of positive
+        and negative examples for each distinct predicted value, in
+        ascending order of the predicted values (see
+        `BinaryClassifierData.get_score_counts()`).
+
+        The result is the same as the one of `auc_from_pos_ranks()`; in
+        particular, the k-th positive example (counting from zero) in a
+        group of tied examples is treated as if it had the average rank
+        of the group minus k. When the counts are not integers (i.e. they
+        are example weights), each positive in a group of ties gets the
+        FPR at the midpoint of the group instead.
+        """
+        return self._auc_from_score_count_blocks([(pos_counts, neg_counts)],
+                                                 sum(neg_counts))
+
+    @classmethod
+    def aucs_from_score_counts(cls, pos_counts, neg_counts, alpha=7):
+        """Returns the AUCs under the CROC curves of several weighted
+        variants of the same dataset, as a NumPy array, calculating all of
+        them at once. See
+        `BinaryClassifierPerformanceCurve.aucs_from_score_counts()` for the
+        arguments; `alpha` is the magnification factor (see the
+        constructor). Ties are treated the same way as in
+        `auc_from_score_counts()`: integer counts use the offsets of the
+        positives within their group, while other counts are treated as
+        weights and use the FPR at the midpoint of the group."""
+        pos_counts = numpy.atleast_2d(numpy.asarray(pos_counts))
+        neg_counts = numpy.atleast_2d(numpy.asarray(neg_counts))
+        integral = numpy.issubdtype(pos_counts.dtype, numpy.integer)
+        pos_counts = pos_counts.astype(float)
+        neg_counts = neg_counts.astype(float)
+
+        num_neg = neg_counts.sum(axis=1)[:, None]
+        num_neg_safe = numpy.where(num_neg > 0, num_neg, 1.)
+        neg_below = numpy.cumsum(neg_counts, axis=1) - neg_counts
+        if integral:
+            # The FPRs of the positives in a group of ties grow by 1/N from
+            # the one of the first positive, so the sum of their transformed
+            # FPRs is a geometric series
+            base = neg_below + (pos_counts + neg_counts - 1) / 2.
+            rate = alpha / num_neg_safe
+            series = numpy.exp(-alpha * (1. - base / num_neg_safe)) * \
+                     numpy.expm1(-rate * pos_counts) / numpy.expm1(-rate)
+            sum_trans_fprs = (pos_counts - series) / -numpy.expm1(-alpha)
+        else:
+            fprs = 1. - (neg_below + neg_counts / 2.) / num_neg_safe
+            sum_trans_fprs = pos_counts * ExponentialTransformation(alpha)(fprs)
+        result = 1. - sum_trans_fprs.sum(axis=1) / pos_counts.sum(axis=1)
+        result[num_neg[:, 0] == 0] = 1.
+        return result
+
+    def _auc_from_score_count_blocks(self, blocks, neg_count):
+        """Calculates the AUC from consecutive blocks of the output of
+        `BinaryClassifierData.get_score_counts()`, given as an iterable of
+        ``(pos_counts, neg_counts)`` pairs, and the total number of negative
+        examples. Only one block is kept in memory at a time."""
+        neg_count = float(neg_count)
+        if neg_count == 0.:
+            return 1.
+
+        trans = self._transformation
+        pos_count, neg_below, sum_trans_fprs = 0, 0, 0.
+        for pos_counts, neg_counts in blocks:
+            if numpy is None:
+                fprs = []
+                for group_pos, group_neg in izip(pos_counts, neg_counts):
+                    base = neg_below + (group_pos + group_neg - 1) / 2.
+                    fprs.extend(1. - (base - k) / neg_count
+                                for k in xrange(group_pos))
+                    neg_below += group_neg
+                    pos_count += group_pos
+                sum_trans_fprs += sum(trans(fprs))
+                continue
+
+            pos_counts = numpy.asarray(pos_counts)
+            neg_counts = numpy.asarray(neg_counts)
+            neg_below_groups = numpy.cumsum(neg_counts) - neg_counts + neg_below
+            if not numpy.issubdtype(pos_counts.dtype, numpy.integer):
+                fprs = 1. - (neg_below_groups + neg_counts / 2.) / neg_count
+                sum_trans_fprs += numpy.dot(pos_counts, trans(fprs)).item()
+            else:
+                # Number of negatives ranked below each positive, minus the
+                # offset of the positive within its group of ties
+                base = neg_below_groups + (pos_counts + neg_counts - 1) / 2.
+                pos_starts = numpy.cumsum(pos_counts) - pos_counts
+                offsets = numpy.arange(pos_counts.sum()) - \
+                        numpy.repeat(pos_starts, pos_counts)
+                fprs = 1. - (numpy.repeat(base, pos_counts) - offsets) / neg_count
+                sum_trans_fprs += trans(fprs).sum().item()
+            pos_count += pos_counts.sum().item()
+            neg_below += neg_counts.sum().item()
+        return 1. - sum_trans_fprs / pos_count
+
+    @classmethod
+    def aucs_from_multi_data(cls, data, alpha=7):
+        """Returns the AUCs under the CROC curves of all the classifiers in
+        a `MultiBinaryClassifierData` instance, as a NumPy array, calculating
+        all of them at once. `alpha` is the magnification factor (see the
+        constructor). Ties are treated the same way as in `auc()`."""
+        num_pos, num_neg = data.total_positives, float(data.total_negatives)
+        if num_neg == 0.:
+            return numpy.ones(len(data))
+
+        trans = ExponentialTransformation(alpha)
+        result = numpy.empty(len(data))
+        for rows, labels, neg_below, group_pos, group_neg, offsets in \
+                data.iter_group_statistics():
+            fprs = 1. - (neg_below + (group_pos + group_neg - 1) / 2. -
+                         offsets) / num_neg
+            sum_trans_fprs = numpy.where(labels, trans(fprs), 0.).sum(axis=1)
+            result[rows] = 1. - sum_trans_fprs / num_pos
+        return result
 
     def auc_from_pos_ranks(self, pos_ranks, total):
         """Returns the AUC under a CROC curve, given the ranks of the positive
@@ -696,6 +1062,29 @@ class CROCCurve(BinaryClassifierPerformanceCurve):
         fprs = [1. - (rank-i-1) / neg_count for i, rank in enumerate(pos_ranks)]
         return 1. - sum(trans(fprs)) / pos_count
 
+    def auc_terms_from_pos_ranks(self, pos_ranks, total):
+        """Decomposes the AUC under a CROC curve, given the ranks of the
+        positive examples and the total number of examples, into a sum of
+        terms, one for each positive example. Returns a tuple of the form
+        ``(intercept, slope, terms)`` such that the AUC is equal to
+        ``intercept + slope * sum(terms)``. For CROC curves, the terms are
+        the transformed false positive rates.
+
+        See `ROCCurve.auc_terms_from_pos_ranks()` for more details.
+        """
+        pos_count = len(pos_ranks)
+        neg_count = float(total - pos_count)
+        if neg_count == 0.:
+            return 1., 0., [0.] * pos_count
+
+        if hasattr(pos_ranks, "dtype"):
+            fprs = 1. - (pos_ranks - numpy.arange(1, pos_count+1)) / neg_count
+        else:
+            fprs = [1. - (rank-i-1) / neg_count
+                    for i, rank in enumerate(pos_ranks)]
+        return 1., -1. / pos_count, self._transformation(fprs)
+
+    @array_metric
     @axis_label("Transformed false positive rate")
     def _transformed_fpr(self, matrix):
         """Internal function that returns the transformed FPR value from the
@@ -824,12 +1213,14 @@ class FScoreCurve(BinaryClassifierPerformanceCurve):
         to precision and recall. In general, recall is considered `f` times more
         important than precision.
         """
+        @array_metric
         @axis_label("F-score")
         def f_score(matrix):
             """Internal function that binds the `f` parameter of
             `BinaryConfusionMatrix.f_score` to the value specified in the constructor.
+            Works with `BinaryConfusionMatrixArray` instances as well.
             """
-            return BinaryConfusionMatrix.f_score(matrix, f)
+            return matrix.f_score(f)
         super(FScoreCurve, self).__init__(data, BinaryConfusionMatrix.fdp, f_score)
 
     @classmethod
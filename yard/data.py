@@ -6,9 +6,10 @@ sensitivity, specificity, precision, recall, TPR, FPR and such.
 from __future__ import division
 
 from bisect import bisect_left
+from functools import wraps
 
-from yard.mathematics import rank
-from yard.utils import axis_label
+from yard.mathematics import numpy, rank, require_numpy
+from yard.utils import as_list, axis_label
 
 try:
     xrange
@@ -272,6 +273,255 @@ class BinaryConfusionMatrix(object):
     miss = fnr
     phi = mcc
 
+
+def _with_scalar_fallback(func):
+    """Decorator for the metric methods of `BinaryConfusionMatrixArray`.
+
+    The decorated method is evaluated as is when NumPy is available. When
+    it is not, the decorator evaluates the `BinaryConfusionMatrix` method
+    with the same name on each matrix one by one instead, returning ``nan``
+    where the scalar method would divide by zero.
+    """
+    scalar_func = getattr(BinaryConfusionMatrix, func.__name__)
+
+    @wraps(func)
+    def wrapper(self, *args, **kwds):
+        if numpy is not None:
+            return func(self, *args, **kwds)
+        return self.apply(lambda matrix: scalar_func(matrix, *args, **kwds))
+    return wrapper
+
+
+def _divide(num, den, default=float('nan')):
+    """Divides two NumPy arrays elementwise and returns `default` where
+    the denominator is zero."""
+    result = numpy.full(numpy.shape(den), default, dtype=numpy.float64)
+    numpy.divide(num, den, out=result, where=(den != 0))
+    return result
+
+
+class BinaryConfusionMatrixArray(object):
+    """Class representing a sequence of binary confusion matrices in a
+    struct-of-arrays layout.
+
+    The ``tp``, ``fp``, ``fn`` and ``tn`` attributes of this class are
+    arrays, and the metric methods (`fpr()`, `tpr()`, `precision()`
+    and the rest of the methods of `BinaryConfusionMatrix`) calculate the
+    metric for all the matrices at once and return an array. The metrics
+    follow the same conventions as their counterparts in
+    `BinaryConfusionMatrix` when their denominator is zero (e.g., the
+    precision is 1.0 when TP+FP=0), except that they return ``nan``
+    instead of raising ``ZeroDivisionError``.
+
+    Indexing the array yields ordinary `BinaryConfusionMatrix` instances.
+    The attributes are NumPy arrays if NumPy is installed; otherwise they
+    are lists and the metrics are evaluated one matrix at a time.
+    """
+
+    __slots__ = ("tp", "fp", "tn", "fn")
+
+    def __init__(self, tp, fp, fn, tn):
+        if numpy is not None:
+            tp, fp, fn, tn = [numpy.asarray(item) for item in (tp, fp, fn, tn)]
+        else:
+            tp, fp, fn, tn = [list(item) for item in (tp, fp, fn, tn)]
+        if not len(tp) == len(fp) == len(fn) == len(tn):
+            raise ValueError("tp, fp, fn and tn must have the same length")
+        self.tp, self.fp, self.fn, self.tn = tp, fp, fn, tn
+
+    def __getitem__(self, index):
+        return BinaryConfusionMatrix(tp=self.tp[index], fp=self.fp[index],
+                                     fn=self.fn[index], tn=self.tn[index])
+
+    def __iter__(self):
+        for tp, fp, fn, tn in zip(*[as_list(item) for item in \
+                (self.tp, self.fp, self.fn, self.tn)]):
+            yield BinaryConfusionMatrix(tp=tp, fp=fp, fn=fn, tn=tn)
+
+    def __len__(self):
+        return len(self.tp)
+
+    def __repr__(self):
+        return "%s(tp=%r, fp=%r, fn=%r, tn=%r)" % (self.__class__.__name__,
+                as_list(self.tp), as_list(self.fp), as_list(self.fn),
+                as_list(self.tn))
+
+    def apply(self, func):
+        """Calls `func` with each confusion matrix in this array as a
+        `BinaryConfusionMatrix` and returns the results. This is the slow
+        path used for metrics that do not have a vectorized implementation.
+        The result is a NumPy array if NumPy is installed."""
+        results = []
+        matrix = BinaryConfusionMatrix()
+        for matrix.tp, matrix.fp, matrix.fn, matrix.tn in \
+                zip(*[as_list(item) for item in \
+                      (self.tp, self.fp, self.fn, self.tn)]):
+            try:
+                results.append(func(matrix))
+            except ZeroDivisionError:
+                results.append(float('nan'))
+        if numpy is not None:
+            return numpy.array(results, dtype=numpy.float64)
+        return results
+
+    def evaluate(self, func):
+        """Evaluates the given metric on all the confusion matrices in this
+        array and returns the results.
+
+        `func` may be an unbound metric method of `BinaryConfusionMatrix`,
+        in which case its vectorized counterpart in this class is used. It
+        may also be a function decorated with `yard.utils.array_metric`,
+        which will be called with this array directly. Any other function
+        is called with each confusion matrix one by one (see `apply()`).
+        """
+        if getattr(func, "__array_metric__", False):
+            return func(self)
+        name = getattr(func, "__name__", None)
+        if name and getattr(BinaryConfusionMatrix, name, None) == func:
+            return getattr(self, name)()
+        return self.apply(func)
+
+    @axis_label("Accuracy")
+    @_with_scalar_fallback
+    def accuracy(self):
+        """Returns the accuracy, i.e. (TP+TN) / (P+N), for each matrix."""
+        num = self.tp + self.tn
+        result = _divide(num, num + self.fp + self.fn)
+        result[num == 0] = 0
+        return result
+
+    @axis_label("Error rate")
+    @_with_scalar_fallback
+    def error_rate(self):
+        """Returns the error rate, i.e. (FP+FN) / (P+N), for each matrix."""
+        num = self.fp + self.fn
+        result = _divide(num, num + self.tp + self.tn)
+        result[num == 0] = 0
+        return result
+
+    @axis_label("Fraction of data classified negative")
+    @_with_scalar_fallback
+    def fdn(self):
+        """Returns the fraction of data classified as negative (FDN) for
+        each matrix."""
+        num = self.fn + self.tn
+        return _divide(num, num + self.fp + self.tp)
+
+    @axis_label("Fraction of data classified positive")
+    @_with_scalar_fallback
+    def fdp(self):
+        """Returns the fraction of data classified as positive (FDP) for
+        each matrix."""
+        num = self.fp + self.tp
+        return _divide(num, num + self.fn + self.tn)
+
+    @axis_label("False discovery rate")
+    @_with_scalar_fallback
+    def fdr(self):
+        """Returns the false discovery date (FDR), i.e. FP / (TP+FP), for
+        each matrix."""
+        return _divide(self.fp, self.fp + self.tp)
+
+    @axis_label("False negative rate")
+    @_with_scalar_fallback
+    def fnr(self):
+        """Returns the false negative rate (FNR), i.e. FN / (FN + TP), for
+        each matrix."""
+        return _divide(self.fn, self.fn + self.tp)
+
+    @axis_label("False positive rate")
+    @_with_scalar_fallback
+    def fpr(self):
+        """Returns the false positive rate (FPR), i.e. FP / (FP + TN), for
+        each matrix."""
+        return _divide(self.fp, self.fp + self.tn)
+
+    @axis_label("F-score")
+    @_with_scalar_fallback
+    def f_score(self, f=1.0):
+        """Returns the F-score for each matrix. See
+        `BinaryConfusionMatrix.f_score()` for the meaning of `f`."""
+        sq = float(f*f)
+        num = (1 + sq) * self.tp
+        return _divide(num, num + sq * self.fn + self.fp)
+
+    @axis_label("Matthews correlation coefficient")
+    @_with_scalar_fallback
+    def mcc(self):
+        """Returns the Matthews correlation coefficient (also known as
+        phi correlation coefficient) for each matrix."""
+        tp, fp, fn, tn = [item.astype(numpy.float64) for item in \
+                          (self.tp, self.fp, self.fn, self.tn)]
+        den = (tp + fp) * (tp + fn) * (tn + fp) * (tn + fn)
+        return _divide(tp * tn - fp * fn, numpy.sqrt(den))
+
+    @axis_label("Negative predictive value")
+    @_with_scalar_fallback
+    def npv(self):
+        """Returns the negative predictive value (NPV), i.e. TN / (TN+FN),
+        for each matrix."""
+        return _divide(self.tn, self.tn + self.fn)
+
+    @axis_label("Odds ratio")
+    @_with_scalar_fallback
+    def odds_ratio(self):
+        """Returns the odds ratio for each matrix."""
+        num = self.tp * numpy.asarray(self.tn, dtype=numpy.float64)
+        den = self.fp * numpy.asarray(self.fn, dtype=numpy.float64)
+        result = _divide(num, den, default=float('inf'))
+        result[(den == 0) & (num == 0)] = float('nan')
+        return result
+
+    @axis_label("Precision")
+    @_with_scalar_fallback
+    def precision(self):
+        """Returns the precision, a.k.a. the positive predictive value (PPV),
+        i.e. TP / (TP+FP), for each matrix."""
+        return _divide(self.tp, self.tp + self.fp, default=1.0)
+
+    @axis_label("Recall")
+    @_with_scalar_fallback
+    def recall(self):
+        """Returns the recall, a.k.a. the true positive rate (TPR) or
+        sensitivity, i.e. TP / (TP+FN), for each matrix."""
+        return _divide(self.tp, self.tp + self.fn)
+
+    @axis_label("Rate of negative predictions")
+    @_with_scalar_fallback
+    def rnp(self):
+        """Returns the rate of negative predictions, i.e.
+        (TN+FN) / (TN+FN+TP+FP), for each matrix."""
+        num = self.tn + self.fn
+        result = _divide(num, num + self.tp + self.fp)
+        result[num == 0] = 0
+        return result
+
+    @axis_label("Rate of positive predictions")
+    @_with_scalar_fallback
+    def rpp(self):
+        """Returns the rate of positive predictions, i.e.
+        (TP+FP) / (TN+FN+TP+FP), for each matrix."""
+        num = self.tp + self.fp
+        result = _divide(num, num + self.tn + self.fn)
+        result[num == 0] = 0
+        return result
+
+    @axis_label("True negative rate")
+    @_with_scalar_fallback
+    def tnr(self):
+        """Returns the true negative rate (TNR), a.k.a. specificity, for
+        each matrix."""
+        return _divide(self.tn, self.fp + self.tn)
+
+    # Some aliases
+    ppv = precision
+    sensitivity = recall
+    tpr = recall
+    specificity = tnr
+    fallout = fpr
+    miss = fnr
+    phi = mcc
+
     
 class BinaryClassifierData(object):
     """Class representing the output of a binary classifier.
@@ -390,45 +640,122 @@ class BinaryClassifierData(object):
         if not len(self):
             return
 
+        thresholds, tps, fps, fns, tns = \
+                [as_list(item) for item in self.get_confusion_table(thresholds)]
+        for threshold, tp, fp, fn, tn in zip(thresholds, tps, fps, fns, tns):
+            yield threshold, BinaryConfusionMatrix(tp=tp, fp=fp, fn=fn, tn=tn)
+
+    def get_confusion_table(self, thresholds=None):
+        """Returns the confusion matrices at several prediction thresholds
+        at once, in a compact form.
+
+        The result is a tuple of five sequences: the thresholds in
+        ascending order, followed by the number of true positives, false
+        positives, false negatives and true negatives at each threshold.
+        The interpretation of `thresholds` is the same as in
+        `iter_confusion_matrices()`; when it is ``None``, we evaluate all
+        the distinct predicted values plus infinity. The counts are
+        calculated in a single pass over the output of `get_score_counts()`,
+        so this is much faster than `iter_confusion_matrices()` when there
+        are many thresholds. The sequences are NumPy arrays if NumPy is
+        installed and lists otherwise.
+
+        Example::
+
+            >>> outcomes = [10, 20, 20, 30, 40]
+            >>> expected = [0, 1, 0, 0, 1]
+            >>> data = BinaryClassifierData(zip(outcomes, expected))
+            >>> thresholds, tp, fp, fn, tn = data.get_confusion_table()
+            >>> list(tp), list(fp), list(fn), list(tn)
+            ([2, 2, 1, 1, 0], [3, 2, 1, 0, 0], [0, 0, 1, 1, 2], [0, 1, 2, 3, 3])
+        """
+        scores, pos_counts, neg_counts = self.get_score_counts()
+
+        if thresholds is not None:
+            if not hasattr(thresholds, "__iter__"):
+                n = float(thresholds)
+                thresholds = [i/n for i in xrange(thresholds+1)]
+            thresholds = sorted(set(thresholds))
+
+        if numpy is not None:
+            scores = numpy.asarray(scores, dtype=numpy.float64)
+            fns = numpy.r_[0, numpy.cumsum(pos_counts)]
+            tns = numpy.r_[0, numpy.cumsum(neg_counts)]
+            num_pos, num_neg = fns[-1], tns[-1]
+            if thresholds is None:
+                thresholds = numpy.r_[scores, float('inf')]
+            else:
+                thresholds = numpy.array(thresholds, dtype=numpy.float64)
+                indices = numpy.searchsorted(scores, thresholds, "left")
+                fns, tns = fns[indices], tns[indices]
+            return thresholds, num_pos - fns, num_neg - tns, fns, tns
+
+        fns, tns = [0], [0]
+        for pos_count, neg_count in zip(pos_counts, neg_counts):
+            fns.append(fns[-1] + pos_count)
+            tns.append(tns[-1] + neg_count)
+        num_pos, num_neg = fns[-1], tns[-1]
         if thresholds is None:
-            thresholds = [pred for pred, _ in self.data]
+            thresholds = list(scores)
             thresholds.append(float('inf'))
-        elif not hasattr(thresholds, "__iter__"):
-            n = float(thresholds)
-            thresholds = [i/n for i in xrange(thresholds+1)]
-        thresholds = sorted(set(thresholds))
+        else:
+            indices = [bisect_left(scores, threshold) for threshold in thresholds]
+            fns = [fns[idx] for idx in indices]
+            tns = [tns[idx] for idx in indices]
+        return thresholds, [num_pos - fn for fn in fns], \
+               [num_neg - tn for tn in tns], fns, tns
+
+    def get_score_counts(self):
+        """Returns the distinct predicted values in the dataset along with
+        the number of positive and negative examples having each value.
+
+        The result is a tuple of three sequences of equal length: the
+        distinct predicted values in ascending order, the number of
+        positive examples and the number of negative examples for each
+        value. This is the form in which the threshold sweeps of the curve
+        classes consume the dataset.
 
-        if not thresholds:
-            return
+        Example::
+
+            >>> outcomes = [10, 20, 20, 30, 40]
+            >>> expected = [0, 1, 0, 0, 1]
+            >>> data = BinaryClassifierData(zip(outcomes, expected))
+            >>> data.get_score_counts()
+            ([10, 20, 30, 40], [0, 1, 0, 1], [1, 1, 1, 0])
+        """
+        scores, pos_counts, neg_counts = [], [], []
+        for score, is_pos in self.data:
+            if not scores or score != scores[-1]:
+                scores.append(score)
+                pos_counts.append(0)
+                neg_counts.append(0)
+            if is_pos:
+                pos_counts[-1] += 1
+            else:
+                neg_counts[-1] += 1
+        return scores, pos_counts, neg_counts
+
+    def iter_score_counts(self):
+        """Iterates over the output of `get_score_counts()` in consecutive
+        blocks. Each block is a tuple of three sequences, like the result of
+        `get_score_counts()`, and a group of tied examples never spans two
+        blocks. Datasets that do not fit into memory (see
+        `yard.external.ExternalBinaryClassifierData`) use this to stream
+        themselves through the AUC calculations; the default implementation
+        yields a single block.
+        """
+        yield self.get_score_counts()
 
-        threshold = thresholds.pop(0)
-        result = self.get_confusion_matrix(threshold)
-        yield threshold, BinaryConfusionMatrix(result)
+    def to_shared_memory(self):
+        """Copies the dataset into a new shared memory block that worker
+        processes can attach to without copying the dataset. Returns a
+        `yard.sharedmem.SharedDataset` that owns the block; pass it to the
+        worker processes and close it when they are done.
+
+        This method requires NumPy and Python 3.8 or later."""
+        from yard.sharedmem import SharedDataset
+        return SharedDataset.from_dataset(self)
 
-        n = len(self)
-        row_idx = bisect_left(self.data, (threshold, False))
-        for threshold in thresholds:
-            while row_idx < n:
-                row = self.data[row_idx]
-                if row[0] >= threshold:
-                    break
-                if row[1]:
-                    # This data point is a positive example. Since
-                    # we are below the threshold now (and we weren't
-                    # in the previous iteration), we have one less
-                    # TP and one more FN
-                    result.tp -= 1
-                    result.fn += 1
-                else:
-                    # This data point is a negative example. Since
-                    # we are below the threshold now (and we weren't
-                    # in the previous iteration), we have one more
-                    # TN and one less FP
-                    result.tn += 1
-                    result.fp -= 1
-                row_idx += 1
-            yield threshold, BinaryConfusionMatrix(result)
-    
     @property
     def title(self):
         """The title of the plot"""
@@ -448,3 +775,731 @@ class BinaryClassifierData(object):
             self._title = str(value)
 
 
+
+
+class ColumnarBinaryClassifierData(BinaryClassifierData):
+    """Columnar, NumPy-backed variant of `BinaryClassifierData`.
+
+    Instead of a sorted list of ``(score, bool)`` tuples, this class keeps
+    the dataset in two contiguous arrays: `scores` holds the predicted
+    values as ``float64`` and `labels` holds the expected outcomes as
+    ``bool``, both sorted in ascending order of the scores (examples with
+    tied scores keep their original relative order). This takes 9 bytes
+    per example and a single ``argsort`` to set up, which makes the class
+    suitable for datasets with tens of millions of examples.
+
+    The constructor accepts the same kind of input as the constructor of
+    `BinaryClassifierData`. If you already have the scores and labels in
+    separate arrays, use `from_arrays()` instead, which avoids creating
+    any Python objects per example.
+
+    This class requires NumPy.
+    """
+
+    def __init__(self, data, title=None):
+        require_numpy("ColumnarBinaryClassifierData")
+
+        self._title = None
+        if isinstance(data, ColumnarBinaryClassifierData):
+            self._set_arrays(data.scores, data.labels, presorted=True)
+        elif isinstance(data, BinaryClassifierData):
+            self._set_arrays([point[0] for point in data.data],
+                             [point[1] for point in data.data],
+                             presorted=True)
+        else:
+            data = [self._normalize_point(point) for point in data]
+            self._set_arrays([point[0] for point in data],
+                             [point[1] for point in data])
+        self.title = title
+
+    @classmethod
+    def from_arrays(cls, scores, labels, title=None, presorted=False):
+        """Constructs a dataset from an array of predicted values and an
+        array of expected outcomes.
+
+        `scores` and `labels` may be NumPy arrays or any object supporting
+        the buffer protocol (e.g., ``array.array`` or ``memoryview``). A
+        `labels` entry is positive if it is larger than zero, just like in
+        the constructor. `scores` is not copied if it is already a
+        ``float64`` array sorted in ascending order, and neither is
+        `labels` if it is a ``bool`` array. `presorted` may be set to
+        ``True`` to skip checking whether `scores` is sorted.
+        """
+        require_numpy("ColumnarBinaryClassifierData")
+
+        result = cls.__new__(cls)
+        result._title = None
+        result._set_arrays(scores, labels, presorted)
+        result.title = title
+        return result
+
+    def _set_arrays(self, scores, labels, presorted=False):
+        """Sets up the internal arrays of the dataset from the given
+        predicted values and expected outcomes."""
+        scores = numpy.asarray(scores, dtype=numpy.float64)
+        labels = numpy.asarray(labels)
+        if labels.dtype != numpy.bool_:
+            labels = labels > 0
+        if scores.ndim != 1 or scores.shape != labels.shape:
+            raise ValueError("scores and labels must be 1D arrays of "
+                             "equal length")
+
+        if not presorted and numpy.any(scores[1:] < scores[:-1]):
+            order = numpy.argsort(scores, kind="mergesort")
+            scores, labels = scores[order], labels[order]
+
+        self.scores, self.labels = scores, labels
+        self.total_positives = int(numpy.count_nonzero(labels))
+        self.total_negatives = len(labels) - self.total_positives
+
+    def __getitem__(self, index):
+        return float(self.scores[index]), bool(self.labels[index])
+
+    def __len__(self):
+        return len(self.scores)
+
+    @property
+    def data(self):
+        """Returns the dataset as a sorted list of ``(score, bool)`` tuples,
+        just like `BinaryClassifierData.data`.
+
+        The list is constructed from scratch whenever you access this
+        property, so avoid it for large datasets.
+        """
+        return list(zip(self.scores.tolist(), self.labels.tolist()))
+
+    def _get_group_bounds(self):
+        """Returns two arrays containing the start and end indices of
+        groups of examples with identical scores."""
+        scores = self.scores
+        if not len(scores):
+            return numpy.zeros(0, dtype=numpy.intp), \
+                   numpy.zeros(0, dtype=numpy.intp)
+        starts = numpy.flatnonzero(numpy.r_[True, scores[1:] != scores[:-1]])
+        ends = numpy.r_[starts[1:], len(scores)]
+        return starts, ends
+
+    def _get_ranks(self):
+        """Returns the ranks of all the instances, using the average rank
+        for tied scores."""
+        starts, ends = self._get_group_bounds()
+        return numpy.repeat((starts + ends + 1) / 2., ends - starts)
+
+    def get_confusion_matrix(self, threshold):
+        """Returns the confusion matrix at a given threshold.
+
+        The outcome corresponding to values larger than or equal to the
+        threshold is assumed to be 1 and the outcome correspondong to
+        values smaller than the threshold is assumed to be zero.
+
+        Example::
+
+            >>> outcomes = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
+            >>> expected = [0, 0, 0, 1, 0, 1, 1, 1, 1]
+            >>> data = ColumnarBinaryClassifierData.from_arrays(outcomes, expected)
+            >>> data.get_confusion_matrix(0.2)
+            BinaryConfusionMatrix(tp=5, fp=3, fn=0, tn=1)
+        """
+        idx = int(numpy.searchsorted(self.scores, threshold, "left"))
+        fn = int(numpy.count_nonzero(self.labels[:idx]))
+        tn = idx - fn
+        return BinaryConfusionMatrix(tp=self.total_positives-fn,
+                                     fp=self.total_negatives-tn,
+                                     fn=fn, tn=tn)
+
+    def get_negative_ranks(self):
+        """Returns the ranks of the negative instances as a NumPy array."""
+        return self._get_ranks()[~self.labels]
+
+    def get_positive_ranks(self):
+        """Returns the ranks of the positive instances as a NumPy array."""
+        return self._get_ranks()[self.labels]
+
+    def get_score_counts(self):
+        """Returns the distinct predicted values in the dataset along with
+        the number of positive and negative examples having each value,
+        as three NumPy arrays.
+
+        See `BinaryClassifierData.get_score_counts()` for more details.
+        """
+        starts, ends = self._get_group_bounds()
+        if not len(starts):
+            return self.scores[:0], starts, starts
+        pos_counts = numpy.add.reduceat(self.labels, starts, dtype=numpy.int64)
+        return self.scores[starts], pos_counts, (ends - starts) - pos_counts
+
+
+class AggregatedBinaryClassifierData(BinaryClassifierData):
+    """Run-length aggregated variant of `BinaryClassifierData`.
+
+    This class stores a single record for each distinct predicted value in
+    the dataset: the value itself (in `scores`), the number of positive
+    examples with that value (in `pos_counts`) and the number of negative
+    examples with that value (in `neg_counts`). The three arrays are
+    sorted in ascending order of the predicted values. The memory
+    requirements therefore scale with the number of distinct predicted
+    values instead of the number of examples, which makes a huge difference
+    for classifiers with heavily quantized outputs.
+
+    The counts may also be non-negative real numbers, in which case they
+    are treated as example weights. The methods that need individual
+    examples (`get_positive_ranks()`, `get_negative_ranks()`, indexing
+    and the `data` property) work with integer counts only.
+
+    The constructor accepts the same kind of input as the constructor of
+    `BinaryClassifierData`, but it never keeps more than one record per
+    distinct predicted value in memory. See also `from_arrays()`,
+    `from_counts()` and `merge()`.
+
+    This class requires NumPy.
+    """
+
+    def __init__(self, data, title=None):
+        require_numpy("AggregatedBinaryClassifierData")
+
+        self._title = None
+        if isinstance(data, BinaryClassifierData):
+            self._set_counts(*data.get_score_counts())
+        else:
+            counts = {}
+            for point in data:
+                score, is_pos = self._normalize_point(point)
+                record = counts.get(score)
+                if record is None:
+                    record = counts[score] = [0, 0]
+                record[not is_pos] += 1
+            scores = sorted(counts)
+            self._set_counts(scores, [counts[score][0] for score in scores],
+                             [counts[score][1] for score in scores])
+        self.title = title
+
+    @classmethod
+    def from_arrays(cls, scores, labels, weights=None, title=None):
+        """Constructs an aggregated dataset from an array of predicted
+        values and an array of expected outcomes, optionally weighting
+        each example by the corresponding entry of `weights`.
+
+        The arrays may be NumPy arrays or any object supporting the buffer
+        protocol. A `labels` entry is positive if it is larger than zero.
+        """
+        require_numpy("AggregatedBinaryClassifierData")
+
+        scores = numpy.asarray(scores, dtype=numpy.float64)
+        labels = numpy.asarray(labels)
+        if labels.dtype != numpy.bool_:
+            labels = labels > 0
+        if scores.ndim != 1 or scores.shape != labels.shape:
+            raise ValueError("scores and labels must be 1D arrays of "
+                             "equal length")
+
+        distinct, inverse = numpy.unique(scores, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        if weights is None:
+            pos_weights, neg_weights = None, None
+        else:
+            weights = numpy.asarray(weights, dtype=numpy.float64)
+            pos_weights, neg_weights = weights[labels], weights[~labels]
+        pos_counts = numpy.bincount(inverse[labels], weights=pos_weights,
+                                    minlength=len(distinct))
+        neg_counts = numpy.bincount(inverse[~labels], weights=neg_weights,
+                                    minlength=len(distinct))
+
+        return cls.from_counts(distinct, pos_counts, neg_counts, title=title,
+                               presorted=True)
+
+    @classmethod
+    def from_counts(cls, scores, pos_counts, neg_counts, title=None,
+                    presorted=False):
+        """Constructs an aggregated dataset from pre-aggregated counts.
+
+        `scores` contains predicted values, `pos_counts` and `neg_counts`
+        contain the number (or total weight) of positive and negative
+        examples with the corresponding predicted value. Repeated values in
+        `scores` are allowed; their counts will be added up. `presorted`
+        may be set to ``True`` if `scores` is known to be sorted in
+        ascending order.
+        """
+        require_numpy("AggregatedBinaryClassifierData")
+
+        result = cls.__new__(cls)
+        result._title = None
+        result._set_counts(scores, pos_counts, neg_counts, presorted)
+        result.title = title
+        return result
+
+    @classmethod
+    def merge(cls, datasets, title=None):
+        """Merges several datasets into a single aggregated dataset.
+
+        `datasets` must be an iterable of `BinaryClassifierData` instances
+        (typically `AggregatedBinaryClassifierData` instances built from
+        separate shards of the same data). Since the distinct predicted
+        values of each dataset are already sorted, the merge is done with
+        a stable sort that only has to merge the sorted runs, in
+        O(n log k) time for k datasets with n distinct values in total.
+        The result is exact; counts for the same predicted value in
+        different datasets are added up.
+        """
+        require_numpy("AggregatedBinaryClassifierData")
+
+        parts = [dataset.get_score_counts() for dataset in datasets]
+        if not parts:
+            return cls.from_counts([], [], [], title=title)
+
+        scores = numpy.concatenate([numpy.asarray(part[0], dtype=numpy.float64)
+                                    for part in parts])
+        pos_counts = numpy.concatenate([numpy.asarray(part[1]) for part in parts])
+        neg_counts = numpy.concatenate([numpy.asarray(part[2]) for part in parts])
+        return cls.from_counts(scores, pos_counts, neg_counts, title=title)
+
+    def _set_counts(self, scores, pos_counts, neg_counts, presorted=False):
+        """Sets up the internal arrays of the dataset from the given
+        predicted values and counts, collapsing repeated predicted values
+        into a single record."""
+        scores = numpy.asarray(scores, dtype=numpy.float64)
+        pos_counts = numpy.asarray(pos_counts)
+        neg_counts = numpy.asarray(neg_counts)
+        if pos_counts.dtype == numpy.bool_ or not len(pos_counts):
+            pos_counts = pos_counts.astype(numpy.int64)
+        if neg_counts.dtype == numpy.bool_ or not len(neg_counts):
+            neg_counts = neg_counts.astype(numpy.int64)
+        if scores.ndim != 1 or not \
+                scores.shape == pos_counts.shape == neg_counts.shape:
+            raise ValueError("scores, pos_counts and neg_counts must be 1D "
+                             "arrays of equal length")
+
+        if not presorted and numpy.any(scores[1:] < scores[:-1]):
+            order = numpy.argsort(scores, kind="stable")
+            scores = scores[order]
+            pos_counts, neg_counts = pos_counts[order], neg_counts[order]
+
+        if numpy.any(scores[1:] == scores[:-1]):
+            starts = numpy.flatnonzero(numpy.r_[True, scores[1:] != scores[:-1]])
+            scores = scores[starts]
+            pos_counts = numpy.add.reduceat(pos_counts, starts)
+            neg_counts = numpy.add.reduceat(neg_counts, starts)
+
+        self.scores, self.pos_counts, self.neg_counts = \
+                scores, pos_counts, neg_counts
+        self.total_positives = pos_counts.sum().item()
+        self.total_negatives = neg_counts.sum().item()
+        self._offsets = None
+
+    def __getitem__(self, index):
+        n = len(self)
+        if index < 0:
+            index += n
+        if index < 0 or index >= n:
+            raise IndexError("index out of range")
+        scores, neg_ends, ends = self._get_offsets()
+        group = int(numpy.searchsorted(ends, index, "right"))
+        return float(scores[group]), bool(index >= neg_ends[group])
+
+    def _get_offsets(self):
+        """Returns the predicted values of the groups of tied examples, and
+        the indices after the negative examples and after all the examples
+        of each group (the negative examples of a group come first). The
+        offsets are calculated once after each change of the counts."""
+        if self._offsets is None:
+            scores, pos_counts, neg_counts = self.get_score_counts()
+            ends = numpy.cumsum(pos_counts + neg_counts)
+            self._offsets = scores, ends - pos_counts, ends
+        return self._offsets
+
+    def __len__(self):
+        return int(round(self.total_positives + self.total_negatives))
+
+    @property
+    def data(self):
+        """Returns the dataset as a sorted list of ``(score, bool)`` tuples,
+        just like `BinaryClassifierData.data`. Works with integer counts
+        only.
+
+        The list is constructed from scratch whenever you access this
+        property, so avoid it for large datasets.
+        """
+        result = []
+        for score, pos_count, neg_count in zip(self.scores.tolist(),
+                self.pos_counts.tolist(), self.neg_counts.tolist()):
+            result.extend([(score, False)] * neg_count)
+            result.extend([(score, True)] * pos_count)
+        return result
+
+    def _get_group_ranks(self):
+        """Returns the average rank of the examples in each group of tied
+        examples."""
+        sizes = self.pos_counts + self.neg_counts
+        return numpy.cumsum(sizes) - (sizes - 1) / 2.
+
+    def get_confusion_matrix(self, threshold):
+        """Returns the confusion matrix at a given threshold.
+
+        The outcome corresponding to values larger than or equal to the
+        threshold is assumed to be 1 and the outcome correspondong to
+        values smaller than the threshold is assumed to be zero.
+        """
+        idx = int(numpy.searchsorted(self.scores, threshold, "left"))
+        fn = self.pos_counts[:idx].sum().item()
+        tn = self.neg_counts[:idx].sum().item()
+        return BinaryConfusionMatrix(tp=self.total_positives-fn,
+                                     fp=self.total_negatives-tn,
+                                     fn=fn, tn=tn)
+
+    def get_negative_ranks(self):
+        """Returns the ranks of the negative instances as a NumPy array.
+        Works with integer counts only."""
+        return numpy.repeat(self._get_group_ranks(), self.neg_counts)
+
+    def get_positive_ranks(self):
+        """Returns the ranks of the positive instances as a NumPy array.
+        Works with integer counts only."""
+        return numpy.repeat(self._get_group_ranks(), self.pos_counts)
+
+    def get_score_counts(self):
+        """Returns the distinct predicted values in the dataset along with
+        the number of positive and negative examples having each value,
+        as three NumPy arrays. This does not involve any calculation as
+        the dataset is stored in this form.
+
+        See `BinaryClassifierData.get_score_counts()` for more details.
+        """
+        return self.scores, self.pos_counts, self.neg_counts
+
+
+class BinaryClassifierSketch(AggregatedBinaryClassifierData):
+    """Fixed-memory summary of the output of a binary classifier.
+
+    The sketch divides the interval given by `range` into `bins` bins of
+    equal width and keeps track of the number (or total weight) of
+    positive and negative examples in each bin. Predicted values outside
+    `range` are counted in the first or the last bin. Examples can be
+    added one by one with `add()` or in bulk with `update()`, and sketches
+    with the same binning can be combined with `update_from()` (in place)
+    or `merge()` (into a new sketch); the result does not depend on the
+    order of the operations, so sketches can be built in separate
+    processes and combined later.
+
+    The sketch can be used in place of a `BinaryClassifierData` instance
+    everywhere; it behaves like a dataset where each example has the
+    lower edge of its bin as its predicted value. Confusion matrices
+    calculated at bin edges are therefore exact, while examples in the
+    same bin are treated as ties. In particular, the AUC of a `ROCCurve`
+    calculated from the sketch differs from the exact AUC by at most
+    `auc_error_bound()`.
+
+    This class requires NumPy.
+    """
+
+    def __init__(self, bins=1024, range=(0., 1.), title=None):
+        require_numpy("BinaryClassifierSketch")
+
+        low, high = float(range[0]), float(range[1])
+        if not high > low:
+            raise ValueError("the upper end of the range must be larger "
+                             "than the lower end")
+        bins = int(bins)
+        if bins < 1:
+            raise ValueError("the number of bins must be positive")
+
+        self._title = None
+        self.bins, self.range = bins, (low, high)
+        self._pos_counts = numpy.zeros(bins, dtype=numpy.int64)
+        self._neg_counts = numpy.zeros(bins, dtype=numpy.int64)
+        self._offsets = None
+        self.total_positives, self.total_negatives = 0, 0
+        self.title = title
+
+    def _get_bin_indices(self, scores):
+        """Returns the indices of the bins that the given predicted values
+        belong to."""
+        low, high = self.range
+        indices = numpy.floor((scores - low) * (self.bins / (high - low)))
+        return numpy.clip(indices, 0, self.bins - 1).astype(numpy.intp)
+
+    def _use_weights(self):
+        """Switches the internal counters to floating point so they can
+        hold weights."""
+        if self._pos_counts.dtype != numpy.float64:
+            self._pos_counts = self._pos_counts.astype(numpy.float64)
+            self._neg_counts = self._neg_counts.astype(numpy.float64)
+            self.total_positives = float(self.total_positives)
+            self.total_negatives = float(self.total_negatives)
+
+    def add(self, score, label, weight=None):
+        """Adds a single example to the sketch. `label` is positive if it
+        is larger than zero. `weight` is the weight of the example; if
+        omitted, it counts as one example."""
+        index = int(self._get_bin_indices(numpy.float64(score)))
+        if weight is None:
+            weight = 1
+        else:
+            self._use_weights()
+        if label > 0:
+            self._pos_counts[index] += weight
+            self.total_positives += weight
+        else:
+            self._neg_counts[index] += weight
+            self.total_negatives += weight
+        self._offsets = None
+
+    def update(self, scores, labels, weights=None):
+        """Adds many examples to the sketch at once. `scores`, `labels` and
+        `weights` must be arrays (or objects supporting the buffer
+        protocol) of equal length; see `add()` for their meaning."""
+        scores = numpy.asarray(scores, dtype=numpy.float64)
+        labels = numpy.asarray(labels)
+        if labels.dtype != numpy.bool_:
+            labels = labels > 0
+        if scores.shape != labels.shape:
+            raise ValueError("scores and labels must have the same length")
+
+        indices = self._get_bin_indices(scores)
+        if weights is None:
+            pos_weights, neg_weights = None, None
+        else:
+            self._use_weights()
+            weights = numpy.asarray(weights, dtype=numpy.float64)
+            pos_weights, neg_weights = weights[labels], weights[~labels]
+        pos_counts = numpy.bincount(indices[labels], weights=pos_weights,
+                                    minlength=self.bins)
+        neg_counts = numpy.bincount(indices[~labels], weights=neg_weights,
+                                    minlength=self.bins)
+        self._pos_counts += pos_counts.astype(self._pos_counts.dtype)
+        self._neg_counts += neg_counts.astype(self._neg_counts.dtype)
+        self.total_positives += pos_counts.sum().item()
+        self.total_negatives += neg_counts.sum().item()
+        self._offsets = None
+
+    @classmethod
+    def merge(cls, datasets, title=None):
+        """Merges the given sketches into a new sketch with the same
+        binning and the given title. The sketches must have the same
+        binning."""
+        datasets = list(datasets)
+        if not datasets:
+            raise ValueError("at least one sketch is needed")
+        first = datasets[0]
+        result = cls(bins=first.bins, range=first.range, title=title)
+        return result.update_from(*datasets)
+
+    def update_from(self, *others):
+        """Adds the counts of the given sketches to this sketch. The
+        sketches must have the same binning as this one. Returns this
+        sketch so calls can be chained."""
+        for other in others:
+            if other.bins != self.bins or other.range != self.range:
+                raise ValueError("only sketches with the same binning can "
+                                 "be merged")
+            if other._pos_counts.dtype == numpy.float64:
+                self._use_weights()
+            self._pos_counts += other._pos_counts.astype(self._pos_counts.dtype)
+            self._neg_counts += other._neg_counts.astype(self._neg_counts.dtype)
+            self.total_positives += other.total_positives
+            self.total_negatives += other.total_negatives
+        self._offsets = None
+        return self
+
+    def auc_error_bound(self):
+        """Returns an upper bound on the difference between the ROC AUC
+        calculated from the sketch and the exact ROC AUC of the examples
+        added to the sketch.
+
+        Positive-negative pairs in the same bin are counted as ties, i.e.
+        as half a correctly ranked pair, while the exact calculation would
+        count each such pair as either zero or one. The bound is therefore
+        half the fraction of positive-negative pairs that share a bin.
+        """
+        num_pairs = self.total_positives * self.total_negatives
+        if not num_pairs:
+            return 0.
+        return numpy.dot(self._pos_counts, self._neg_counts).item() / \
+                (2. * num_pairs)
+
+    @property
+    def edges(self):
+        """The lower edges of the bins of the sketch as a NumPy array."""
+        low, high = self.range
+        return low + numpy.arange(self.bins) * ((high - low) / self.bins)
+
+    @property
+    def neg_counts(self):
+        """The number of negative examples in each non-empty bin."""
+        return self._neg_counts[self._get_nonempty_bins()]
+
+    @property
+    def pos_counts(self):
+        """The number of positive examples in each non-empty bin."""
+        return self._pos_counts[self._get_nonempty_bins()]
+
+    @property
+    def scores(self):
+        """The lower edges of the non-empty bins."""
+        return self.edges[self._get_nonempty_bins()]
+
+    def _get_nonempty_bins(self):
+        """Returns a boolean mask selecting the non-empty bins."""
+        return (self._pos_counts + self._neg_counts) > 0
+
+    def get_score_counts(self):
+        """Returns the lower edges of the non-empty bins along with the
+        number of positive and negative examples in each of them, as three
+        NumPy arrays.
+
+        See `BinaryClassifierData.get_score_counts()` for more details.
+        """
+        mask = self._get_nonempty_bins()
+        return self.edges[mask], self._pos_counts[mask], self._neg_counts[mask]
+
+
+class MultiBinaryClassifierData(object):
+    """Predictions of several classifiers for the same set of examples.
+
+    The predicted values are stored in a 2D array with one row per
+    classifier and one column per example, and the expected outcomes are
+    stored only once, in a shared ``bool`` array. Each row is sorted in
+    ascending order upon construction (tied examples keep their original
+    relative order), in batches of rows with a single ``argsort`` call per
+    batch, and the labels are permuted along with the rows.
+
+    Indexing the object (or iterating over it) yields the dataset of each
+    classifier as a `ColumnarBinaryClassifierData` that shares its memory
+    with the matrix, so no further sorting is needed. `get_aucs()` and
+    `get_curves()` evaluate all the classifiers in a single call; the AUCs
+    of ROC and CROC curves are calculated for all the rows at once.
+
+    This class requires NumPy.
+    """
+
+    #: Maximum number of matrix elements processed at once
+    batch_size = 1048576
+
+    def __init__(self, scores, labels, titles=None):
+        """Constructs the dataset from a 2D array of predicted values with
+        one row per classifier and one column per example, and the expected
+        outcomes of the examples. A `labels` entry is positive if it is
+        larger than zero. `titles` may contain the names of the
+        classifiers."""
+        require_numpy("MultiBinaryClassifierData")
+        self._set_scores(numpy.array(scores, dtype=numpy.float64, ndmin=2),
+                         labels, titles)
+
+    @classmethod
+    def from_columns(cls, columns, labels, titles=None):
+        """Constructs the dataset from a list of 1D arrays, each containing
+        the predicted values of one classifier, and the expected outcomes of
+        the examples. The columns are copied into the matrix only once."""
+        require_numpy("MultiBinaryClassifierData")
+        for index, column in enumerate(columns):
+            if len(column) != len(labels):
+                raise ValueError("column %d has %d entries instead of one "
+                                 "per label (%d)" % (index, len(column),
+                                                     len(labels)))
+        result = cls.__new__(cls)
+        result._set_scores(numpy.vstack([numpy.asarray(column,
+                                                       dtype=numpy.float64)
+                                         for column in columns]),
+                           labels, titles)
+        return result
+
+    def _set_scores(self, scores, labels, titles):
+        """Sorts the rows of the given score matrix in place and sets up the
+        sorted label matrix."""
+        labels = numpy.asarray(labels)
+        if labels.dtype != numpy.bool_:
+            labels = labels > 0
+        if scores.ndim != 2 or labels.ndim != 1 or \
+                scores.shape[1] != len(labels):
+            raise ValueError("scores must be a 2D array with one column "
+                             "per label")
+        if titles is None:
+            titles = [None] * scores.shape[0]
+        elif len(titles) != scores.shape[0]:
+            raise ValueError("the number of titles must be equal to the "
+                             "number of rows of the score matrix")
+
+        self.titles = list(titles)
+        self.labels = labels
+        self.total_positives = int(numpy.count_nonzero(labels))
+        self.total_negatives = len(labels) - self.total_positives
+
+        self.scores = scores
+        self.sorted_labels = numpy.empty(scores.shape, dtype=numpy.bool_)
+        for rows in self._iter_row_batches():
+            order = numpy.argsort(scores[rows], axis=1, kind="mergesort")
+            row_indices = numpy.arange(len(order))[:, None]
+            scores[rows] = scores[rows][row_indices, order]
+            self.sorted_labels[rows] = labels[order]
+
+    def __getitem__(self, index):
+        return ColumnarBinaryClassifierData.from_arrays(self.scores[index],
+                self.sorted_labels[index], title=self.titles[index],
+                presorted=True)
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    def __len__(self):
+        return self.scores.shape[0]
+
+    def _iter_row_batches(self):
+        """Yields slices selecting consecutive batches of rows such that each
+        batch has at most `batch_size` elements (or a single row)."""
+        num_rows, num_cols = self.scores.shape
+        step = max(1, self.batch_size // max(num_cols, 1))
+        for start in xrange(0, num_rows, step):
+            yield slice(start, min(start + step, num_rows))
+
+    def get_aucs(self, curve_class, **kwds):
+        """Returns the AUCs of the curves of the given class for all the
+        classifiers, as a NumPy array. Keyword arguments are passed on to
+        the constructor of the curve class. See
+        `BinaryClassifierPerformanceCurve.aucs_from_multi_data()`."""
+        return curve_class.aucs_from_multi_data(self, **kwds)
+
+    def get_curves(self, curve_class, **kwds):
+        """Returns the curves of the given class for all the classifiers, as
+        a list. Keyword arguments are passed on to the constructor of the
+        curve class."""
+        return [curve_class(data, **kwds) for data in self]
+
+    def iter_group_statistics(self):
+        """Yields statistics about the groups of tied examples in batches of
+        rows, for the vectorized AUC calculations. Each item is a tuple
+        containing the slice of the rows in the batch and five 2D arrays,
+        each having one entry for each example (in ascending order of the
+        predicted values in each row):
+
+          - the labels of the examples
+          - the number of negative examples ranked below the group of ties
+            containing the example
+          - the number of positive examples in the group of ties
+          - the number of negative examples in the group of ties
+          - the number of positive examples ranked before the example within
+            its group of ties
+        """
+        num_cols = self.scores.shape[1]
+        indices = numpy.arange(num_cols)
+        for rows in self._iter_row_batches():
+            scores, labels = self.scores[rows], self.sorted_labels[rows]
+            row_indices = numpy.arange(len(scores))[:, None]
+
+            group_starts = numpy.ones(scores.shape, dtype=numpy.bool_)
+            group_starts[:, 1:] = scores[:, 1:] != scores[:, :-1]
+            group_ends = numpy.ones(scores.shape, dtype=numpy.bool_)
+            group_ends[:, :-1] = group_starts[:, 1:]
+            starts = numpy.maximum.accumulate(
+                numpy.where(group_starts, indices, 0), axis=1)
+            ends = numpy.minimum.accumulate(
+                numpy.where(group_ends, indices, num_cols)[:, ::-1],
+                axis=1)[:, ::-1]
+
+            pos_before = numpy.cumsum(labels, axis=1, dtype=numpy.int64)
+            pos_before -= labels
+            pos_before_group = pos_before[row_indices, starts]
+            neg_below = starts - pos_before_group
+            group_pos = pos_before[row_indices, ends] + \
+                    labels[row_indices, ends] - pos_before_group
+            group_neg = ends - starts + 1 - group_pos
+            yield rows, labels, neg_below, group_pos, group_neg, \
+                    pos_before - pos_before_group
@@ -0,0 +1,339 @@
+"""
+Out-of-core dataset support for ``yard``.
+
+This module contains `ExternalBinaryClassifierData`, a variant of
+`yard.data.BinaryClassifierData` for datasets that do not fit into memory.
+The examples are sorted in chunks and written to temporary run files in a
+compact binary format; the runs are then merged on the fly whenever the
+dataset is swept, so the AUC calculations and the confusion matrices at
+given thresholds need a fixed amount of memory no matter how large the
+dataset is.
+
+This module requires NumPy.
+"""
+
+from __future__ import division
+
+import os
+import shutil
+import tempfile
+
+from itertools import islice
+
+from yard.data import BinaryClassifierData, BinaryConfusionMatrix
+from yard.mathematics import numpy, require_numpy
+
+__author__  = "Tamas Nepusz"
+__email__   = "tamas@cs.rhul.ac.uk"
+__copyright__ = "Copyright (c) 2010, Tamas Nepusz"
+__license__ = "MIT"
+
+__all__ = ["ExternalBinaryClassifierData"]
+
+#: Record type of the run files: a little-endian double followed by a byte
+RUN_DTYPE = numpy.dtype([("score", "<f8"), ("label", "u1")]) \
+        if numpy is not None else None
+
+
+def _write_run(scores, labels, path):
+    """Sorts a chunk of examples by score and writes it to the given path
+    as a run file. Returns the number of examples written.
+
+    This function is executed in the worker processes when the chunks are
+    sorted in parallel."""
+    order = numpy.argsort(scores, kind="stable")
+    records = numpy.empty(len(order), dtype=RUN_DTYPE)
+    records["score"] = scores[order]
+    records["label"] = labels[order]
+    records.tofile(path)
+    return len(records)
+
+
+def _aggregate(scores, labels):
+    """Collapses sorted scores and labels into distinct scores with
+    positive and negative counts."""
+    starts = numpy.flatnonzero(numpy.r_[True, scores[1:] != scores[:-1]])
+    sizes = numpy.diff(numpy.r_[starts, len(scores)])
+    pos_counts = numpy.add.reduceat(labels, starts, dtype=numpy.int64)
+    return scores[starts], pos_counts, sizes - pos_counts
+
+
+class ExternalBinaryClassifierData(BinaryClassifierData):
+    """Variant of `BinaryClassifierData` that keeps the examples on disk.
+
+    Examples are added in bulk with `add()` (or from an iterable of
+    ``(score, label)`` pairs with `extend()` or the constructor). They are
+    collected in memory until `chunk_size` examples are available; the
+    chunk is then sorted and written to a run file in a temporary directory,
+    using 9 bytes per example. If `processes` is larger than one, the
+    chunks are sorted and written by a pool of worker processes while the
+    main process keeps on reading the input.
+
+    Sweeping the dataset (`iter_score_counts()`) merges the runs on the fly,
+    reading `block_size` examples from each run at a time, and yields the
+    distinct scores with their positive and negative counts in ascending
+    order. `ROCCurve.auc()` and `CROCCurve.auc()` consume these blocks
+    one by one, and so do `get_confusion_matrix()` and
+    `get_confusion_table()` when explicit thresholds are given, so their
+    memory requirements do not depend on the size of the dataset. Methods
+    that need all the distinct scores at once (`get_score_counts()` and
+    therefore the points of the curves) hold 24 bytes per distinct score
+    in memory.
+
+    The temporary files are removed by `close()`, which is also called
+    when the dataset is used as a context manager or garbage collected.
+
+    This class requires NumPy.
+    """
+
+    def __init__(self, data=None, title=None, chunk_size=10000000,
+                 block_size=65536, processes=1, tmpdir=None):
+        require_numpy("ExternalBinaryClassifierData")
+
+        self._title = None
+        self.chunk_size = int(chunk_size)
+        self.block_size = int(block_size)
+        self.processes = int(processes)
+
+        self._tmpdir = tempfile.mkdtemp(prefix="yard-", dir=tmpdir)
+        self._runs, self._pending_runs = [], []
+        self._buffer, self._buffer_size = [], 0
+        self._pool = None
+        self.total_positives, self.total_negatives = 0, 0
+
+        if data is not None:
+            self.extend(data)
+        self.title = title
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getitem__(self, index):
+        raise TypeError("%s does not support indexing" %
+                        self.__class__.__name__)
+
+    def __len__(self):
+        return self.total_positives + self.total_negatives
+
+    def add(self, scores, labels):
+        """Adds examples to the dataset. `scores` and `labels` must be arrays
+        (or objects supporting the buffer protocol) of equal length. A
+        `labels` entry is positive if it is larger than zero."""
+        scores = numpy.array(scores, dtype=numpy.float64)
+        labels = numpy.asarray(labels)
+        if labels.dtype != numpy.bool_:
+            labels = labels > 0
+        if scores.shape != labels.shape:
+            raise ValueError("scores and labels must have the same length")
+
+        num_pos = int(numpy.count_nonzero(labels))
+        self.total_positives += num_pos
+        self.total_negatives += len(labels) - num_pos
+
+        self._buffer.append((scores, labels.astype(numpy.uint8)))
+        self._buffer_size += len(scores)
+        if self._buffer_size >= self.chunk_size:
+            self._write_buffer()
+
+    def extend(self, data):
+        """Adds examples from an iterable of ``(score, label)`` pairs to
+        the dataset, reading at most `chunk_size` pairs at a time."""
+        iterator = iter(data)
+        while True:
+            chunk = list(islice(iterator, self.chunk_size))
+            if not chunk:
+                break
+            self.add([point[0] for point in chunk],
+                     [point[1] > 0 for point in chunk])
+
+    def close(self):
+        """Shuts down the worker processes and removes the temporary
+        files of the dataset. The dataset cannot be used afterwards."""
+        pool = getattr(self, "_pool", None)
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+            self._pool = None
+        tmpdir = getattr(self, "_tmpdir", None)
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            self._tmpdir = None
+
+    def flush(self):
+        """Writes the examples that are still in memory to a run file and
+        waits for the worker processes to finish writing theirs. This is
+        called automatically before the dataset is swept."""
+        if self._tmpdir is None:
+            raise ValueError("dataset is already closed")
+        if self._buffer:
+            self._write_buffer()
+        for path, result in self._pending_runs:
+            self._runs.append((path, result.get()))
+        self._pending_runs = []
+
+    def _write_buffer(self):
+        """Sorts the examples collected in memory so far and writes them to
+        a new run file, possibly in a worker process."""
+        scores = numpy.concatenate([item[0] for item in self._buffer])
+        labels = numpy.concatenate([item[1] for item in self._buffer])
+        self._buffer, self._buffer_size = [], 0
+
+        path = os.path.join(self._tmpdir, "run%06d.bin" %
+                            (len(self._runs) + len(self._pending_runs)))
+        if self.processes <= 1:
+            self._runs.append((path, _write_run(scores, labels, path)))
+            return
+
+        if self._pool is None:
+            from multiprocessing import Pool
+            self._pool = Pool(self.processes)
+        # Do not let more chunks pile up in memory than we have workers
+        while len(self._pending_runs) >= self.processes:
+            done_path, result = self._pending_runs.pop(0)
+            self._runs.append((done_path, result.get()))
+        self._pending_runs.append((path, self._pool.apply_async(_write_run,
+                                   (scores, labels, path))))
+
+    def _iter_sorted_blocks(self):
+        """Merges the run files and yields sorted blocks of scores and
+        labels. Examples with the same score may be split between two
+        consecutive blocks."""
+        self.flush()
+
+        runs = [numpy.memmap(path, dtype=RUN_DTYPE, mode="r")
+                for path, length in self._runs if length]
+        positions = [0] * len(runs)
+        block_size = self.block_size
+
+        while runs:
+            # Everything up to the smallest of the last scores in the
+            # current windows of the runs can be emitted safely
+            windows = [run[pos:pos+block_size]
+                       for run, pos in zip(runs, positions)]
+            limits = [window["score"][-1]
+                      for window, run, pos in zip(windows, runs, positions)
+                      if pos + len(window) < len(run)]
+            cutoff = min(limits) if limits else None
+
+            scores, labels = [], []
+            for idx, window in enumerate(windows):
+                if cutoff is None:
+                    count = len(window)
+                else:
+                    count = int(numpy.searchsorted(window["score"], cutoff,
+                                                   "right"))
+                scores.append(window["score"][:count])
+                labels.append(window["label"][:count])
+                positions[idx] += count
+
+            scores = numpy.concatenate(scores)
+            labels = numpy.concatenate(labels).astype(numpy.bool_)
+            order = numpy.argsort(scores, kind="stable")
+            yield scores[order], labels[order]
+
+            remaining = [idx for idx, run in enumerate(runs)
+                         if positions[idx] < len(run)]
+            runs = [runs[idx] for idx in remaining]
+            positions = [positions[idx] for idx in remaining]
+
+    def iter_score_counts(self):
+        """Merges the run files and yields the distinct scores of the dataset
+        along with their positive and negative counts, in blocks of NumPy
+        arrays. See `BinaryClassifierData.iter_score_counts()`."""
+        carry = None
+        for scores, labels in self._iter_sorted_blocks():
+            if not len(scores):
+                continue
+            block = _aggregate(scores, labels)
+            if carry is not None:
+                if carry[0][0] == block[0][0]:
+                    # The last group of the previous block continues here
+                    block[1][0] += carry[1][0]
+                    block[2][0] += carry[2][0]
+                else:
+                    yield carry
+            # Hold back the last group as it may continue in the next block
+            yield tuple(item[:-1] for item in block)
+            carry = tuple(item[-1:] for item in block)
+        if carry is not None:
+            yield carry
+
+    @property
+    def data(self):
+        """Returns the dataset as a sorted list of ``(score, bool)`` tuples,
+        just like `BinaryClassifierData.data`. This loads the whole dataset
+        into memory, so avoid it for large datasets."""
+        result = []
+        for scores, labels in self._iter_sorted_blocks():
+            result.extend(zip(scores.tolist(), labels.tolist()))
+        return result
+
+    def get_confusion_matrix(self, threshold):
+        """Returns the confusion matrix at a given threshold, in a single
+        sweep over the dataset."""
+        _, tp, fp, fn, tn = self.get_confusion_table([threshold])
+        return BinaryConfusionMatrix(tp=tp[0], fp=fp[0], fn=fn[0], tn=tn[0])
+
+    def get_confusion_table(self, thresholds=None):
+        """Returns the confusion matrices at several prediction thresholds at
+        once; see `BinaryClassifierData.get_confusion_table()`.
+
+        When explicit thresholds are given, the table is calculated in a
+        single sweep over the dataset without loading it into memory.
+        """
+        if thresholds is None:
+            return super(ExternalBinaryClassifierData, self).\
+                    get_confusion_table()
+
+        if not hasattr(thresholds, "__iter__"):
+            n = float(thresholds)
+            thresholds = [i/n for i in range(thresholds+1)]
+        thresholds = numpy.array(sorted(set(thresholds)), dtype=numpy.float64)
+
+        fns = numpy.zeros(len(thresholds), dtype=numpy.int64)
+        tns = numpy.zeros(len(thresholds), dtype=numpy.int64)
+        for scores, pos_counts, neg_counts in self.iter_score_counts():
+            indices = numpy.searchsorted(scores, thresholds, "left")
+            fns += numpy.r_[0, numpy.cumsum(pos_counts)][indices]
+            tns += numpy.r_[0, numpy.cumsum(neg_counts)][indices]
+        return thresholds, self.total_positives - fns, \
+               self.total_negatives - tns, fns, tns
+
+    def _get_ranks(self, positive):
+        """Returns the ranks of the positive or negative instances, in a
+        single sweep over the dataset."""
+        result, num_seen = [], 0
+        for _, pos_counts, neg_counts in self.iter_score_counts():
+            sizes = pos_counts + neg_counts
+            ranks = numpy.cumsum(sizes) + num_seen - (sizes - 1) / 2.
+            result.append(numpy.repeat(ranks,
+                                       pos_counts if positive else neg_counts))
+            num_seen += sizes.sum()
+        if not result:
+            return numpy.zeros(0)
+        return numpy.concatenate(result)
+
+    def get_negative_ranks(self):
+        """Returns the ranks of the negative instances as a NumPy array."""
+        return self._get_ranks(False)
+
+    def get_positive_ranks(self):
+        """Returns the ranks of the positive instances as a NumPy array."""
+        return self._get_ranks(True)
+
+    def get_score_counts(self):
+        """Returns the distinct predicted values in the dataset along with
+        the number of positive and negative examples having each value, as
+        three NumPy arrays. This merges the runs and keeps the result in
+        memory; use `iter_score_counts()` to process it in blocks."""
+        blocks = list(self.iter_score_counts())
+        if not blocks:
+            return numpy.zeros(0), numpy.zeros(0, dtype=numpy.int64), \
+                   numpy.zeros(0, dtype=numpy.int64)
+        return tuple(numpy.concatenate(parts) for parts in zip(*blocks))
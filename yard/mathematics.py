@@ -21,6 +21,36 @@ except NameError:
 
 #############################################################################
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+#: Whether the random generators of NumPy 1.17 or later
+#: (`numpy.random.default_rng` and `numpy.random.SeedSequence`) are available
+has_random_generators = numpy is not None and \
+        hasattr(numpy.random, "SeedSequence")
+
+
+def require_numpy(feature):
+    """Raises ``ImportError`` if NumPy is not available. `feature` is a
+    human-readable description of the feature that needs NumPy; it will
+    be used in the error message."""
+    if numpy is None:
+        raise ImportError("%s requires NumPy" % feature)
+
+
+def require_random_generators(feature):
+    """Raises ``ImportError`` if the random generators of NumPy 1.17 or
+    later are not available. `feature` is a human-readable description of
+    the feature that needs them; it will be used in the error message."""
+    require_numpy(feature)
+    if not has_random_generators:
+        raise ImportError("%s requires NumPy 1.17 or later" % feature)
+
+#############################################################################
+
 try:
     from numpy.random import geometric
 except ImportError:
@@ -0,0 +1,186 @@
+"""
+Evaluating many classifiers in parallel with a pool of worker processes.
+
+The predictions of the classifiers are arranged in a matrix with one row per
+classifier. The rows are split into blocks, and each block is sorted and
+evaluated by a worker process. The matrix and the expected outcomes are
+copied into shared memory once (if `multiprocessing.shared_memory` is
+available; see `yard.sharedmem`), so the workers only receive the name of
+the shared memory block instead of a pickled copy of the arrays.
+
+`run_tasks()` is the generic helper that distributes independent tasks
+among the worker processes, and `worker_pool()` creates a pool that can be
+reused by several calls to it; they are also used by `yard.significance`.
+
+This module requires NumPy.
+"""
+
+import multiprocessing
+
+from contextlib import contextmanager
+from yard.curve import BinaryClassifierPerformanceCurve, CurveBundle
+from yard.data import MultiBinaryClassifierData
+from yard.mathematics import numpy, require_numpy
+from yard.sharedmem import SharedArrays, shared_memory
+
+try:
+    xrange
+except NameError:
+    xrange = range
+
+__author__  = "Tamas Nepusz"
+__email__   = "tamas@cs.rhul.ac.uk"
+__copyright__ = "Copyright (c) 2010, Tamas Nepusz"
+__license__ = "MIT"
+
+__all__ = ["calculate_aucs", "run_tasks", "worker_pool"]
+
+#: Number of blocks per worker process that the rows of the score matrix
+#: are split into; more blocks balance the load better
+BLOCKS_PER_JOB = 4
+
+
+def calculate_aucs(scores, labels, curve_classes, jobs=None):
+    """Calculates the AUCs of the curves of the given classes for several
+    classifiers evaluated on the same examples.
+
+    `scores` is a 2D array with one row per classifier and one column per
+    example, or a list of 1D arrays, one for each classifier. `labels`
+    contains the expected outcomes of the examples; an entry is positive if
+    it is larger than zero, and each classifier must have one predicted
+    value for each entry. `curve_classes` is a list of subclasses of
+    `BinaryClassifierPerformanceCurve`. `jobs` is the number of worker
+    processes to use; ``None`` means one for each CPU, and 1 evaluates the
+    classifiers in the current process.
+
+    Returns a list containing a NumPy array for each curve class, with the
+    AUCs of the classifiers in the order of the rows of `scores`. The
+    results do not depend on the number of worker processes.
+    """
+    require_numpy("Parallel AUC calculation")
+
+    labels = numpy.asarray(labels) > 0
+    for row, column in enumerate(scores):
+        if len(column) != len(labels):
+            raise ValueError("row %d of the scores has %d entries instead "
+                             "of one per label (%d)" % (row, len(column),
+                                                        len(labels)))
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+
+    if jobs <= 1 or len(scores) <= 1:
+        if isinstance(scores, numpy.ndarray):
+            data = MultiBinaryClassifierData(scores, labels)
+        else:
+            data = MultiBinaryClassifierData.from_columns(scores, labels)
+        return _calculate_aucs_of_data(data, curve_classes)
+
+    num_rows = len(scores)
+    step = -(-num_rows // (jobs * BLOCKS_PER_JOB))
+    blocks = [(start, min(start + step, num_rows))
+              for start in xrange(0, num_rows, step)]
+
+    source = _share_arrays(scores, labels)
+    try:
+        parts = run_tasks(_calculate_aucs_of_block,
+                          [(source, start, end, curve_classes)
+                           for start, end in blocks], jobs)
+    finally:
+        if isinstance(source, SharedArrays):
+            source.close()
+
+    return [numpy.concatenate([part[idx] for part in parts])
+            for idx in xrange(len(curve_classes))]
+
+
+def run_tasks(func, tasks, jobs, pool=None):
+    """Calls `func` with each tuple of arguments in `tasks` and returns the
+    results in the order of the tasks. If `pool` is given, the calls are
+    distributed among its worker processes, and the pool is left running.
+    Otherwise, if `jobs` is larger than one, the calls are distributed among
+    a pool of at most `jobs` worker processes, which is shut down before the
+    function returns."""
+    if pool is None:
+        if jobs <= 1 or len(tasks) <= 1:
+            return [func(*args) for args in tasks]
+        with worker_pool(min(jobs, len(tasks))) as pool:
+            return run_tasks(func, tasks, jobs, pool)
+
+    pending = [pool.apply_async(func, args) for args in tasks]
+    return [result.get() for result in pending]
+
+
+@contextmanager
+def worker_pool(jobs):
+    """Context manager that yields a `multiprocessing.Pool` with `jobs`
+    worker processes and shuts it down on exit. Pass the pool to
+    `run_tasks()` to use the same worker processes for several batches of
+    tasks."""
+    pool = multiprocessing.Pool(jobs)
+    try:
+        yield pool
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _calculate_aucs_of_data(data, curve_classes):
+    """Calculates the AUCs of the curves of the given classes for all the
+    classifiers in a `MultiBinaryClassifierData` instance. Curve classes
+    that can evaluate all the classifiers at once do so; the curves of the
+    other classes are calculated from a `CurveBundle` for each classifier,
+    one classifier at a time."""
+    result, others = [], []
+    default = BinaryClassifierPerformanceCurve.aucs_from_multi_data.__func__
+    for curve_class in curve_classes:
+        if curve_class.aucs_from_multi_data.__func__ is not default:
+            result.append(data.get_aucs(curve_class))
+        else:
+            result.append(numpy.empty(len(data)))
+            others.append((curve_class, result[-1]))
+
+    if others:
+        for row, dataset in enumerate(data):
+            bundle = CurveBundle(dataset)
+            for curve_class, aucs in others:
+                aucs[row] = bundle.get_curve(curve_class).auc()
+    return result
+
+
+def _calculate_aucs_of_block(source, start, end, curve_classes):
+    """Worker function that calculates the AUCs of the classifiers in the
+    given range of rows of the score matrix in `source`."""
+    if isinstance(source, SharedArrays):
+        try:
+            data = MultiBinaryClassifierData(source["scores"][start:end],
+                                             numpy.array(source["labels"]))
+        finally:
+            source.close()
+    else:
+        scores, labels = source
+        data = MultiBinaryClassifierData(scores[start:end], labels)
+    return _calculate_aucs_of_data(data, curve_classes)
+
+
+def _share_arrays(scores, labels):
+    """Copies the score matrix (or list of score columns) and the labels
+    into a new shared memory block and returns the `SharedArrays` instance
+    that owns the block. If shared memory is not available, the arrays
+    themselves are returned instead."""
+    if shared_memory is None:
+        return numpy.asarray(scores), labels
+
+    num_rows, num_cols = len(scores), len(labels)
+    result = SharedArrays.allocate([("scores", (num_rows, num_cols),
+                                     numpy.float64),
+                                    ("labels", num_cols, numpy.bool_)])
+    try:
+        matrix = result["scores"]
+        for idx in xrange(num_rows):
+            matrix[idx] = scores[idx]
+        result["labels"][:] = labels
+        del matrix
+    except:
+        result.close()
+        raise
+    return result
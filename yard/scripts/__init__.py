@@ -12,12 +12,21 @@ scripts, such as:
 """
 
 import logging
+import os
 import sys
 
-from collections import defaultdict
+from collections import defaultdict, deque
+from itertools import chain, islice
 from optparse import OptionParser
 from textwrap import dedent
 
+from yard.curve import CurveBundle
+from yard.data import BinaryClassifierData, ColumnarBinaryClassifierData, \
+        MultiBinaryClassifierData
+from yard.mathematics import numpy
+from yard.tabular import TabularReader, decompress_stream, open_input, \
+        read_range, split_file
+
 try:
     xrange
 except NameError:
@@ -99,10 +108,15 @@ class CommandLineAppForClassifierData(CommandLineApp):
     flat files containing classifier outputs in columns.
     """
 
+    #: The minimum size of the parts of an input file that are parsed in
+    #: parallel when ``--jobs`` is given
+    min_range_size = 16777216
+
     def __init__(self):
         super(CommandLineAppForClassifierData, self).__init__()
         self.cols, self.sep = None, None
         self.data = defaultdict(list)
+        self.external_data = {}
 
     def add_parser_options(self):
         """Adds the usual command line parse options for command line scripts
@@ -122,6 +136,28 @@ class CommandLineAppForClassifierData(CommandLineApp):
                 help="use the given separator CHARacter between columns. "\
                      "If omitted, all whitespace characters are separators.",
                 default=None)
+        parser.add_option("-j", "--jobs", dest="jobs", metavar="N",
+                type=int, default=1,
+                help="use N worker processes. Large input files are "\
+                     "split into parts that are parsed in parallel, "\
+                     "--out-of-core sorts the chunks in parallel, and "\
+                     "yard-auc also sorts and evaluates the datasets in "\
+                     "parallel. Default: %default")
+        parser.add_option("--out-of-core", dest="out_of_core",
+                action="store_true", default=False,
+                help="keep the datasets in sorted temporary files instead "\
+                     "of memory. Use this for inputs that do not fit into "\
+                     "memory.")
+        parser.add_option("--chunk-size", dest="chunk_size", metavar="ROWS",
+                type=int, default=10000000,
+                help="number of rows to keep in memory at once when "\
+                     "--out-of-core is used. Default: %default")
+        parser.add_option("--cache", dest="cache", action="store_true",
+                default=False,
+                help="save the parsed columns of each input file to a "\
+                     "binary sidecar file (FILE.yardcache) and use the "\
+                     "sidecar instead of parsing the file again as long as "\
+                     "the input file is not modified. Requires NumPy.")
 
     @staticmethod
     def parse_column_indices(indices):
@@ -173,88 +209,376 @@ class CommandLineAppForClassifierData(CommandLineApp):
 
     def process_file(self, stream):
         """Processes the given input `stream` and stores the results in
-        `self.data`, which must be a ``defaultdict(list)``"""
+        `self.data`, which must be a ``defaultdict(list)``. The stream is
+        parsed in large blocks by a `yard.tabular.TabularReader`. Returns
+        the header row of the stream (with empty names for the unnamed
+        columns) and the names of the columns that were filled from the
+        stream, or ``None`` if the stream is empty."""
 
         if self.cols is None and self.sep is None:
             self.process_options()
 
-        cols, sep = self.cols, self.sep
-        seen_header = False
-
-        if cols is not None:
-            # Prepare ncols and headers in advance here
-            ncols = len(cols)
-            headers = ["Dataset %d" % idx for idx in xrange(ncols)]
-            headers[0] = "__class__"
+        reader = TabularReader(sep=self.sep, cols=self.cols)
+        blocks = reader.read(stream)
+        first_block = next(blocks, None)
+        if first_block is None:
+            return None
+
+        headers = self.get_dataset_names(reader.headers)
+        self.store_column_blocks(headers, chain([first_block], blocks))
+        return reader.headers, headers
+
+    def process_file_parallel(self, path, reader, results):
+        """Stores the columns of a file that was split into byte ranges and
+        parsed by worker processes (see `process_input_files()`) in
+        `self.data`. `reader` is the `TabularReader` that read the header of
+        the file and `results` is an iterator yielding the columns parsed
+        from the consecutive ranges. Returns the same as `process_file()`."""
+        if reader.headers is None:
+            return None
+        headers = self.get_dataset_names(reader.headers)
+        self.store_column_blocks(headers, (columns for columns in results
+                                           if columns is not None))
+        return reader.headers, headers
+
+    def store_column_blocks(self, headers, blocks):
+        """Appends blocks of columns (as returned by a `TabularReader`) to
+        the columns of `self.data` with the given names. In out-of-core mode,
+        the columns are moved to the out-of-core datasets whenever
+        ``--chunk-size`` rows have been collected."""
+        if self.options.out_of_core:
+            chunk_size = self.options.chunk_size
+        else:
+            chunk_size = None
+
+        chunks, num_rows = [], 0
+        for columns in blocks:
+            chunks.append(columns)
+            num_rows += len(columns[0])
+            if chunk_size and num_rows >= chunk_size:
+                self.add_column_chunks(headers, chunks)
+                self.flush_out_of_core_data()
+                chunks, num_rows = [], 0
+
+        if chunks:
+            self.add_column_chunks(headers, chunks)
+
+    def get_dataset_names(self, headers):
+        """Replaces the empty column names of a header row with unique
+        dataset names (``Dataset 1``, ``Dataset 2`` and so on)."""
+        headers = list(headers)
+        anon_dataset_idx = 1
+        for idx, header in enumerate(headers):
+            if not header:
+                while ("Dataset %d" % anon_dataset_idx) in self.data or \
+                        ("Dataset %d" % anon_dataset_idx) in headers:
+                    anon_dataset_idx += 1
+                headers[idx] = "Dataset %d" % anon_dataset_idx
+        return headers
+
+    def add_column_chunks(self, headers, chunks):
+        """Joins the blocks of columns returned by a `TabularReader` and
+        appends them to the columns of `self.data` with the given names."""
+        columns = []
+        for idx in xrange(len(headers)):
+            parts = [chunk[idx] for chunk in chunks]
+            if numpy is not None:
+                columns.append(numpy.concatenate(parts) if len(parts) > 1
+                               else parts[0])
+            else:
+                columns.append([value for part in parts for value in part])
+        self.add_columns(headers, columns)
 
-        for line in stream:
-            line = line.strip()
-            if not line:
-                continue
+    def process_binary_file(self, path):
+        """Processes a binary input file (see `yard.columnfile`) and stores
+        the columns found in it in `self.data`. The columns are memory-mapped
+        if the format of the file allows it. Returns the names of the
+        columns that were filled from the file. Only the columns selected
+        with ``-c`` are read."""
+        from yard.columnfile import read_columns
 
-            parts = line.split(sep)
-            if not parts:
-                continue
+        if self.cols is None and self.sep is None:
+            self.process_options()
 
-            if not seen_header:
-                # This is either a header row or a data row
-                if cols is None:
-                    colidx = 0
-                else:
-                    colidx = cols[0]
-
-                try:
-                    int(float(parts[colidx]))
-                except (IndexError, ValueError):
-                    # This is surely a header row
-                    seen_header = True
-                    if cols is None:
-                        # Prepare ncols now that we know the header
-                        cols = range(len(parts))
-                        ncols = len(parts)
-                        headers = list(parts)
-                        headers[0] = "__class__"
-                    else:
-                        headers[1:] = [parts[idx] for idx in cols[1:]]
-                    anon_dataset_idx = 1
-
-                    # Add dataset names for empty headers
-                    for idx, header in enumerate(headers):
-                        if not header:
-                            while ("Dataset %d" % anon_dataset_idx) in self.data:
-                                anon_dataset_idx += 1
-                            headers[idx] = "Dataset %d" % anon_dataset_idx
-                    continue
+        try:
+            names, columns, _ = read_columns(path, self.cols)
+        except (ImportError, IndexError) as ex:
+            self.error(str(ex))
 
-                # This is a data row; there will be no header row. Set up the
-                # dataset names for all the columns if we did not specify
-                # columns in the input file
-                if cols is None:
-                    cols = range(len(parts))
-                    ncols = len(parts)
-                    headers = ["Dataset %d" % idx for idx in xrange(ncols)]
-                    headers[0] = "__class__"
+        if names is None:
+            headers = ["Dataset %d" % idx for idx in xrange(len(columns))]
+        else:
+            headers = list(names)
+        headers[0] = "__class__"
+        self.add_columns(headers, columns)
+        return headers
+
+    def add_columns(self, headers, columns):
+        """Appends the given columns (arrays, or lists if NumPy is not
+        installed) to the columns of `self.data` with the given names.
+        Columns that are not in `self.data` yet are stored without
+        copying."""
+        for header, column in zip(headers, columns):
+            existing = self.data.get(header)
+            if numpy is None:
+                self.data[header].extend(column)
+            elif existing is None or len(existing) == 0:
+                self.data[header] = column
+            else:
+                self.data[header] = numpy.concatenate([existing, column])
 
-            # This is a data row
-            for i in xrange(ncols):
-                self.data[headers[i]].append(float(parts[cols[i]]))
+    @staticmethod
+    def get_cache_path(path):
+        """Returns the path of the sidecar cache file of the given input
+        file."""
+        return path + ".yardcache"
+
+    def get_cache_key(self, path):
+        """Returns the metadata that must be stored in the sidecar cache of
+        the given input file. The cache is valid only if the metadata stored
+        in it is equal to the current one."""
+        stat = os.stat(path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime,
+                "sep": self.sep, "columns": self.cols}
+
+    def is_cache_valid(self, path):
+        """Returns whether the sidecar cache of the given input file exists
+        and is up to date."""
+        from yard.columnfile import read_header
+
+        cache_path = self.get_cache_path(path)
+        if not os.path.exists(cache_path):
+            return False
+
+        try:
+            header, _ = read_header(cache_path)
+        except (IOError, ValueError, KeyError):
+            self.log.warning("Ignoring corrupted cache file %s" % cache_path)
+            return False
+        if header.get("metadata") != self.get_cache_key(path):
+            self.log.info("Cache file %s is out of date" % cache_path)
+            return False
+        return True
+
+    def read_cache(self, path):
+        """Loads the columns of the given input file from its sidecar cache
+        into `self.data`. Returns ``True`` if the cache was valid and
+        ``False`` otherwise. The cache stores the header row of the file, so
+        the unnamed columns get their dataset names here, just like when
+        the file itself is read."""
+        from yard.columnfile import read_columns
+
+        if not self.is_cache_valid(path):
+            return False
+
+        cache_path = self.get_cache_path(path)
+        self.log.info("Using cache file %s..." % cache_path)
+        names, columns, _ = read_columns(cache_path)
+        self.add_columns(self.get_dataset_names(names), columns)
+        return True
+
+    def write_cache(self, path, names, headers, lengths):
+        """Writes the columns with the given `headers` to the sidecar cache
+        of the given input file. `names` is the header row of the file (with
+        empty names for the unnamed columns); it is stored in the cache
+        instead of `headers`, since the dataset names given to the unnamed
+        columns depend on the files read before. `lengths` maps the column
+        names to the lengths of the columns before the input file was
+        processed; only the part of the columns after these lengths is
+        written."""
+        from yard.columnfile import write_columns
+
+        cache_path = self.get_cache_path(path)
+        columns = [self.data[header][lengths.get(header, 0):]
+                   for header in headers]
+        try:
+            write_columns(cache_path, names, columns,
+                          metadata=self.get_cache_key(path))
+        except (IOError, OSError) as ex:
+            self.log.warning("Cannot write cache file %s: %s" %
+                             (cache_path, ex))
+
+    def flush_out_of_core_data(self):
+        """Moves the rows collected in `self.data` so far to the out-of-core
+        datasets in `self.external_data`, leaving empty columns in
+        `self.data`. Used when ``--out-of-core`` is given on the command
+        line."""
+        from yard.external import ExternalBinaryClassifierData
+
+        for key in self.data:
+            if key == "__class__":
+                continue
+            if key not in self.external_data:
+                self.external_data[key] = ExternalBinaryClassifierData(
+                        title=key, chunk_size=self.options.chunk_size,
+                        processes=self.options.jobs)
+            self.external_data[key].add(*self.get_paired_columns(key))
+        for key, column in list(self.data.items()):
+            if isinstance(column, list):
+                del column[:]
+            else:
+                self.data[key] = []
+
+    def get_paired_columns(self, key):
+        """Returns the column with the given `key` in the input files and
+        the expected outcomes in the ``__class__`` column, truncated to
+        their common length. The two differ in length if some of the input
+        files do not have the given column; the predictions are then paired
+        with the expected outcomes in the order they were read."""
+        observed, expected = self.data[key], self.data["__class__"]
+        if len(observed) != len(expected):
+            length = min(len(observed), len(expected))
+            observed, expected = observed[:length], expected[:length]
+        return observed, expected
+
+    def has_aligned_columns(self, keys):
+        """Returns whether the columns with the given `keys` in the input
+        files are all as long as the ``__class__`` column, i.e. whether they
+        can be stored in a single score matrix sharing the expected
+        outcomes."""
+        length = len(self.data["__class__"])
+        return all(len(self.data[key]) == length for key in keys)
+
+    def create_dataset(self, key):
+        """Returns a `BinaryClassifierData` instance for the column with the
+        given `key` in the input files, paired with the expected outcomes
+        in the ``__class__`` column (see `get_paired_columns()`)."""
+        if key in self.external_data:
+            return self.external_data[key]
+        observed, expected = self.get_paired_columns(key)
+        if numpy is not None:
+            return ColumnarBinaryClassifierData.from_arrays(observed, expected,
+                                                            title=key)
+        return BinaryClassifierData(zip(observed, expected), title=key)
+
+    def create_multi_dataset(self, keys):
+        """Returns a `MultiBinaryClassifierData` instance containing the
+        columns with the given `keys` in the input files, sharing the
+        expected outcomes in the ``__class__`` column. Returns ``None`` if
+        NumPy is not installed, the columns are kept out of core or they
+        are not aligned (see `has_aligned_columns()`); use
+        `create_dataset()` for each column in this case."""
+        if numpy is None or any(key in self.external_data for key in keys) \
+                or not self.has_aligned_columns(keys):
+            return None
+        return MultiBinaryClassifierData.from_columns(
+                [self.data[key] for key in keys], self.data["__class__"],
+                titles=keys)
+
+    def create_curve_bundles(self, keys):
+        """Returns a list of `CurveBundle` instances, one for each column
+        with the given `keys` in the input files. The datasets are sorted
+        only once (all at once if possible) and the bundles can be used to
+        calculate curves of any type from them. Columns kept out of core are
+        not collapsed into memory by their bundles."""
+        datasets = self.create_multi_dataset(keys)
+        if datasets is None:
+            datasets = (self.create_dataset(key) for key in keys)
+        return [CurveBundle(dataset, aggregate=key not in self.external_data)
+                for key, dataset in zip(keys, datasets)]
 
     def process_input_files(self):
         """Processes all the input files passed in the positional command
-        line arguments."""
+        line arguments.
+
+        Text input files compressed with gzip, bzip2 or xz are decompressed
+        on the fly. If ``--jobs`` is larger than one, the uncompressed text
+        input files are split into byte ranges of complete lines, which are
+        parsed by a pool of worker processes along with the compressed
+        files. The columns are still stored in the order of the rows in the
+        input files."""
+
+        from yard.columnfile import detect_format
 
         if not self.args:
             self.args = ["-"]
 
+        if self.options.cache and numpy is None:
+            self.log.warning("NumPy is not installed, --cache is ignored")
+            self.options.cache = False
+        if self.cols is None and self.sep is None:
+            self.process_options()
+
+        # Find out what to do with each input
+        inputs = []
         for arg in self.args:
             if arg == "-":
-                handle = sys.stdin
-                arg = "standard input"
+                inputs.append((arg, "stdin", None))
+            elif detect_format(arg) is not None:
+                inputs.append((arg, "binary", None))
+            elif self.options.cache and self.is_cache_valid(arg):
+                inputs.append((arg, "cache", None))
+            elif self.options.jobs > 1:
+                reader = TabularReader(sep=self.sep, cols=self.cols)
+                ranges = split_file(arg, reader, self.options.jobs,
+                                    self.min_range_size)
+                inputs.append((arg, "parallel", (reader, ranges)))
             else:
-                handle = open(arg)
-            self.log.info("Processing %s..." % arg)
-            self.process_file(handle)
+                inputs.append((arg, "text", None))
+
+        tasks = [(arg, start, end, reader.sep, reader.cols, reader.headers,
+                  reader.project)
+                 for arg, kind, (reader, ranges) in
+                     (item for item in inputs if item[1] == "parallel")
+                 for start, end in ranges]
+        pool, results = None, None
+        if tasks:
+            from multiprocessing import Pool
+            pool = Pool(self.options.jobs)
+            results = imap_bounded(pool, read_range, tasks,
+                                   2 * self.options.jobs)
+
+        try:
+            for arg, kind, extra in inputs:
+                if kind == "stdin":
+                    self.log.info("Processing standard input...")
+                    stdin = getattr(sys.stdin, "buffer", sys.stdin)
+                    self.process_file(decompress_stream(stdin))
+                    continue
+                if kind == "binary":
+                    self.log.info("Processing %s..." % arg)
+                    self.process_binary_file(arg)
+                    continue
+                if kind == "cache":
+                    self.read_cache(arg)
+                    continue
+
+                self.log.info("Processing %s..." % arg)
+                lengths = dict((key, len(column))
+                               for key, column in self.data.items())
+                if kind == "parallel":
+                    reader, ranges = extra
+                    result = self.process_file_parallel(arg, reader,
+                            islice(results, len(ranges)))
+                else:
+                    with open_input(arg) as handle:
+                        result = self.process_file(handle)
+                # Out-of-core mode flushes the columns while the file is read
+                if self.options.cache and not self.options.out_of_core \
+                        and result:
+                    names, headers = result
+                    self.write_cache(arg, names, headers, lengths)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
 
         if len(self.data) == 0:
             self.parser.error("No data columns in input file")
 
+        if self.options.out_of_core:
+            self.flush_out_of_core_data()
+
+
+def imap_bounded(pool, func, tasks, window):
+    """Applies `func` to each tuple of arguments in `tasks` in the given
+    process pool and yields the results in order, just like ``pool.imap``,
+    but keeps at most `window` tasks in flight so the results do not pile
+    up in memory when they are consumed slowly."""
+    pending = deque()
+    for args in tasks:
+        pending.append(pool.apply_async(func, args))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
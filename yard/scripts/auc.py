@@ -3,8 +3,10 @@
 
 import sys
 
-from yard.data import BinaryClassifierData
+from yard.bootstrap import bootstrap_aucs, percentile_interval
 from yard.curve import CurveFactory
+from yard.mathematics import has_random_generators, numpy
+from yard.parallel import calculate_aucs
 from yard.scripts import CommandLineAppForClassifierData
 
 __author__  = "Tamas Nepusz"
@@ -23,7 +25,9 @@ class AUCCalculatorApplication(CommandLineAppForClassifierData):
     being the expected class (1 for positive examples, -1 for negatives),
     the second being the prediction itself. You can also use the -c switch
     to use different column indices and multiple datasets. Columns are
-    separated by whitespace per default.\
+    separated by whitespace per default. The AUCs of many datasets can be
+    calculated in parallel with the -j switch. Bootstrap confidence
+    intervals of the AUCs can be requested with the --ci switch.\
     """
 
     short_name = "yard-auc"
@@ -43,6 +47,28 @@ class AUCCalculatorApplication(CommandLineAppForClassifierData):
                 help="sets the TYPE of the curve to be plotted "
                      "(roc, pr, ac, sespe or croc). May be specified "
                      "multiple times.")
+        parser.add_option("--ci", dest="ci", action="store_true",
+                default=False,
+                help="also calculate bootstrap confidence intervals of "
+                     "the AUCs (requires NumPy 1.17 or later)")
+        parser.add_option("--ci-level", dest="ci_level", metavar="LEVEL",
+                type=float, default=0.95,
+                help="use the given confidence LEVEL for the confidence "
+                     "intervals. Default: %default")
+        parser.add_option("--replicates", dest="num_replicates",
+                metavar="N", type=int, default=1000,
+                help="use N bootstrap replicates for the confidence "
+                     "intervals. Default: %default")
+        parser.add_option("--bootstrap-method", dest="bootstrap_method",
+                metavar="METHOD", choices=("multinomial", "poisson"),
+                default="multinomial",
+                help="draw the bootstrap replicates with the given METHOD "
+                     "(multinomial or poisson). Default: %default")
+        parser.add_option("--seed", dest="seed", metavar="SEED", type=int,
+                default=None,
+                help="seed the random number generator of the bootstrap "
+                     "with SEED to make the confidence intervals "
+                     "reproducible")
 
     def run_real(self):
         """Runs the main application"""
@@ -58,32 +84,73 @@ class AUCCalculatorApplication(CommandLineAppForClassifierData):
                 curve_classes.append(CurveFactory.find_class_by_name(name))
             except ValueError:
                 self.parser.error("Unknown curve type: %s" % name)
+        if self.options.ci:
+            if not has_random_generators:
+                self.parser.error("--ci requires NumPy 1.17 or later")
+            if not 0 < self.options.ci_level < 1:
+                self.parser.error("the confidence level must be between "
+                                  "0 and 1")
 
         self.process_input_files()
-        for curve_class in curve_classes:
-            self.print_scores_for_curve(curve_class)
 
-    def print_scores_for_curve(self, curve_class):
-        """Calculates AUC scores for curves given by `curve_class` for all
-        the data in `self.data`.
+        keys = sorted(self.data.keys())
+        keys.remove("__class__")
+
+        if numpy is not None and not self.external_data and \
+                self.has_aligned_columns(keys):
+            # Sort and evaluate the columns in parallel if needed
+            aucs = calculate_aucs([self.data[key] for key in keys],
+                                  self.data["__class__"], curve_classes,
+                                  jobs=self.options.jobs)
+        else:
+            bundles = self.create_curve_bundles(keys)
+            aucs = [[] for _ in curve_classes]
+            for bundle in bundles:
+                for curve_class, curve_aucs in zip(curve_classes, aucs):
+                    curve_aucs.append(bundle.get_curve(curve_class).auc())
+
+        intervals = [None] * len(curve_classes)
+        if self.options.ci:
+            intervals = zip(*[self.get_confidence_intervals(key,
+                                                            curve_classes)
+                              for key in keys])
+
+        for curve_class, curve_aucs, curve_intervals in \
+                zip(curve_classes, aucs, intervals):
+            self.print_scores_for_curve(curve_class, keys, curve_aucs,
+                                        curve_intervals)
+
+    def get_confidence_intervals(self, key, curve_classes):
+        """Returns the bootstrap confidence intervals of the AUCs of the
+        curves of the given classes for the dataset with the given key, as
+        a list of ``(lower, upper)`` pairs."""
+        self.log.info("Bootstrapping %s..." % key)
+        replicates = bootstrap_aucs(self.create_dataset(key), curve_classes,
+                num_replicates=self.options.num_replicates,
+                method=self.options.bootstrap_method,
+                seed=self.options.seed, jobs=self.options.jobs)
+        return [percentile_interval(values, self.options.ci_level)
+                for values in replicates]
+
+    def print_scores_for_curve(self, curve_class, keys, aucs,
+                               intervals=None):
+        """Prints the AUC scores of the curves given by `curve_class` for
+        all the datasets.
 
         `curve_class` is a subclass of `BinaryClassifierPerformanceCurve`.
-        `self.data` must be a dict of lists, and the ``__class__`` key of
-        `self.data` must map to the expected classes of elements.
+        `keys` are the names of the datasets and `aucs` contains the
+        corresponding AUC scores. `intervals` may contain the corresponding
+        confidence intervals as ``(lower, upper)`` pairs.
         """
-        data = self.data
-        expected = data["__class__"]
-
-        keys = sorted(data.keys())
-        keys.remove("__class__")
-
         print("Calculating AUCs for %s..." % curve_class.get_friendly_name())
-        for key in keys:
-            observed = data[key]
-
-            bc_data = BinaryClassifierData(zip(observed, expected), title=key)
-            auc = curve_class(bc_data).auc()
-            print("  AUC[%s] = %.4f" % (key, auc))
+        if intervals is None:
+            for key, auc in zip(keys, aucs):
+                print("  AUC[%s] = %.4f" % (key, auc))
+        else:
+            percent = 100 * self.options.ci_level
+            for key, auc, (lower, upper) in zip(keys, aucs, intervals):
+                print("  AUC[%s] = %.4f   %g%% CI: [%.4f, %.4f]" %
+                      (key, auc, percent, lower, upper))
         print("")
 
 def main():
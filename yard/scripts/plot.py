@@ -14,7 +14,6 @@ try:
 except NameError:
     xrange = range
 
-from yard.data import BinaryClassifierData
 from yard.curve import CurveFactory
 from yard.scripts import CommandLineAppForClassifierData
 from yard.utils import parse_size
@@ -140,41 +139,36 @@ class ROCPlotterApplication(CommandLineAppForClassifierData):
 
         self.process_input_files()
 
+        keys = sorted(self.data.keys())
+        keys.remove("__class__")
+        bundles = self.create_curve_bundles(keys)
+
         self.log.info("Plotting results...")
         for curve_class in curve_classes:
-            fig = self.get_figure_for_curves(curve_class)
+            fig = self.get_figure_for_curves(curve_class, keys, bundles)
             figure_saver(fig)
 
         # For multi-page output, we have to close it explicitly
         if pp is not None:
             pp.close()
 
-    def get_figure_for_curves(self, curve_class):
-        """Plots curves given by `curve_class` for all the data in `self.data`.
-        `curve_class` is a subclass of `BinaryClassifierPerformanceCurve`.
-        `self.data` must be a dict of lists, and the ``__class__`` key of
-        `self.data` must map to the expected classes of elements. Returns an
-        instance of `matplotlib.figure.Figure`."""
+    def get_figure_for_curves(self, curve_class, keys, bundles):
+        """Plots curves given by `curve_class` for all the datasets in
+        `bundles`. `curve_class` is a subclass of
+        `BinaryClassifierPerformanceCurve`, `keys` are the names of the
+        datasets and `bundles` is a list of `CurveBundle` instances, one for
+        each dataset. Returns an instance of `matplotlib.figure.Figure`."""
         fig, axes = None, None
 
-        data = self.data
-        expected = data["__class__"]
-
-        keys = sorted(data.keys())
-        keys.remove("__class__")
-
         styles = ["r-",  "b-",  "g-",  "c-",  "m-",  "y-",  "k-", \
                   "r--", "b--", "g--", "c--", "m--", "y--", "k--"]
 
         # Plot the curves
         line_handles, labels, aucs = [], [], []
-        for key, style in izip(keys, cycle(styles)):
+        for key, bundle, style in izip(keys, bundles, cycle(styles)):
             self.log.info("Calculating %s for %s..." %
                     (curve_class.get_friendly_name(), key))
-            observed = data[key]
-
-            bc_data = BinaryClassifierData(zip(observed, expected), title=key)
-            curve = curve_class(bc_data)
+            curve = bundle.get_curve(curve_class)
 
             if self.options.resampling:
                 curve.resample(x/2000. for x in xrange(2001))
@@ -6,9 +6,9 @@ import itertools
 import sys
 
 from yard.curve import CurveFactory
-from yard.data import BinaryClassifierData
 from yard.scripts import CommandLineAppForClassifierData
-from yard.significance import PairedPermutationTest
+from yard.mathematics import numpy
+from yard.significance import DeLongTest, PairedPermutationTest
 
 __author__  = "Tamas Nepusz"
 __email__   = "tamas@cs.rhul.ac.uk"
@@ -26,7 +26,9 @@ class SignificanceTestApplication(CommandLineAppForClassifierData):
     being the expected class (1 for positive examples, -1 for negatives),
     the second being the prediction itself. You can also use the -c switch
     to use different column indices and multiple datasets. Columns are
-    separated by whitespace per default.\
+    separated by whitespace per default. The tests can be run in parallel
+    with the -j switch. Use -m delong to run the DeLong test instead of
+    permutation tests.\
     """
 
     short_name = "yard-signi"
@@ -46,6 +48,32 @@ class SignificanceTestApplication(CommandLineAppForClassifierData):
                 default="roc", 
                 help="sets the TYPE of the curve whose AUC is to be "
                      "calculated and tested (roc or croc)")
+        parser.add_option("-m", "--method", dest="method", metavar="METHOD",
+                choices=("permutation", "delong"), default="permutation",
+                help="use the given test METHOD: permutation for paired "
+                     "permutation tests or delong for the DeLong test "
+                     "(ROC curves only, requires NumPy). "
+                     "Default: %default")
+        parser.add_option("-n", "--repetitions", dest="num_repetitions",
+                metavar="N", type=int, default=1000,
+                help="use N random permutations in each test. "
+                     "Default: %default")
+        parser.add_option("--adaptive", dest="adaptive", action="store_true",
+                default=False,
+                help="stop testing a pair as soon as it is clear whether "
+                     "its p-value is below 0.01, 0.05 and 0.1; -n is then "
+                     "the maximum number of permutations")
+        parser.add_option("--exact", dest="exact", action="store_true",
+                default=False,
+                help="calculate the p-values exactly instead of using "
+                     "random permutations where the distribution of the "
+                     "AUC differences is small enough (ROC curves only, "
+                     "requires NumPy 1.17 or later)")
+        parser.add_option("--seed", dest="seed", metavar="SEED", type=int,
+                default=None,
+                help="seed the random number generator with SEED to make "
+                     "the results reproducible, no matter how many worker "
+                     "processes are used with -j")
 
     def run_real(self):
         """Runs the main application"""
@@ -54,6 +82,14 @@ class SignificanceTestApplication(CommandLineAppForClassifierData):
             self.curve_class = CurveFactory.find_class_by_name(self.options.curve_type)
         except ValueError:
             self.parser.error("Unsupported curve type: %s" % self.options.curve_type)
+        if self.options.method == "delong":
+            if self.options.curve_type != "roc":
+                self.parser.error("the DeLong test supports ROC curves only")
+            if numpy is None:
+                self.parser.error("the DeLong test requires NumPy")
+            if self.options.out_of_core:
+                self.parser.error("the DeLong test needs paired predictions, "
+                                  "which are not kept with --out-of-core")
 
         self.process_input_files()
         self.run_tests()
@@ -61,22 +97,24 @@ class SignificanceTestApplication(CommandLineAppForClassifierData):
     def run_tests(self):
         """Runs pairwise significance tests on the datasets found in
         ``self.data``."""
-        data = self.data
-        expected = data["__class__"]
-
-        keys = sorted(data.keys())
+        keys = sorted(self.data.keys())
         keys.remove("__class__")
 
-        for key in keys:
-            self.log.info("Preparing dataset for %s..." % key)
-            data[key] = BinaryClassifierData(zip(data[key], expected), title=key)
-
-        self.log.info("Running significance tests...")
-        significance_test = PairedPermutationTest(self.curve_class)
-        for key1, key2 in itertools.product(keys, keys):
-            if key1 >= key2:
-                continue
-            diff, p_value = significance_test.test(data[key1], data[key2])
+        repetitions = None
+        if self.options.method == "delong":
+            for key in keys:
+                if not self.has_aligned_columns([key]):
+                    self.parser.error("the DeLong test needs paired "
+                                      "predictions, but column %s does not "
+                                      "have one for each example" % key)
+            self.log.info("Running significance tests...")
+            diffs, _, p_values = DeLongTest().test_scores(
+                    [self.data[key] for key in keys], self.data["__class__"])
+        else:
+            diffs, p_values, repetitions = self.run_tests_on_datasets(keys)
+
+        for i, j in itertools.combinations(range(len(keys)), 2):
+            diff, p_value = diffs[i][j], p_values[i][j]
             if p_value < 0.01:
                 stars = "***"
             elif p_value < 0.05:
@@ -85,8 +123,32 @@ class SignificanceTestApplication(CommandLineAppForClassifierData):
                 stars = "*"
             else:
                 stars = ""
-            self.log.info("%3s   d=%8.3g   p=%8.3g   %s vs %s" %
-                          (stars, diff, p_value, key1, key2))
+            if repetitions is not None and \
+                    (self.options.adaptive or self.options.exact):
+                self.log.info("%3s   d=%8.3g   p=%8.3g   n=%7d   %s vs %s" %
+                              (stars, diff, p_value, repetitions[i][j],
+                               keys[i], keys[j]))
+            else:
+                self.log.info("%3s   d=%8.3g   p=%8.3g   %s vs %s" %
+                              (stars, diff, p_value, keys[i], keys[j]))
+
+    def run_tests_on_datasets(self, keys):
+        """Runs pairwise permutation tests on the datasets created from
+        the columns with the given keys, and returns the matrices of the
+        differences in the AUC scores and the p-values, and the matrix of
+        the number of permutations used for each pair."""
+        datasets = []
+        for key in keys:
+            self.log.info("Preparing dataset for %s..." % key)
+            datasets.append(self.create_dataset(key))
+
+        self.log.info("Running significance tests...")
+        significance_test = PairedPermutationTest(self.curve_class,
+                num_repetitions=self.options.num_repetitions,
+                seed=self.options.seed, jobs=self.options.jobs,
+                adaptive=self.options.adaptive, exact=self.options.exact)
+        diffs, p_values = significance_test.test_all_pairs(datasets)
+        return diffs, p_values, significance_test.repetitions_used
 
 
 def main():
@@ -0,0 +1,259 @@
+"""
+Handing datasets over to worker processes through shared memory.
+
+Datasets passed to worker processes of ``multiprocessing`` are normally
+pickled, which copies the whole dataset into every worker. This module
+stores the arrays of a dataset in a named shared memory block instead
+(see `multiprocessing.shared_memory`); the worker processes receive only the
+name and the layout of the block, and attach to it without copying.
+
+`SharedArrays` holds a set of NumPy arrays in a single block, and
+`SharedDataset` holds a `yard.data.BinaryClassifierData` (or any of its
+variants). Both can be pickled: the pickled form contains the description
+of the block only, and the unpickled object attaches to the block when the
+arrays are first needed. The process that created the block owns it; the
+block is destroyed when the owner is closed. Other processes must close
+their attached objects as well when they are done with them.
+
+Attached objects must be created in processes started by ``multiprocessing``
+from the owner process (e.g., the workers of a `multiprocessing.Pool`), so
+that they share the resource tracker of the owner.
+
+This module requires NumPy and Python 3.8 or later.
+"""
+
+from yard.data import AggregatedBinaryClassifierData, BinaryClassifierData, \
+        ColumnarBinaryClassifierData
+from yard.external import ExternalBinaryClassifierData
+from yard.mathematics import numpy, require_numpy
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+__author__  = "Tamas Nepusz"
+__email__   = "tamas@cs.rhul.ac.uk"
+__copyright__ = "Copyright (c) 2010, Tamas Nepusz"
+__license__ = "MIT"
+
+__all__ = ["SharedArrays", "SharedDataset"]
+
+#: Alignment of the arrays within the shared memory block, in bytes
+ALIGNMENT = 64
+
+
+def require_shared_memory(feature):
+    """Raises ``ImportError`` if NumPy or `multiprocessing.shared_memory`
+    is not available. `feature` is a human-readable description of the
+    feature that needs them; it will be used in the error message."""
+    require_numpy(feature)
+    if shared_memory is None:
+        raise ImportError("%s requires Python 3.8 or later" % feature)
+
+
+class SharedArrays(object):
+    """A set of NumPy arrays stored in a single shared memory block.
+
+    Use `allocate()` or `create()` to create a new block, then pass the
+    object itself (or its `descriptor`) to the worker processes. The arrays
+    can be retrieved by their keys with the indexing operator in any
+    process; they are views into the block, so nothing is copied.
+
+    The object must be closed with `close()` (or by using it as a context
+    manager) when it is no longer needed. Closing the owner also destroys
+    the block, so the owner should be closed only after the workers are
+    done. The arrays retrieved from the object must not be used after it
+    has been closed.
+    """
+
+    def __init__(self, descriptor):
+        """Constructs an object attached to the block with the given
+        descriptor. The block is not mapped until the arrays are first
+        needed. Use `allocate()` or `create()` to create a new block."""
+        require_shared_memory("SharedArrays")
+        self._descriptor = descriptor
+        self._block, self._arrays = None, None
+        self.owner = False
+
+    @classmethod
+    def allocate(cls, specs, metadata=None):
+        """Creates a new shared memory block for arrays with the given
+        specifications, and returns an object that owns the block.
+
+        `specs` is a list of ``(key, shape, dtype)`` tuples, one for each
+        array. The arrays are not initialized. `metadata` is an optional
+        picklable object that is passed on to the worker processes along
+        with the block."""
+        require_shared_memory("SharedArrays")
+
+        layout, size = [], 0
+        for key, shape, dtype in specs:
+            dtype = numpy.dtype(dtype)
+            if isinstance(shape, int):
+                shape = (shape, )
+            layout.append((key, tuple(shape), dtype.str, size))
+            nbytes = int(numpy.prod(shape)) * dtype.itemsize
+            size += nbytes + (-nbytes % ALIGNMENT)
+
+        block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        result = cls((block.name, layout, metadata))
+        result._block, result.owner = block, True
+        return result
+
+    @classmethod
+    def create(cls, arrays, metadata=None):
+        """Copies the given arrays into a new shared memory block, and
+        returns an object that owns the block. `arrays` is a list of
+        ``(key, array)`` pairs. See `allocate()` for the description of
+        `metadata`."""
+        arrays = [(key, numpy.asarray(array)) for key, array in arrays]
+        result = cls.allocate([(key, array.shape, array.dtype)
+                               for key, array in arrays], metadata)
+        try:
+            for key, array in arrays:
+                result[key][...] = array
+        except:
+            result.close()
+            raise
+        return result
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getitem__(self, key):
+        if self._arrays is None:
+            self._attach()
+        return self._arrays[key]
+
+    def __getstate__(self):
+        return {"_descriptor": self._descriptor}
+
+    def __setstate__(self, state):
+        self._descriptor = state["_descriptor"]
+        self._block, self._arrays = None, None
+        self.owner = False
+
+    def _attach(self):
+        """Maps the shared memory block and sets up the views of the
+        arrays."""
+        if self._block is None:
+            try:
+                # Python 3.13 and later: the owner alone tracks the block
+                self._block = shared_memory.SharedMemory(name=self.name,
+                                                         track=False)
+            except TypeError:
+                self._block = shared_memory.SharedMemory(name=self.name)
+        self._arrays = dict((key, numpy.ndarray(shape, dtype=dtype,
+                                                buffer=self._block.buf,
+                                                offset=offset))
+                            for key, shape, dtype, offset in self.layout)
+
+    def close(self):
+        """Unmaps the shared memory block from the current process. If the
+        object owns the block, the block is also destroyed, so processes
+        that have not attached to it yet will not be able to do so."""
+        self._arrays = None
+        block, self._block = self._block, None
+        if block is None:
+            return
+        if self.owner:
+            block.unlink()
+            self.owner = False
+        block.close()
+
+    @property
+    def descriptor(self):
+        """A picklable description of the block that can be passed to the
+        constructor in another process."""
+        return self._descriptor
+
+    @property
+    def keys(self):
+        """The keys of the arrays in the block."""
+        return [item[0] for item in self.layout]
+
+    @property
+    def layout(self):
+        """The keys, shapes, data types and offsets of the arrays in the
+        block."""
+        return self._descriptor[1]
+
+    @property
+    def metadata(self):
+        """The metadata passed on to the worker processes along with the
+        block."""
+        return self._descriptor[2]
+
+    @property
+    def name(self):
+        """The name of the shared memory block."""
+        return self._descriptor[0]
+
+
+class SharedDataset(SharedArrays):
+    """A `yard.data.BinaryClassifierData` instance stored in a shared memory
+    block.
+
+    Use `from_dataset()` (or `BinaryClassifierData.to_shared_memory()`) to
+    create a new block from a dataset and pass the returned object to the
+    worker processes, where the `dataset` property attaches to the block
+    and returns an equivalent dataset without copying it. Datasets with a
+    single record for each example are attached as
+    `ColumnarBinaryClassifierData`, aggregated datasets and datasets kept
+    out of core as `AggregatedBinaryClassifierData`.
+
+    See `SharedArrays` for the lifecycle of the block.
+    """
+
+    @classmethod
+    def from_dataset(cls, data):
+        """Copies the given dataset into a new shared memory block, and
+        returns an object that owns the block. Raises `TypeError` if
+        `data` is not a `BinaryClassifierData` instance."""
+        require_shared_memory("SharedDataset")
+
+        if isinstance(data, ColumnarBinaryClassifierData):
+            kind = "columnar"
+            arrays = [("scores", data.scores), ("labels", data.labels)]
+        elif isinstance(data, (AggregatedBinaryClassifierData,
+                               ExternalBinaryClassifierData)):
+            kind = "aggregated"
+            arrays = list(zip(("scores", "pos_counts", "neg_counts"),
+                              data.get_score_counts()))
+        elif isinstance(data, BinaryClassifierData):
+            kind = "columnar"
+            arrays = [("scores", numpy.fromiter((point[0] for point in
+                                                 data.data),
+                                                dtype=numpy.float64,
+                                                count=len(data))),
+                      ("labels", numpy.fromiter((point[1] > 0 for point in
+                                                 data.data),
+                                                dtype=numpy.bool_,
+                                                count=len(data)))]
+        else:
+            raise TypeError("expected a BinaryClassifierData instance, got "
+                            "%s" % type(data).__name__)
+        return cls.create(arrays, metadata=(kind, data.title))
+
+    @property
+    def dataset(self):
+        """The dataset stored in the block. The arrays of the dataset are
+        views into the block; the dataset must not be used after the
+        object has been closed."""
+        kind, title = self.metadata
+        if kind == "columnar":
+            return ColumnarBinaryClassifierData.from_arrays(self["scores"],
+                    self["labels"], title=title, presorted=True)
+        return AggregatedBinaryClassifierData.from_counts(self["scores"],
+                self["pos_counts"], self["neg_counts"], title=title,
+                presorted=True)
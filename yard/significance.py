@@ -3,8 +3,15 @@ Tests for assessing the statistical significance of differences between
 the AUC for ROC curves.
 """
 
+from contextlib import contextmanager
+from functools import partial
+from math import ceil, erfc, log, sqrt
+from random import Random
+
 from yard.curve import ROCCurve
-from yard.mathematics import geometric
+from yard.mathematics import has_random_generators, numpy, require_numpy
+from yard.parallel import run_tasks, worker_pool
+from yard.sharedmem import SharedArrays, shared_memory
 
 try:
     xrange
@@ -16,6 +23,15 @@ __email__   = "tamas@cs.rhul.ac.uk"
 __copyright__ = "Copyright (c) 2010, Tamas Nepusz"
 __license__ = "MIT"
 
+#: Number of byte rows (groups of eight positive examples) whose tables are
+#: built at once when all the pairs are tested with the same flips
+TABLE_ROWS = 512
+
+#: Number of table lookups done at once by the batched engine; the rows
+#: of the tables that they hit should fit in the CPU cache
+LOOKUP_BLOCK = 2 ** 16
+
+
 class SignificanceTest(object):
     """Abstract class that defines the interface of significance
     tests.
@@ -43,6 +59,36 @@ class SignificanceTest(object):
         in the AUC scores and the p-value."""
         raise NotImplementedError
 
+    def test_pairs(self, datasets, pairs=None):
+        """Tests whether the AUC scores of several pairs of ROC curves are
+        significantly different or not. `datasets` must be a list of
+        `yard.data.BinaryClassifierData` instances, and `pairs` must be a
+        list of pairs of indices into `datasets`; the default is to test all
+        the pairs ``(i, j)`` where ``i < j``. Returns a list containing the
+        observed difference in the AUC scores and the p-value for each
+        pair."""
+        if pairs is None:
+            pairs = [(i, j) for i in xrange(len(datasets))
+                     for j in xrange(i+1, len(datasets))]
+        return [self.test(datasets[i], datasets[j]) for i, j in pairs]
+
+    def test_all_pairs(self, datasets):
+        """Tests whether the AUC scores of all the pairs of ROC curves
+        are significantly different or not. `datasets` must be a list of
+        `yard.data.BinaryClassifierData` instances. Returns two matrices
+        (as lists of lists): the observed differences in the AUC scores and
+        the p-values, where row ``i`` and column ``j`` belongs to the pair
+        ``(i, j)``."""
+        k = len(datasets)
+        diffs = [[0.] * k for _ in xrange(k)]
+        p_values = [[1.] * k for _ in xrange(k)]
+        pairs = [(i, j) for i in xrange(k) for j in xrange(i+1, k)]
+        for (i, j), (diff, p_value) in zip(pairs,
+                                          self.test_pairs(datasets, pairs)):
+            diffs[i][j], diffs[j][i] = diff, -diff
+            p_values[i][j] = p_values[j][i] = p_value
+        return diffs, p_values
+
 
 class PairedPermutationTest(SignificanceTest):
     """Class implementing a paired permutation significance test for
@@ -57,14 +103,99 @@ class PairedPermutationTest(SignificanceTest):
     many times did the difference exceed the actual observed difference
     calculated from the original curves. This ratio serves as an estimate for
     the p-value.
+
+    If NumPy 1.17 or later is available and the curve type can decompose its AUC into a
+    sum of terms, one for each positive example (see
+    `ROCCurve.auc_terms_from_pos_ranks()`), the repetitions are evaluated
+    in batches: the flips of a batch are drawn as a matrix of random bits
+    (packed eight to a byte), and the change of the AUC difference caused by
+    the flips of each group of eight pairs is looked up from a table with
+    256 entries. Otherwise, a few pairs chosen with geometrically
+    distributed skips between them are flipped in each repetition, and the
+    flips accumulate over the repetitions; the configurations then form a
+    random walk that visits each flip configuration equally often in the
+    long run.
+
+    `seed` may be used to seed the random number generator of the test to
+    make the results reproducible. The batched engine splits the repetitions
+    into chunks of `chunk_size` repetitions, and each chunk draws its flips
+    from an independent random stream derived from the seed, the index of
+    the pair being tested and the index of the chunk (see
+    `numpy.random.SeedSequence`). If `jobs` is larger than one, the chunks
+    (of all the pairs in `test_pairs()`) are evaluated by a pool of `jobs`
+    worker processes. The chunks hold `chunk_size` repetitions each no
+    matter how many workers are used, so the results do not depend on the
+    number of workers. The other engines always run in the current process.
+
+    `test_all_pairs()` tests all the pairs of several datasets at once with
+    the batched engine, using the same flips for every pair in each
+    repetition; see its documentation for the details.
+
+    If `adaptive` is ``True``, `num_repetitions` is only the maximum number
+    of repetitions. The testing of a pair stops as soon as the confidence
+    interval of its p-value lies entirely below or above each of the
+    significance levels in `thresholds`, since running more repetitions
+    would not change the conclusion of the test. The repetitions are then
+    run in rounds of increasing size, starting from `min_batch_size`, and
+    the stopping rule is checked after each round. The rounds are split
+    into chunks of at most `chunk_size` repetitions, which are evaluated in
+    parallel, and the worker processes are started only once for all the
+    rounds. The number of repetitions used for each
+    pair in the last call to `test_pairs()` (a list) or `test_all_pairs()`
+    (a matrix) is stored in `repetitions_used`.
+
+    If `exact` is ``True``, the p-values are calculated exactly instead of
+    being estimated from random flips wherever possible. If the terms of
+    the AUCs are multiples of one half (the ranks for ROC curves), the
+    distribution of the AUC difference over all the flip configurations is
+    calculated by dynamic programming over the possible values of the sum
+    of the flipped differences, like the tables of the Wilcoxon signed-rank
+    test. This is done only if the number of states visited by the
+    dynamic programming (the number of possible values of the sum,
+    accumulated over the positive examples) is at most `max_exact_states`
+    and the number of possible values of the sum (the length of the arrays
+    of the dynamic programming) is at most `max_exact_values`; the other
+    pairs fall back to random flips. The number of repetitions
+    used for the pairs with exact p-values is zero. This mode requires
+    NumPy 1.17 or later.
     """
 
+    #: Number of repetitions in each chunk of the batched engine; the chunks
+    #: are the units of work of the worker processes
+    chunk_size = 256
+
+    #: Maximum number of repetitions in a round of the adaptive mode
+    batch_size = 16384
+
+    #: Number of repetitions in the first round of the adaptive mode
+    min_batch_size = 64
+
+    #: Significance levels that the confidence interval of the p-value must
+    #: not contain when the testing of a pair stops in the adaptive mode
+    thresholds = (0.01, 0.05, 0.1)
+
+    #: Critical value of the standard normal distribution for the confidence
+    #: intervals of the p-values in the adaptive mode (99% confidence)
+    z_score = 2.576
+
+    #: Maximum number of states of the dynamic programming in the exact mode
+    max_exact_states = 2 ** 28
+
+    #: Maximum length of the arrays of the dynamic programming in the exact
+    #: mode (32 MiB of probabilities)
+    max_exact_values = 2 ** 22
+
     def __init__(self, *args, **kwds):
         if "num_repetitions" in kwds:
             self.num_repetitions = int(kwds["num_repetitions"])
             del kwds["num_repetitions"]
         else:
             self.num_repetitions = 1000
+        self.seed = kwds.pop("seed", None)
+        self.jobs = int(kwds.pop("jobs", 1))
+        self.adaptive = bool(kwds.pop("adaptive", False))
+        self.exact = bool(kwds.pop("exact", False))
+        self.repetitions_used = None
         super(PairedPermutationTest, self).__init__(*args, **kwds)
 
     def test(self, data1, data2):
@@ -76,33 +207,689 @@ class PairedPermutationTest(SignificanceTest):
         It is assumed that `data1` and `data2` contain the same examples with
         different scures, and it is not checked whether this is true or not.
         """
-        n = len(data1)
-        if len(data2) != n:
-            raise ValueError("the two datasets must be equal in length")
+        return self.test_pairs([data1, data2], [(0, 1)])[0]
 
-        ranks1 = data1.get_positive_ranks()
-        ranks2 = data2.get_positive_ranks()
-        m = len(ranks1)
-        if m != len(ranks2):
-            raise ValueError("the two datasets must have the same "
-                             "positive examples")
+    def test_pairs(self, datasets, pairs=None):
+        """Tests whether the AUC scores of several pairs of ROC curves are
+        significantly different or not. See `SignificanceTest.test_pairs()`
+        for the arguments.
+
+        The positive ranks of each dataset are calculated only once, and
+        the repetitions of all the pairs are distributed among the worker
+        processes if `jobs` is larger than one.
+        """
+        if pairs is None:
+            pairs = [(i, j) for i in xrange(len(datasets))
+                     for j in xrange(i+1, len(datasets))]
+
+        n = len(datasets[0]) if datasets else 0
+        ranks = self._get_positive_ranks(datasets)
 
         dummy_curve = self.curve_factory([])
-        auc_from_ranks = dummy_curve.auc_from_pos_ranks
+        if not hasattr(dummy_curve, "auc_terms_from_pos_ranks"):
+            results = [self._test_sequential_ranks(dummy_curve,
+                                                   list(ranks[i]),
+                                                   list(ranks[j]), n)
+                       for i, j in pairs]
+        elif has_random_generators:
+            results = self._test_batched(dummy_curve, ranks, pairs, n)
+        else:
+            results = [self._test_sequential(dummy_curve, ranks[i], ranks[j],
+                                             n)
+                       for i, j in pairs]
+        self.repetitions_used = [result[2] for result in results]
+        return [result[:2] for result in results]
+
+    def test_all_pairs(self, datasets):
+        """Tests all the pairs of the given datasets with a shared set of
+        random flip configurations. `datasets` must be a list of
+        `yard.data.BinaryClassifierData` instances. Returns two matrices
+        (as lists of lists): the observed differences in the AUC scores and
+        the p-values, where row ``i`` and column ``j`` belongs to the pair
+        ``(i, j)``.
+
+        If the batched engine is available, the positive ranks of each
+        dataset are calculated once, and every repetition flips the same
+        pairs of positive ranks in all the datasets. The random work then
+        grows linearly with the number of datasets instead of
+        quadratically, but the p-values of the pairs are no longer
+        independent. Otherwise, this falls back to `test_pairs()`.
+        """
+        n = len(datasets[0]) if datasets else 0
+        dummy_curve = self.curve_factory([])
+        if not has_random_generators or \
+                not hasattr(dummy_curve, "auc_terms_from_pos_ranks"):
+            result = super(PairedPermutationTest, self).test_all_pairs(
+                    datasets)
+            k, used = len(datasets), iter(self.repetitions_used)
+            self.repetitions_used = [[0] * k for _ in xrange(k)]
+            for i in xrange(k):
+                for j in xrange(i+1, k):
+                    self.repetitions_used[i][j] = \
+                            self.repetitions_used[j][i] = next(used)
+            return result
+        ranks = self._get_positive_ranks(datasets)
+        return self._test_all_pairs_batched(dummy_curve, ranks, n)
+
+    def _get_positive_ranks(self, datasets):
+        """Returns the positive ranks of the given datasets after checking
+        that they are compatible with each other."""
+        n = len(datasets[0]) if datasets else 0
+        if any(len(data) != n for data in datasets):
+            raise ValueError("the datasets must be equal in length")
+        ranks = [data.get_positive_ranks() for data in datasets]
+        if any(len(pos_ranks) != len(ranks[0]) for pos_ranks in ranks):
+            raise ValueError("the datasets must have the same "
+                             "positive examples")
+        return ranks
+
+    def _get_terms(self, curve, ranks, n):
+        """Returns the observed AUCs of the datasets with the given positive
+        ranks and the matrix of the terms of the AUCs, one row for each
+        dataset, using the ``auc_terms_from_pos_ranks`` method of the given
+        curve."""
+        intercepts, terms, slope = [], [], 0.
+        for pos_ranks in ranks:
+            intercept, slope, pos_terms = curve.auc_terms_from_pos_ranks(
+                    numpy.asarray(pos_ranks, dtype=numpy.float64), n)
+            intercepts.append(intercept)
+            terms.append(numpy.asarray(pos_terms, dtype=numpy.float64))
+        terms = numpy.vstack(terms)
+        return numpy.array(intercepts) + slope * terms.sum(axis=1), terms
+
+    @contextmanager
+    def _start_workers(self, terms, num_tasks):
+        """Context manager that yields a function which calls a chunk
+        function for each task in a list with the terms of the AUCs
+        prepended to the arguments, and returns the results. If
+        `self.jobs` is larger than one and there are several tasks in
+        total (`num_tasks`, over all the rounds), the tasks are distributed
+        among a pool of worker processes, which get the terms through
+        shared memory. The pool and the shared memory block are created
+        once for all the rounds."""
+        if self.jobs <= 1 or num_tasks <= 1:
+            yield lambda func, tasks: run_tasks(
+                    func, [(terms, ) + task for task in tasks], 1)
+            return
+
+        source = terms
+        if shared_memory is not None:
+            source = SharedArrays.create([("terms", terms)])
+        try:
+            with worker_pool(min(self.jobs, num_tasks)) as pool:
+                yield lambda func, tasks: run_tasks(
+                        func, [(source, ) + task for task in tasks],
+                        self.jobs, pool)
+        finally:
+            if source is not terms:
+                source.close()
+
+    def _get_round_sizes(self):
+        """Returns the number of repetitions in each round of the batched
+        engine; the stopping rule of the adaptive mode is checked after
+        each round. In the adaptive mode, the rounds double in size until
+        they reach `batch_size`; otherwise there is a single round."""
+        if not self.adaptive:
+            return [self.num_repetitions] if self.num_repetitions > 0 else []
+
+        sizes, size, total = [], self.min_batch_size, 0
+        while total < self.num_repetitions:
+            sizes.append(min(size, self.num_repetitions - total))
+            total += sizes[-1]
+            size = min(2 * size, self.batch_size)
+        return sizes
+
+    def _get_rounds(self):
+        """Returns the chunks of the batched engine grouped into rounds.
+        Each chunk is represented by its index and its size. The rounds are
+        split into chunks of at most `chunk_size` repetitions independently
+        of the number of worker processes, so that the random streams of
+        the chunks are the same for any number of workers."""
+        rounds, index = [], 0
+        for round_size in self._get_round_sizes():
+            chunks = []
+            for start in xrange(0, round_size, self.chunk_size):
+                chunks.append((index, min(self.chunk_size,
+                                          round_size - start)))
+                index += 1
+            rounds.append(chunks)
+        return rounds
+
+    @staticmethod
+    def _group_chunks(chunks, num_groups):
+        """Splits the given chunks into at most `num_groups` groups of
+        consecutive chunks; each group is evaluated by one task, which
+        builds the lookup tables of the batched engine only once for all
+        its chunks. The grouping does not affect the results, since each
+        chunk draws its flips from its own random stream."""
+        num_groups = max(1, min(num_groups, len(chunks)))
+        bounds = [len(chunks) * idx // num_groups
+                  for idx in xrange(num_groups + 1)]
+        return [chunks[start:end] for start, end in zip(bounds, bounds[1:])
+                if end > start]
+
+    def _check_num_repetitions(self):
+        """Raises ``ValueError`` if `num_repetitions` is not positive; called
+        when some p-values have to be estimated from random flips."""
+        if self.num_repetitions < 1:
+            raise ValueError("num_repetitions must be positive")
+
+    def _is_decided(self, num_success, num_trials):
+        """Returns whether the Wilson score interval of the p-value lies
+        entirely below or above each of the `thresholds`, given the number
+        of successful trials and the number of all trials. Works
+        elementwise if the arguments are NumPy arrays."""
+        z2 = self.z_score ** 2
+        ratio = num_success / (num_trials + 0.)
+        center = (ratio + z2 / (2. * num_trials)) / (1. + z2 / num_trials)
+        radius = self.z_score * (ratio * (1. - ratio) / num_trials +
+                                 z2 / (4. * num_trials ** 2)) ** 0.5 / \
+                 (1. + z2 / num_trials)
+        result = True
+        for threshold in self.thresholds:
+            result = result & ((center + radius < threshold) |
+                               (center - radius > threshold))
+        return result
+
+    def _get_exact_p_values(self, terms, pairs):
+        """Returns the exact p-values of the given pairs of rows of the
+        matrix of the terms of the AUCs, or ``None`` for the pairs whose
+        p-value cannot be calculated exactly (or all of them if the exact
+        mode is off)."""
+        if not self.exact:
+            return [None] * len(pairs)
+        return [_exact_p_value(terms[i], terms[j], self.max_exact_states,
+                               self.max_exact_values)
+                for i, j in pairs]
+
+    def _test_batched(self, curve, ranks, pairs, n):
+        """Runs the test for the given pairs of positive rank lists with the
+        batched engine, using the ``auc_terms_from_pos_ranks`` method of the
+        given curve."""
+        aucs, terms = self._get_terms(curve, ranks, n)
+        exact = self._get_exact_p_values(terms, pairs)
+        entropy = numpy.random.SeedSequence(self.seed).entropy
+        counts, used = [0] * len(pairs), [0] * len(pairs)
+        undecided = [pair for pair in xrange(len(pairs))
+                     if exact[pair] is None]
+        if undecided:
+            self._check_num_repetitions()
+
+        rounds = self._get_rounds()
+        num_tasks = len(undecided) * sum(len(chunks) for chunks in rounds)
+        with self._start_workers(terms, num_tasks) as run_chunks:
+            for chunks in rounds:
+                if not undecided:
+                    break
+                num_groups = -(-self.jobs // len(undecided))
+                tasks = [(pair, pairs[pair][0], pairs[pair][1],
+                          [(size, numpy.random.SeedSequence(
+                                      entropy, spawn_key=(pair, chunk)))
+                           for chunk, size in group])
+                         for pair in undecided
+                         for group in self._group_chunks(chunks, num_groups)]
+                results = run_chunks(_run_batched_chunks,
+                                     [task[1:] for task in tasks])
+                for task, count in zip(tasks, results):
+                    counts[task[0]] += count
+                    used[task[0]] += sum(size for size, _ in task[3])
+                if self.adaptive:
+                    undecided = [pair for pair in undecided
+                                 if not self._is_decided(counts[pair],
+                                                         used[pair])]
+
+        return [(float(aucs[i] - aucs[j]), exact[pair], 0)
+                if exact[pair] is not None
+                else (float(aucs[i] - aucs[j]),
+                      counts[pair] / float(used[pair]), used[pair])
+                for pair, (i, j) in enumerate(pairs)]
+
+    def _test_all_pairs_batched(self, curve, ranks, n):
+        """Runs the test for all the pairs of positive rank lists with the
+        batched engine, flipping the same pairs in all the datasets in each
+        repetition."""
+        aucs, terms = self._get_terms(curve, ranks, n)
+        entropy = numpy.random.SeedSequence(self.seed).entropy
+        k = len(ranks)
+        counts = numpy.zeros((k, k), dtype=numpy.int64)
+        used = numpy.zeros_like(counts)
+
+        pairs = [(i, j) for i in xrange(k) for j in xrange(i+1, k)]
+        # The diagonal needs no flips; its p-values are 1
+        exact = numpy.eye(k)
+        undecided = ~numpy.eye(k, dtype=bool)
+        for (i, j), p_value in zip(pairs,
+                                   self._get_exact_p_values(terms, pairs)):
+            if p_value is not None:
+                exact[i, j] = exact[j, i] = p_value
+                undecided[i, j] = undecided[j, i] = False
+        if undecided.any():
+            self._check_num_repetitions()
+
+        # In the adaptive mode, the counts of a pair are frozen when the
+        # pair is decided, even though the shared flips are still evaluated
+        # for all the pairs
+        rounds = self._get_rounds()
+        num_tasks = sum(len(chunks) for chunks in rounds)
+        with self._start_workers(terms, num_tasks) as run_chunks:
+            for chunks in rounds:
+                if not undecided.any():
+                    break
+                tasks = [([(size, numpy.random.SeedSequence(
+                                          entropy, spawn_key=(chunk, )))
+                           for chunk, size in group], )
+                         for group in self._group_chunks(chunks, self.jobs)]
+                results = sum(run_chunks(_run_all_pairs_chunks, tasks))
+                counts[undecided] += results[undecided]
+                used[undecided] += sum(size for _, size in chunks)
+                if self.adaptive:
+                    undecided[undecided] = ~self._is_decided(
+                            counts[undecided], used[undecided])
+
+        diffs = aucs[:, None] - aucs[None, :]
+        p_values = numpy.where(used > 0, counts / numpy.maximum(used, 1.),
+                               exact)
+        self.repetitions_used = used.tolist()
+        return diffs.tolist(), p_values.tolist()
+
+    def _test_sequential(self, curve, ranks1, ranks2, n):
+        """Runs the test one repetition at a time, using the
+        ``auc_terms_from_pos_ranks`` method of the given curve. The
+        difference of the sums of the terms is updated with each flip, so a
+        repetition takes time proportional to the number of flips."""
+        self._check_num_repetitions()
+        m = len(ranks1)
+        skip = self._get_skip_sampler(0.01)
+        intercept1, slope, terms1 = curve.auc_terms_from_pos_ranks(ranks1, n)
+        intercept2, _, terms2 = curve.auc_terms_from_pos_ranks(ranks2, n)
+        observed_diff = (intercept1 + slope * sum(terms1)) - \
+                        (intercept2 + slope * sum(terms2))
+
+        deltas = [term1 - term2 for term1, term2 in zip(terms1, terms2)]
+        total_delta = sum(deltas)
+        tolerance = 1e-12 * (sum(abs(term) for term in terms1) +
+                             sum(abs(term) for term in terms2))
+        threshold = abs(total_delta) - tolerance
+        num_success, num_flips = 0, 0
+        checkpoints = self._get_checkpoints()
+
+        for trial in xrange(1, self.num_repetitions+1):
+            idx = 0
+            while True:
+                idx += skip()
+                if idx >= m:
+                    break
+                total_delta -= 2 * deltas[idx]
+                deltas[idx] = -deltas[idx]
+                num_flips += 1
+            if num_flips >= m:
+                # Get rid of the rounding errors of the running sum once in
+                # a while; this costs O(1) per flip on average
+                total_delta, num_flips = sum(deltas), 0
+            if abs(total_delta) >= threshold:
+                num_success += 1
+            if trial in checkpoints and self._is_decided(num_success, trial):
+                break
+
+        return observed_diff, num_success / float(trial), trial
+
+    def _test_sequential_ranks(self, curve, ranks1, ranks2, n):
+        """Runs the test one repetition at a time, using the
+        ``auc_from_pos_ranks`` method of the given curve to calculate the
+        AUCs from scratch in each repetition."""
+        self._check_num_repetitions()
+        m = len(ranks1)
+        skip = self._get_skip_sampler(0.01)
+        auc_from_ranks = curve.auc_from_pos_ranks
         observed_diff = auc_from_ranks(ranks1, n) - auc_from_ranks(ranks2, n)
         abs_observed_diff = abs(observed_diff)
         num_success = 0
+        checkpoints = self._get_checkpoints()
 
-        for trial in xrange(self.num_repetitions):
+        for trial in xrange(1, self.num_repetitions+1):
             idx = 0
             while True:
-                idx += geometric(p=0.01)
+                idx += skip()
                 if idx >= m:
                     break
                 ranks1[idx], ranks2[idx] = ranks2[idx], ranks1[idx]
             diff = abs(auc_from_ranks(ranks1, n) - auc_from_ranks(ranks2, n))
             if diff >= abs_observed_diff:
                 num_success += 1
+            if trial in checkpoints and self._is_decided(num_success, trial):
+                break
+
+        return observed_diff, num_success / float(trial), trial
+
+    def _get_checkpoints(self):
+        """Returns the set of repetition counts after which the sequential
+        engines check the stopping rule of the adaptive mode; these are the
+        ends of the rounds of the batched engine. The set is empty if the
+        adaptive mode is off."""
+        if not self.adaptive:
+            return set()
+        result, total = set(), 0
+        for size in self._get_round_sizes():
+            total += size
+            result.add(total)
+        return result
+
+    def _get_skip_sampler(self, p):
+        """Returns a function that draws a sample from the geometric
+        distribution with success probability `p` whenever it is called,
+        using a random number generator seeded with `self.seed`."""
+        if has_random_generators:
+            rng = numpy.random.default_rng(self.seed)
+            def generate():
+                while True:
+                    for value in rng.geometric(p, size=4096).tolist():
+                        yield value
+            return partial(next, generate())
+
+        rng, log_q = Random(self.seed), log(1.0 - p)
+        return lambda: max(1, int(ceil(log(1.0 - rng.random()) / log_q)))
+
+
+class DeLongTest(SignificanceTest):
+    """Class implementing the DeLong test for comparing the areas under
+    correlated ROC curves.
+
+    The test is based on the placement values of the examples: the
+    placement value of a positive example is the fraction of negative
+    examples ranked below it, and the placement value of a negative example
+    is the fraction of positive examples ranked above it (ties count as
+    one half). The AUC is the mean of the placement values of the positive
+    examples, and the covariances of the AUCs of several classifiers are
+    estimated from the covariances of their placement values. The placement
+    values are calculated from the ranks of the examples (the fast DeLong
+    algorithm of Sun and Xu), so the test takes O(n log n) time for each
+    classifier, and it gives an analytic p-value from the normal
+    distribution instead of a Monte Carlo estimate.
+
+    The AUCs of classifiers evaluated on the same examples are correlated.
+    The covariances can be estimated only if it is known which scores
+    belong to the same example, so use `covariance()` or `test_scores()`
+    with the unsorted predictions of the classifiers for the paired test.
+    Instances of `yard.data.BinaryClassifierData` are sorted by the
+    predictions, therefore `test()` (and `test_pairs()` and
+    `test_all_pairs()`) treat the AUCs as independent; the resulting
+    p-values are then conservative.
+
+    This class requires NumPy.
+    """
+
+    def __init__(self):
+        require_numpy("DeLongTest")
+        super(DeLongTest, self).__init__(ROCCurve)
+
+    def covariance(self, scores, labels):
+        """Calculates the AUCs of several classifiers evaluated on the same
+        examples and the covariance matrix of the AUCs.
+
+        `scores` is a 2D array with one row per classifier and one column
+        per example, or a list of 1D arrays, one for each classifier.
+        `labels` contains the expected outcomes of the examples; an entry
+        is positive if it is larger than zero. Returns a 1D NumPy array of
+        the AUCs and a 2D NumPy array of their covariances."""
+        labels = numpy.asarray(labels) > 0
+        pos_placements, neg_placements = [], []
+        for row in scores:
+            ranks = _midranks(row)
+            if len(ranks) != len(labels):
+                raise ValueError("scores and labels must be equal in length")
+            placements = _placements(ranks[labels], ranks[~labels])
+            pos_placements.append(placements[0])
+            neg_placements.append(placements[1])
+        pos_placements = numpy.vstack(pos_placements)
+        neg_placements = numpy.vstack(neg_placements)
+
+        num_pos, num_neg = pos_placements.shape[1], neg_placements.shape[1]
+        covariance = numpy.atleast_2d(numpy.cov(pos_placements)) / num_pos + \
+                     numpy.atleast_2d(numpy.cov(neg_placements)) / num_neg
+        return pos_placements.mean(axis=1), covariance
+
+    def test(self, data1, data2):
+        """Tests whether the AUC scores of two ROC curves are significantly
+        different or not. `data1` and `data2` must be instances of
+        `yard.data.BinaryClassifierData`. Returns the observed difference
+        in the AUC scores and the p-value.
+
+        The AUCs are assumed to be independent, since the datasets do not
+        tell which predictions belong to the same example; see
+        `test_scores()` for the paired test."""
+        if data1.total_positives != data2.total_positives or \
+                len(data1) != len(data2):
+            raise ValueError("the datasets must have the same positive "
+                             "and negative examples")
+        aucs, variance = [], 0.
+        for data in (data1, data2):
+            pos_placements, neg_placements = _placements(
+                    numpy.asarray(data.get_positive_ranks(), dtype=float),
+                    numpy.asarray(data.get_negative_ranks(), dtype=float))
+            aucs.append(pos_placements.mean())
+            variance += pos_placements.var(ddof=1) / len(pos_placements) + \
+                        neg_placements.var(ddof=1) / len(neg_placements)
+        diff = float(aucs[0] - aucs[1])
+        return diff, _normal_p_value(diff, variance)
+
+    def test_scores(self, scores, labels):
+        """Tests whether the AUC scores of all the pairs of several
+        classifiers evaluated on the same examples are significantly
+        different or not. See `covariance()` for the arguments.
+
+        Returns three matrices (as lists of lists): the observed
+        differences in the AUC scores, the variances of the differences and
+        the p-values, where row ``i`` and column ``j`` belongs to the pair
+        ``(i, j)``."""
+        aucs, covariance = self.covariance(scores, labels)
+        variances = numpy.diag(covariance)
+        diffs = aucs[:, None] - aucs[None, :]
+        variances = numpy.maximum(variances[:, None] + variances[None, :] -
+                                  2 * covariance, 0.)
+        p_values = [[_normal_p_value(diff, variance)
+                     for diff, variance in zip(*rows)]
+                    for rows in zip(diffs.tolist(), variances.tolist())]
+        return diffs.tolist(), variances.tolist(), p_values
+
+
+def _run_batched_chunks(source, index1, index2, chunks):
+    """Runs chunks of repetitions of the batched engine of
+    `PairedPermutationTest` for the datasets with the given indices, and
+    returns the number of repetitions where the absolute difference of the
+    AUCs was at least as large as the observed one.
+
+    `source` is a 2D array containing the terms of the AUCs of the datasets
+    (see `ROCCurve.auc_terms_from_pos_ranks()`), one row for each dataset,
+    or a `SharedArrays` instance containing this array with the key
+    ``terms``. `chunks` is a list of ``(size, seed)`` pairs; each chunk of
+    `size` repetitions draws its flips from a random number generator
+    seeded with `seed`."""
+    if isinstance(source, SharedArrays):
+        try:
+            terms1 = numpy.array(source["terms"][index1])
+            terms2 = numpy.array(source["terms"][index2])
+        finally:
+            source.close()
+    else:
+        terms1, terms2 = source[index1], source[index2]
+
+    # Flipping a pair changes the difference of the sums of the terms
+    # by twice the difference of the terms of the pair
+    deltas = terms1 - terms2
+    total_delta = deltas.sum()
+    tolerance = 1e-12 * (numpy.abs(terms1).sum() + numpy.abs(terms2).sum())
+    threshold = abs(total_delta) - tolerance
+
+    # Table of the sums of the deltas in each group of eight pairs for
+    # every possible byte of flips; bit k of a byte flips the k-th pair.
+    # The table is built once and shared by all the chunks.
+    table = _get_byte_tables(deltas[None, :])[:, :, 0]
+    num_rows = len(table)
+
+    result = 0
+    for size, seed in chunks:
+        # The random bits are drawn for a block of byte rows (eight pairs
+        # for all the repetitions in the chunk) at a time, and looked up
+        # from the rows of the table with a flat index
+        rng = numpy.random.default_rng(seed)
+        flipped = numpy.zeros(size)
+        step = max(1, LOOKUP_BLOCK // max(size, 1))
+        offsets = 256 * numpy.arange(min(step, num_rows))[:, None]
+        for start in xrange(0, num_rows, step):
+            rows = table[start:start+step]
+            flips = rng.integers(0, 256, size=(len(rows), size),
+                                 dtype=numpy.uint8)
+            flipped += rows.take(offsets[:len(rows)] + flips).sum(axis=0)
+        diffs = numpy.abs(total_delta - 2 * flipped)
+        result += int(numpy.count_nonzero(diffs >= threshold))
+    return result
+
+
+def _exact_p_value(terms1, terms2, max_states, max_values):
+    """Returns the exact p-value of the paired permutation test for two
+    datasets with the given terms of the AUCs, or ``None`` if the terms are
+    not multiples of one half or the dynamic programming would need more
+    than `max_states` states or arrays longer than `max_values`."""
+    # With twice the absolute differences of the terms as integer steps,
+    # the statistic of a flip configuration is 2*G - total, where G is the
+    # sum of the steps of the pairs that are not flipped
+    diffs = 2 * (terms1 - terms2)
+    steps = numpy.abs(numpy.round(diffs))
+    if numpy.any(numpy.abs(numpy.abs(diffs) - steps) >
+                 1e-9 * numpy.maximum(steps, 1.)):
+        return None
+    steps = numpy.sort(steps[steps > 0]).astype(numpy.int64)
+    ends = numpy.cumsum(steps)
+    total = int(ends[-1]) if len(ends) else 0
+    if total + 1 > max_values or int((ends + 1).sum()) > max_states:
+        return None
+
+    # Distribution of G, adding the steps in ascending order so that the
+    # range of the possible values grows as slowly as possible
+    probs = numpy.zeros(total + 1)
+    probs[0] = 1.
+    for step, end in zip(steps.tolist(), ends.tolist()):
+        probs[step:end+1] = probs[step:end+1] + probs[:end+1-step]
+        probs[:end+1] *= 0.5
+
+    observed = abs(round(float(diffs.sum())))
+    statistic = numpy.abs(2 * numpy.arange(total + 1) - total)
+    return min(1., float(probs[statistic >= observed].sum()))
+
+
+def _run_all_pairs_chunks(source, chunks):
+    """Runs chunks of repetitions of the batched engine of
+    `PairedPermutationTest.test_all_pairs()`, and returns a matrix that
+    contains the number of repetitions where the absolute difference of the
+    AUCs was at least as large as the observed one for each pair of
+    datasets. See `_run_batched_chunks()` for the arguments."""
+    if isinstance(source, SharedArrays):
+        try:
+            terms = numpy.array(source["terms"])
+        finally:
+            source.close()
+    else:
+        terms = source
+
+    # Flipping a pair of positive ranks in datasets i and j changes the
+    # difference of the sums of their terms by twice the difference of the
+    # terms of the pair, so it is enough to sum the flipped terms of each
+    # dataset. The tables are built for a block of byte rows at a time to
+    # keep their size proportional to the number of datasets only, and
+    # each block is used by all the chunks.
+    num_datasets, num_terms = terms.shape
+    rngs = [numpy.random.default_rng(seed) for _, seed in chunks]
+    flipped = [numpy.zeros((size, num_datasets)) for size, _ in chunks]
+    step = TABLE_ROWS * 8
+    for start in xrange(0, num_terms, step):
+        tables = _get_byte_tables(terms[:, start:start+step])
+        tables = tables.reshape(-1, num_datasets)
+        num_rows = len(tables) // 256
+        for rng, part in zip(rngs, flipped):
+            size = len(part)
+            block = max(1, LOOKUP_BLOCK // max(size * num_datasets, 1))
+            offsets = 256 * numpy.arange(min(block, num_rows))[:, None]
+            for row in xrange(0, num_rows, block):
+                flips = rng.integers(0, 256,
+                                     size=(min(block, num_rows - row), size),
+                                     dtype=numpy.uint8)
+                lookups = tables.take((256 * row + offsets[:len(flips)] +
+                                       flips).ravel(), axis=0)
+                part += lookups.reshape(len(flips), size,
+                                        num_datasets).sum(axis=0)
+    flipped = numpy.concatenate(flipped) if flipped else \
+              numpy.zeros((0, num_datasets))
+    size = len(flipped)
+
+    sums = terms.sum(axis=1)
+    abs_sums = numpy.abs(terms).sum(axis=1)
+    total_deltas = sums[:, None] - sums[None, :]
+    tolerances = 1e-12 * (abs_sums[:, None] + abs_sums[None, :])
+    thresholds = numpy.abs(total_deltas) - tolerances
+
+    # The repetitions are compared in slices to limit the size of the
+    # temporary arrays with one matrix per repetition
+    counts = numpy.zeros((num_datasets, num_datasets), dtype=numpy.int64)
+    step = max(1, 2 ** 22 // num_datasets ** 2)
+    for start in xrange(0, size, step):
+        part = flipped[start:start+step]
+        diffs = numpy.abs(total_deltas - 2 * (part[:, :, None] -
+                                              part[:, None, :]))
+        counts += numpy.count_nonzero(diffs >= thresholds, axis=0)
+    return counts
+
+
+def _get_byte_tables(values):
+    """Given a 2D array with one row for each dataset, returns a 3D array
+    whose element ``[r, b, i]`` is the sum of the elements of row ``i`` in
+    the ``r``-th group of eight columns that are selected by the bits of
+    byte ``b``; bit k of a byte selects the k-th column of the group. The
+    rows are padded with zeros to a multiple of eight columns."""
+    num_rows, num_cols = values.shape
+    num_bytes = (num_cols + 7) // 8
+    padded = numpy.zeros((num_rows, num_bytes * 8))
+    padded[:, :num_cols] = values
+    bits = numpy.unpackbits(numpy.arange(256, dtype=numpy.uint8)[:, None],
+                            axis=1, bitorder="little")
+    tables = numpy.dot(padded.reshape(num_rows, num_bytes, 8),
+                       bits.T.astype(numpy.float64))
+    return numpy.ascontiguousarray(tables.transpose(1, 2, 0))
+
+
+def _midranks(values):
+    """Returns the ranks of the elements of the given 1D array as a NumPy
+    array, using the average rank for tied elements."""
+    values = numpy.asarray(values, dtype=numpy.float64)
+    order = numpy.argsort(values, kind="mergesort")
+    bounds = numpy.flatnonzero(numpy.diff(values[order])) + 1
+    starts = numpy.concatenate([[0], bounds])
+    ends = numpy.concatenate([bounds, [len(values)]])
+    result = numpy.empty(len(values))
+    result[order] = numpy.repeat((starts + ends + 1) / 2., ends - starts)
+    return result
+
+
+def _normal_p_value(diff, variance):
+    """Returns the two-sided p-value of the given difference of AUCs with
+    the given variance, assuming that the difference is normally
+    distributed."""
+    if variance <= 0:
+        return 1. if diff == 0 else 0.
+    return erfc(abs(diff) / sqrt(2 * variance))
 
-        return observed_diff, num_success / float(self.num_repetitions)
 
+def _placements(pos_ranks, neg_ranks):
+    """Returns the placement values of the positive and the negative
+    examples, given the ranks of the positive and the negative examples as
+    NumPy arrays. See `DeLongTest` for the definition of the placement
+    values."""
+    num_pos, num_neg = len(pos_ranks), len(neg_ranks)
+    if num_pos < 2 or num_neg < 2:
+        raise ValueError("the DeLong test requires at least two positive "
+                         "and two negative examples")
+    # The rank of an example among the examples of its own class tells how
+    # many of the examples ranked below it (or tied with it) are of the
+    # same class
+    pos_placements = (pos_ranks - _midranks(pos_ranks)) / num_neg
+    neg_placements = 1. - (neg_ranks - _midranks(neg_ranks)) / num_pos
+    return pos_placements, neg_placements
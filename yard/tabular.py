@@ -0,0 +1,430 @@
+"""
+Fast reader for the tabular text files processed by the command line
+scripts of ``yard``.
+
+The input files contain one example per line and one column per classifier
+(plus a column for the expected class), separated by whitespace or a given
+separator character. The first non-empty line may be a header row; this is
+detected by looking at the class column, which must contain a number in
+every data row.
+
+`TabularReader` reads the input in large blocks of complete lines and
+converts each block to columns at once with ``numpy.loadtxt``, falling back
+to a line-by-line parser for blocks that ``numpy.loadtxt`` cannot handle
+(and for all blocks if NumPy is not installed).
+
+Only the columns that are needed are converted to numbers. When the
+selected columns are at the beginning of a much wider file, the lines are
+also cut after the last selected column before they are parsed, so the
+cost of reading a file depends on the selected columns and not on the
+width of the file.
+
+Large files can also be split into byte ranges of complete lines with
+`split_file()`; the ranges can then be parsed independently with
+`read_range()`, e.g., in the worker processes of a process pool.
+
+Input files compressed with gzip, bzip2 or xz are recognized by their
+first few bytes and decompressed on the fly by `open_input()` and
+`decompress_stream()`; the decompression runs in a background thread, so
+it overlaps with the parsing.
+"""
+
+import threading
+
+from io import BytesIO
+
+from yard.mathematics import numpy
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+try:
+    xrange
+except NameError:
+    xrange = range
+
+__author__  = "Tamas Nepusz"
+__email__   = "tamas@cs.rhul.ac.uk"
+__copyright__ = "Copyright (c) 2010, Tamas Nepusz"
+__license__ = "MIT"
+
+__all__ = ["BackgroundReader", "TabularReader", "decompress_stream",
+           "detect_compression", "iter_blocks", "open_input", "read_range",
+           "split_file"]
+
+#: Magic bytes of the supported compression formats
+COMPRESSION_MAGIC = [
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "xz")
+]
+
+
+def detect_compression(head):
+    """Returns the name of the compression format of a file starting with
+    the given bytes (``"gzip"``, ``"bz2"`` or ``"xz"``), or ``None`` if the
+    file is not compressed."""
+    for magic, name in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def decompress_stream(handle, block_size=16777216):
+    """Checks whether the given binary stream is compressed and returns a
+    `BackgroundReader` that decompresses it if so. Uncompressed streams
+    (and streams whose first bytes cannot be inspected without consuming
+    them) are returned intact."""
+    if hasattr(handle, "peek"):
+        head = handle.peek(6)[:6]
+    elif hasattr(handle, "seekable") and handle.seekable():
+        position = handle.tell()
+        head = handle.read(6)
+        handle.seek(position)
+    else:
+        return handle
+
+    compression = detect_compression(head)
+    if compression is None:
+        return handle
+
+    if compression == "gzip":
+        import gzip
+        stream = gzip.GzipFile(fileobj=handle, mode="rb")
+    elif compression == "bz2":
+        import bz2
+        stream = bz2.BZ2File(handle, "rb")
+    else:
+        try:
+            import lzma
+        except ImportError:
+            raise IOError("reading xz-compressed input requires the lzma "
+                          "module")
+        stream = lzma.LZMAFile(handle, "rb")
+    return BackgroundReader(stream, block_size, owned=[handle])
+
+
+def open_input(path, block_size=16777216):
+    """Opens the input file at the given path for reading in binary mode,
+    decompressing it on the fly if needed (see `decompress_stream()`)."""
+    return decompress_stream(open(path, "rb"), block_size)
+
+
+class BackgroundReader(object):
+    """Read-only binary stream that reads another stream in a background
+    thread, in chunks of `chunk_size` bytes, keeping at most `max_chunks`
+    chunks ahead of the consumer. This is used to decompress input files
+    while the previous chunks are being parsed. The streams in `owned` are
+    closed along with the wrapped stream."""
+
+    def __init__(self, stream, chunk_size=16777216, max_chunks=2, owned=()):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self._owned = list(owned)
+        self._queue = Queue(max_chunks)
+        self._buffer, self._eof, self._closed = b"", False, False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _run(self):
+        """Body of the background thread."""
+        try:
+            while not self._closed:
+                chunk = self.stream.read(self.chunk_size)
+                self._queue.put(chunk)
+                if not chunk:
+                    break
+        except Exception as ex:
+            self._queue.put(ex)
+
+    def read(self, size=-1):
+        """Reads at most `size` bytes from the stream, or everything until
+        the end of the stream if `size` is negative."""
+        parts, remaining = [], size
+        while remaining != 0 and not self._eof:
+            if not self._buffer:
+                chunk = self._queue.get()
+                if isinstance(chunk, Exception):
+                    self._eof = True
+                    raise chunk
+                if not chunk:
+                    self._eof = True
+                    break
+                self._buffer = chunk
+            if remaining < 0 or remaining >= len(self._buffer):
+                part, self._buffer = self._buffer, b""
+            else:
+                part = self._buffer[:remaining]
+                self._buffer = self._buffer[remaining:]
+            parts.append(part)
+            if remaining > 0:
+                remaining -= len(part)
+        return b"".join(parts)
+
+    def close(self):
+        """Stops the background thread and closes the wrapped stream."""
+        if self._closed:
+            return
+        self._closed = True
+        while self._thread.is_alive():
+            # Unblock the thread if it is waiting for free space
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._thread.join(0.01)
+        self.stream.close()
+        for stream in self._owned:
+            stream.close()
+
+
+def iter_blocks(stream, block_size, limit=None):
+    """Reads the given stream in chunks of roughly `block_size` bytes and
+    yields blocks consisting of complete lines, as byte strings. The last
+    block may lack the trailing newline. Text streams are encoded to
+    UTF-8. If `limit` is given, at most `limit` bytes (or characters) are
+    read from the stream."""
+    rest = b""
+    while True:
+        if limit is not None:
+            if limit <= 0:
+                break
+            chunk = stream.read(min(block_size, limit))
+            limit -= len(chunk)
+        else:
+            chunk = stream.read(block_size)
+        if not chunk:
+            break
+        if not isinstance(chunk, bytes):
+            chunk = chunk.encode("utf-8")
+        chunk = rest + chunk
+        cut = chunk.rfind(b"\n") + 1
+        if cut:
+            yield chunk[:cut]
+        rest = chunk[cut:]
+    if rest:
+        yield rest
+
+
+class TabularReader(object):
+    """Reader for tabular classifier output files.
+
+    `sep` is the column separator character (``None`` means any whitespace)
+    and `cols` is the list of zero-based column indices to read; the first
+    index refers to the column containing the expected classes. If `cols`
+    is ``None``, all the columns are read, and the number of columns is
+    determined from the first line. Lines are cut after the last selected
+    column before parsing if the first line has more than `PROJECTION_RATIO`
+    times as many fields as needed.
+
+    After the first block has been read, `headers` contains the names of
+    the columns: the first one is always ``__class__``, and the remaining
+    ones come from the header row. Names missing from the header row are
+    empty strings. If there is no header row, the columns are named
+    ``Dataset 1``, ``Dataset 2`` and so on, in the order they were given in
+    `cols`.
+    """
+
+    #: Lines are cut after the last selected column if they have more than
+    #: this many times as many fields as needed
+    PROJECTION_RATIO = 4
+
+    def __init__(self, sep=None, cols=None, block_size=16777216):
+        self.sep = sep
+        self.cols = list(cols) if cols is not None else None
+        self.block_size = block_size
+        self.headers = None
+        self.has_header = False
+        self.project = False
+
+        if sep is not None and not isinstance(sep, bytes):
+            sep = sep.encode("utf-8")
+        self._sep = sep
+
+    def read(self, stream):
+        """Reads the given stream and yields the selected columns in
+        blocks. Each block is a list containing one NumPy array (or one
+        list, if NumPy is not installed) per selected column."""
+        for block in iter_blocks(stream, self.block_size):
+            if self.headers is None:
+                block = self.read_header(block)
+            columns = self.parse_block(block)
+            if columns is not None:
+                yield columns
+
+    @property
+    def width(self):
+        """The number of leading fields of a line that contain all the
+        selected columns."""
+        return max(self.cols) + 1
+
+    def _split(self, line, maxsplit=-1):
+        """Splits a line of the input file (as a byte string) into parts,
+        splitting at most `maxsplit` times. Returns ``None`` for blank
+        lines."""
+        line = line.strip()
+        if not line:
+            return None
+        return line.split(self._sep, maxsplit)
+
+    def _cut_lines(self, block):
+        """Cuts the lines in the given block after the last selected column
+        and returns them as a list."""
+        sep, width = self._sep, self.width
+        if sep is None:
+            return [b" ".join(line.split(None, width)[:width])
+                    for line in block.splitlines()]
+        return [sep.join(line.strip().split(sep, width)[:width])
+                for line in block.splitlines()]
+
+    def read_header(self, block):
+        """Processes the first non-empty line in the given block, sets up
+        `headers` and `cols` and returns the part of the block that contains
+        data rows. `headers` remains ``None`` if the block has no non-empty
+        lines."""
+        start = 0
+        while start < len(block):
+            end = block.find(b"\n", start) + 1 or len(block)
+            parts = self._split(block[start:end])
+            if parts:
+                break
+            start = end
+        else:
+            return b""
+
+        if self.cols is not None:
+            self.project = len(parts) > self.PROJECTION_RATIO * self.width
+        colidx = self.cols[0] if self.cols is not None else 0
+        try:
+            int(float(parts[colidx]))
+        except (IndexError, ValueError):
+            # This is a header row
+            parts = [part.decode("utf-8") for part in parts]
+            if self.cols is None:
+                self.cols = list(xrange(len(parts)))
+                self.headers = list(parts)
+            else:
+                self.headers = [None] + [parts[idx] for idx in self.cols[1:]]
+            self.headers[0] = "__class__"
+            self.has_header = True
+            return block[end:]
+
+        # This is a data row; there is no header row
+        if self.cols is None:
+            self.cols = list(xrange(len(parts)))
+        self.headers = ["Dataset %d" % idx for idx in xrange(len(self.cols))]
+        self.headers[0] = "__class__"
+        return block[start:]
+
+    def parse_block(self, block):
+        """Parses a block of data rows (as a byte string) and returns the
+        selected columns, or ``None`` if the block contains no data."""
+        if not block.strip():
+            return None
+
+        if numpy is not None:
+            try:
+                lines = self._cut_lines(block) if self.project \
+                        else BytesIO(block)
+                table = numpy.loadtxt(lines, delimiter=self.sep,
+                                      usecols=self.cols, ndmin=2,
+                                      comments=None)
+                return [table[:, idx] for idx in xrange(len(self.cols))]
+            except (IndexError, ValueError):
+                # Let the line parser deal with it (or raise the error)
+                pass
+
+        columns, width = [[] for _ in self.cols], self.width
+        for line in block.splitlines():
+            parts = self._split(line, width)
+            if not parts:
+                continue
+            for column, idx in zip(columns, self.cols):
+                column.append(float(parts[idx]))
+
+        if numpy is not None:
+            columns = [numpy.array(column, dtype=numpy.float64)
+                       for column in columns]
+        return columns
+
+
+def split_file(path, reader, num_parts, min_size=16777216):
+    """Reads the header of the file at the given path with the given
+    `TabularReader` and splits the rest of the file into at most
+    `num_parts` byte ranges of complete lines, each of them at least
+    `min_size` bytes long (except when the file is smaller than that).
+    Compressed files cannot be split; the data rows of a compressed file
+    are returned as a single range whose offsets refer to the decompressed
+    stream and whose end is ``None``.
+
+    Returns a list of ``(start, end)`` tuples. The list is empty if the file
+    contains no data rows; `reader.headers` is ``None`` in this case.
+    """
+    with open_input(path) as handle:
+        offset = 0
+        for block in iter_blocks(handle, 65536):
+            rest = reader.read_header(block)
+            if reader.headers is not None:
+                start = offset + len(block) - len(rest)
+                break
+            offset += len(block)
+        else:
+            return []
+
+        if isinstance(handle, BackgroundReader):
+            return [(start, None)]
+
+        handle.seek(0, 2)
+        size = handle.tell()
+        num_parts = max(1, min(num_parts, (size - start) // max(min_size, 1)))
+
+        boundaries = [start]
+        for idx in range(1, num_parts):
+            # Move each split point to the beginning of the next line
+            handle.seek(start + idx * (size - start) // num_parts - 1)
+            handle.readline()
+            if handle.tell() > boundaries[-1]:
+                boundaries.append(handle.tell())
+        if size > boundaries[-1]:
+            boundaries.append(size)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def read_range(path, start, end, sep, cols, headers, project=False):
+    """Parses the data rows between the given byte offsets of a file. `start`
+    and `end` must be the boundaries of complete lines (see `split_file()`);
+    `end` may be ``None`` to read until the end of the file.
+    `sep`, `cols`, `headers` and `project` are the attributes of the
+    `TabularReader` that read the header of the file.
+
+    Returns the selected columns as a list of NumPy arrays (or lists, if
+    NumPy is not installed), or ``None`` if the range contains no data."""
+    reader = TabularReader(sep=sep, cols=cols)
+    reader.headers, reader.project = headers, project
+
+    with open_input(path) as handle:
+        if isinstance(handle, BackgroundReader):
+            handle.read(start)
+        else:
+            handle.seek(start)
+        limit = end - start if end is not None else None
+        blocks = [columns for columns in
+                  (reader.parse_block(block) for block in
+                   iter_blocks(handle, reader.block_size, limit))
+                  if columns is not None]
+
+    if not blocks:
+        return None
+    if numpy is not None:
+        return [numpy.concatenate([block[idx] for block in blocks])
+                for idx in xrange(len(cols))]
+    return [[value for block in blocks for value in block[idx]]
+            for idx in xrange(len(cols))]
@@ -43,6 +43,8 @@ class ExponentialTransformation(object):
         """Transforms the given number `x` and returns
         `(1-exp(-alpha*x)) / (1-exp(-alpha))`."""
         den = 1-self.exp_minus_alpha
+        if hasattr(x, "dtype"):
+            return (1-power(self.exp_minus_alpha, x)) / den
         if hasattr(x, "__iter__"):
             x = power(self.exp_minus_alpha, x)
             return [(1-value)/den for value in x]
@@ -18,6 +18,34 @@ except ImportError:
 import re
 
 
+def array_metric(func):
+    """Decorator that marks a classifier performance metric as being able
+    to evaluate a whole `yard.data.BinaryConfusionMatrixArray` at once.
+
+    Curves call such functions once with all the confusion matrices
+    instead of once per threshold. The decorated function must still
+    accept a single `yard.data.BinaryConfusionMatrix` as well.
+
+    Usage::
+
+        @array_metric
+        def youden_index(matrix):
+            return matrix.tpr() + matrix.tnr() - 1
+    """
+    func.__array_metric__ = True
+    return func
+
+
+def as_list(seq):
+    """Converts a NumPy array to a list of Python numbers and returns any
+    other sequence intact.
+
+    >>> as_list([1, 2, 3])
+    [1, 2, 3]
+    """
+    return seq.tolist() if hasattr(seq, "tolist") else seq
+
+
 def axis_label(label):
     """Creates a decorator that attaches an attribute named ``__axis_label__``
     to a function. This is used later in the plotting functions to derive an